@@ -0,0 +1,84 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import os
+import sys
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from doggiechef import db, logs, metrics
+from doggiechef.recipes import EXPORT_FORMATS, RecipeRepository
+
+db.configure('/tmp/recipes.db')
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        timer = metrics.request('GET /api/recipes/export')
+        chunks = None
+        try:
+            query_params = parse_qs(urlparse(self.path).query)
+            fmt = query_params.get('format', ['ndjson'])[0]
+            
+            try:
+                chunks = RecipeRepository(db.get_read_connection()).export(
+                    fmt,
+                    country=query_params.get('country', [None])[0],
+                    protein_type=query_params.get('protein_type', [None])[0]
+                )
+            except ValueError as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            
+            # HTTP/1.1 clients get chunked transfer encoding; HTTP/1.0 ones read until the connection closes
+            chunked = self.request_version == 'HTTP/1.1'
+            if chunked:
+                self.protocol_version = 'HTTP/1.1'
+            self.send_response(200)
+            self.send_header('Content-Type', EXPORT_FORMATS[fmt])
+            self.send_header('Content-Disposition', f'attachment; filename="recipes.{fmt}"')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.streaming = True
+            
+            sent = 0
+            for chunk in chunks:
+                if chunked:
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                else:
+                    self.wfile.write(chunk)
+                self.wfile.flush()
+                sent += len(chunk)
+            if chunked:
+                self.wfile.write(b'0\r\n\r\n')
+            timer.finish(200, 0, sent)
+        
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client went away mid-export
+        except Exception as e:
+            logs.error("GET /api/export failed", e, {"path": self.path, "error_type": type(e).__name__})
+            # Once the body has started the only way to signal failure is to cut it short
+            if not getattr(self, 'streaming', False):
+                self.send_error(500)
+        finally:
+            if chunks is not None:
+                chunks.close()  # Releases the cursor even if the export stopped early
+            self.close_connection = True
+            db.release()
+    
+    def send_json(self, status, data):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        self.end_headers()
@@ -0,0 +1,37 @@
+import os
+import sys
+from urllib.parse import urlparse, parse_qsl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from doggiechef import db, ingredients, logs, metrics
+from doggiechef.handlers import JSONHandler
+from doggiechef.recipes import int_param
+
+db.configure('/tmp/recipes.db')
+
+class handler(JSONHandler):
+    def do_GET(self):
+        self.timer = metrics.request('GET /api/pantry')
+        try:
+            query_params = dict(parse_qsl(urlparse(self.path).query))
+            
+            try:
+                results = ingredients.pantry_matches(
+                    db.get_read_connection(),
+                    ingredients.parse_pantry(query_params.get('ingredients', '')),
+                    limit=int_param(query_params, 'limit', 20),
+                    min_matches=int_param(query_params, 'min_matches', 1),
+                    country=query_params.get('country'),
+                    protein_type=query_params.get('protein_type')
+                )
+            except ValueError as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            
+            self.send_json(200, {'results': results})
+            
+        except Exception as e:
+            logs.error("GET /api/pantry failed", e, {"path": self.path, "error_type": type(e).__name__})
+            self.send_json(500, {'error': 'Internal server error'})
+        finally:
+            db.release()
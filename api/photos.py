@@ -0,0 +1,52 @@
+from http.server import BaseHTTPRequestHandler
+import os
+import re
+import sys
+from urllib.parse import urlparse, parse_qs, unquote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from doggiechef import files, logs, metrics
+
+# Where api/recipes.py keeps photos when DOGGIECHEF_STORAGE=local; Cloudinary serves its own
+PHOTO_FOLDER = '/tmp/photos'
+
+# /api/photos/<filename>; vercel.json also rewrites it to /api/photos?filename=<filename>
+PHOTO_PATH_RE = re.compile(r'/api/photos/([^/]+)$')
+
+photo_files = files.FileIndex(PHOTO_FOLDER)
+
+class handler(BaseHTTPRequestHandler):
+    def filename(self):
+        parsed_url = urlparse(self.path)
+        match = PHOTO_PATH_RE.search(parsed_url.path)
+        if match:
+            return unquote(match.group(1))
+        return parse_qs(parsed_url.query).get('filename', [None])[0]
+    
+    def do_GET(self):
+        timer = metrics.request('GET /api/photos')
+        try:
+            info = photo_files.lookup(self.filename())
+            if info is None:
+                self.send_error(404)
+                timer.finish(404)
+                return
+            
+            reply = files.prepare(photo_files, info, self.headers)
+            status, sent = files.send_reply(self, photo_files, info, reply,
+                                            {'Server-Timing': timer.server_timing()})
+            timer.finish(status, 0, sent)
+        
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client went away mid-photo
+        except Exception as e:
+            logs.error("GET /api/photos failed", e, {"path": self.path, "error_type": type(e).__name__})
+            self.send_error(500)
+    
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, Range, If-None-Match')
+        self.end_headers()
+
@@ -1,344 +1,348 @@
 from http.server import BaseHTTPRequestHandler
+import http.client
 import json
-import sqlite3
 import os
-import uuid
-from urllib.parse import urlparse, parse_qs
-import cloudinary
-import cloudinary.uploader
-import cgi
-import io
+import re
+from urllib.parse import urlparse, parse_qs, parse_qsl
 import sys
-from datetime import datetime
 
-# Vercel-friendly logging utility
-def log_info(message, data=None):
-    log_entry = {
-        "timestamp": datetime.utcnow().isoformat() + "Z",
-        "level": "INFO",
-        "message": message,
-        "data": data or {}
-    }
-    print(f"[DoggieChef API] {json.dumps(log_entry)}", flush=True)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from doggiechef import cache, db, encoding, jobs, logs, metrics
+from doggiechef.multipart import MultipartError, RequestTooLarge, parse_multipart
+from doggiechef.recipes import RecipeRepository, discard_spooled, parse_list_params, spool_photos
+from doggiechef.storage import create_storage
 
-def log_error(message, error=None, data=None):
-    log_entry = {
-        "timestamp": datetime.utcnow().isoformat() + "Z",
-        "level": "ERROR",
-        "message": message,
-        "error": str(error) if error else None,
-        "data": data or {}
-    }
-    print(f"[DoggieChef API ERROR] {json.dumps(log_entry)}", file=sys.stderr, flush=True)
+db.configure('/tmp/recipes.db')
 
-# Configure Cloudinary
-cloudinary.config(
-    cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME', 'demo'),
-    api_key=os.environ.get('CLOUDINARY_API_KEY', ''),
-    api_secret=os.environ.get('CLOUDINARY_API_SECRET', '')
-)
+SPOOL_FOLDER = '/tmp/incoming'
+UPLOAD_WAIT_TIMEOUT = 20  # seconds a write waits for its uploads before answering 202
+UPLOAD_DRAIN_TIMEOUT = 25  # seconds spent finishing leftovers after the response
+UPLOAD_TIMEOUT = 15  # seconds per Cloudinary request
+
+# With read snapshots (DOGGIECHEF_SNAPSHOT_URL), writes are forwarded to the backend that owns the
+# primary database and publishes them; without it they go to this function's own database
+PRIMARY_URL = os.environ.get('DOGGIECHEF_PRIMARY_URL')
+PRIMARY_TIMEOUT = 50  # seconds, within Vercel's function limit
+# Request headers the primary needs to handle a forwarded write
+FORWARDED_HEADERS = ('Content-Type', 'Content-Length', 'Authorization', 'User-Agent')
+
+# /api/recipes/<id>; vercel.json also rewrites it to /api/recipes?id=<id>
+RECIPE_PATH_RE = re.compile(r'/api/recipes/(\d+)/?$')
+
+# Vercel-friendly JSON log lines; reads are sampled, writes and errors are always logged.
+# DOGGIECHEF_LOG_LEVEL and DOGGIECHEF_LOG_SAMPLING override these defaults.
+logs.configure(sampling={'GET /api/recipes': 0.1})
+
+# The only request headers worth logging; the rest are noise on every line
+LOGGED_HEADERS = ('User-Agent', 'Content-Type', 'Content-Length', 'If-None-Match')
+
+response_cache = cache.ResponseCache()
+
+# Cloudinary is imported and configured on the first upload, keeping it out of GET cold starts;
+# DOGGIECHEF_STORAGE=memory keeps uploads offline, e.g. for tests
+photo_storage = create_storage('cloudinary', cloudinary={'folder': 'recipes'}, local={'folder': '/tmp/photos'})
+# Uploads photos to Cloudinary concurrently, at most four at a time
+photo_worker = jobs.PhotoWorker(photo_storage, max_workers=4, poll_interval=0.2,
+                                upload_timeout=UPLOAD_TIMEOUT, retries=2)
+
+def get_repository():
+    return RecipeRepository(db.get_connection(), storage=photo_storage)
 
 class handler(BaseHTTPRequestHandler):
+    def recipe_id(self):
+        """The id addressed by /api/recipes/<id> or ?id=<id>, or None for the collection"""
+        parsed_url = urlparse(self.path)
+        match = RECIPE_PATH_RE.search(parsed_url.path)
+        if match:
+            return int(match.group(1))
+        recipe_id = parse_qs(parsed_url.query).get('id', [None])[0]
+        return int(recipe_id) if recipe_id and recipe_id.isdigit() else None
+    
+    def start_request(self):
+        """Open this request's log and timer; log details are only formatted if the request is sampled"""
+        route = f"{self.command} /api/recipes"
+        self.timer = metrics.request(route)
+        self.log = logs.request(route)
+        self.log.debug(f"{self.command} request received", lambda: {
+            "path": self.path,
+            "headers": {name: self.headers[name] for name in LOGGED_HEADERS if name in self.headers},
+            "client_address": self.client_address[0] if self.client_address else None
+        })
+    
+    def send_json(self, status, data):
+        with self.timer.phase('encode'):
+            payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        # Lets the client finish reading before finish() drains leftover uploads
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_server_timing()
+        self.end_headers()
+        self.wfile.write(payload)
+        self.response_sent(status, payload)
+    
+    def send_server_timing(self):
+        server_timing = self.timer.server_timing()
+        if server_timing:
+            self.send_header('Server-Timing', server_timing)
+    
+    def response_sent(self, status, body):
+        self.timer.finish(status, int(self.headers.get('Content-Length') or 0), len(body) if body else 0)
+        self.log.response(status, body)
+    
     def do_GET(self):
+        self.start_request()
         try:
-            log_info("GET request received", {
-                "path": self.path,
-                "headers": dict(self.headers),
-                "client_address": self.client_address[0] if self.client_address else None
-            })
-            
-            # Initialize database
-            self.init_db()
-            
             # Parse query parameters
             parsed_url = urlparse(self.path)
-            query_params = parse_qs(parsed_url.query)
+            query_params = dict(parse_qsl(parsed_url.query))
+            recipe_id = self.recipe_id()
             
-            log_info("Query parameters parsed", {
-                "parsed_url": parsed_url.path,
-                "query_params": query_params
+            self.log.debug("Query parameters parsed", lambda: {
+                "query_params": query_params,
+                "recipe_id": recipe_id
             })
             
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # Get filter parameters
-            country = query_params.get('country', [None])[0]
-            protein_type = query_params.get('protein_type', [None])[0]
-            
-            query = "SELECT * FROM recipes"
-            params = []
-            
-            if country or protein_type:
-                query += " WHERE"
-                if country:
-                    query += " country = ?"
-                    params.append(country)
-                if protein_type:
-                    if country:
-                        query += " AND"
-                    query += " protein_type = ?"
-                    params.append(protein_type)
-            
-            query += " ORDER BY created_at DESC"
-            
-            log_info("Database query prepared", {
-                "query": query,
-                "params": params,
-                "filters": {
-                    "country": country,
-                    "protein_type": protein_type
-                }
-            })
-            
-            cursor.execute(query, params)
-            recipes = cursor.fetchall()
-            
-            result = []
-            for recipe in recipes:
-                recipe_dict = dict(recipe)
-                recipe_dict['photos'] = recipe_dict['photos'].split(',') if recipe_dict['photos'] else []
-                result.append(recipe_dict)
-            
-            conn.close()
-            
-            log_info("GET request successful", {
-                "recipe_count": len(result),
-                "filters_applied": {
-                    "country": country,
-                    "protein_type": protein_type
-                },
-                "response_size": len(json.dumps(result))
-            })
+            # Filter, pagination and projection parameters
+            if recipe_id is None:
+                try:
+                    params = parse_list_params(query_params)
+                except ValueError as e:
+                    self.log.warning("Invalid pagination parameters", {"error": str(e)})
+                    self.send_json(400, {"error": str(e)})
+                    return
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            # The published read-only snapshot when one is configured
+            conn = db.get_read_connection()
+            version = cache.data_version(conn)
+            cache_key = (recipe_id, tuple(sorted(query_params.items())))
+            entry = response_cache.get(cache_key, version)
+            cached = entry is not None
+            if entry is None and recipe_id is not None:
+                recipe = RecipeRepository(conn, storage=photo_storage).get(recipe_id)
+                if recipe is None:
+                    self.send_json(404, {"error": "Recipe not found"})
+                    return
+                with self.timer.phase('encode'):
+                    body = encoding.dumps(recipe)
+                entry = response_cache.put(cache_key, version, body)
+            elif entry is None:
+                # Encoded straight from the rows, reusing the fragments of unchanged recipes
+                body, next_cursor = RecipeRepository(conn, storage=photo_storage).list_json(**params)
+                headers = {}
+                if next_cursor:
+                    headers = {'X-Next-Cursor': next_cursor, 'Access-Control-Expose-Headers': 'X-Next-Cursor'}
+                entry = response_cache.put(cache_key, version, body, headers)
+                self.log.debug("Recipes listed", lambda: {
+                    "filters_applied": {
+                        "country": params['country'],
+                        "protein_type": params['protein_type']
+                    }
+                })
             
+            status, body = cache.send_entry(self, entry, {'Server-Timing': self.timer.server_timing()})
+            # Size comes from the encoded bytes that were just written
+            self.timer.finish(status, 0, len(body) if body else 0)
+            self.log.response(status, body, lambda: {"cached": cached, "data_version": version})
+        
         except Exception as e:
-            log_error("GET request failed", e, {
+            self.log.error("GET request failed", e, {
                 "path": self.path,
                 "error_type": type(e).__name__
             })
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Internal server error"}).encode())
+            self.send_json(500, {"error": "Internal server error"})
     
-    def do_POST(self):
+    def read_recipe_body(self):
+        """Parse a multipart or JSON body into (data, photo uploads); raises ValueError if malformed"""
+        content_type = self.headers.get('Content-Type', '')
+        content_length = int(self.headers.get('Content-Length', 0))
+        
+        if content_length == 0:
+            raise ValueError("No content received")
+        
+        # Handle different content types
+        if 'multipart/form-data' in content_type:
+            # Stream the body; photo parts go straight to spool files on disk
+            data, uploads = parse_multipart(self.rfile, content_type, content_length, SPOOL_FOLDER)
+            photos = []
+            for upload in uploads:
+                if upload.name == 'photos':
+                    photos.append(upload)
+                else:
+                    upload.discard()
+        else:
+            try:
+                data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON: {str(e)}")
+            photos = []
+        
+        # Field names and photo sizes only; submitted values never reach the logs
+        self.log.debug("Data parsing completed", lambda: {
+            "fields": sorted(data),
+            "photos": [{"filename": photo.filename, "size": photo.size} for photo in photos]
+        })
+        return data, photos
+    
+    def write_recipe(self, recipe_id=None):
+        """Create (POST) or update (PUT) a recipe and upload its photos"""
         try:
-            log_info("POST request received", {
-                "path": self.path,
-                "headers": dict(self.headers),
-                "client_address": self.client_address[0] if self.client_address else None
-            })
-            
-            # Initialize database
-            self.init_db()
-            
-            content_type = self.headers.get('Content-Type', '')
-            content_length = int(self.headers.get('Content-Length', 0))
-            
-            log_info("POST request details", {
-                "content_type": content_type,
-                "content_length": content_length
-            })
-            
-            if content_length == 0:
-                log_error("POST request failed - no content received")
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "No content received"}).encode())
+            try:
+                with self.timer.phase('parse'):
+                    data, photos = self.read_recipe_body()
+            except MultipartError as e:
+                self.log.warning("Failed to parse multipart data", {"error": str(e)})
+                self.send_json(413 if isinstance(e, RequestTooLarge) else 400,
+                               {"error": f"Invalid multipart data format: {str(e)}"})
                 return
-            
-            post_data = self.rfile.read(content_length)
-            
-            log_info("POST data received", {
-                "data_length": len(post_data)
-            })
-            
-            # Handle different content types
-            if 'multipart/form-data' in content_type:
-                log_info("Processing multipart form data")
-                try:
-                    # Parse multipart form data
-                    form = cgi.FieldStorage(
-                        fp=io.BytesIO(post_data),
-                        headers=self.headers,
-                        environ={'REQUEST_METHOD': 'POST'}
-                    )
-                    
-                    # Extract form fields
-                    data = {}
-                    photos = []
-                    
-                    for field_name in form.keys():
-                        field = form[field_name]
-                        if field.filename:  # It's a file
-                            photos.append({
-                                'filename': field.filename,
-                                'data': field.file.read()
-                            })
-                            log_info("Photo found", {
-                                "filename": field.filename,
-                                "size": len(field.file.getvalue()) if hasattr(field.file, 'getvalue') else 'unknown'
-                            })
-                        else:  # It's a regular field
-                            data[field_name] = field.value
-                            log_info("Form field found", {
-                                "field_name": field_name,
-                                "field_value": field.value
-                            })
-                    
-                    log_info("Form data extracted", {
-                        "data_fields": list(data.keys()),
-                        "photo_count": len(photos),
-                        "recipe_title": data.get('title', 'Unknown')
-                    })
-                    
-                except Exception as e:
-                    log_error("Failed to parse multipart data", e)
-                    self.send_response(400)
-                    self.send_header('Content-Type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"error": f"Invalid multipart data format: {str(e)}"}).encode())
-                    return
-            else:
-                log_info("Processing JSON data")
-                try:
-                    data = json.loads(post_data.decode('utf-8'))
-                    photos = []
-                    log_info("JSON data parsed successfully", {
-                        "data_fields": list(data.keys())
-                    })
-                except json.JSONDecodeError as e:
-                    log_error("JSON decode error", e)
-                    self.send_response(400)
-                    self.send_header('Content-Type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"error": f"Invalid JSON: {str(e)}"}).encode())
-                    return
-            
-            log_info("Data parsing completed", {
-                "parsed_data": {k: v for k, v in data.items() if k != 'ingredients'},  # Avoid logging long text
-                "photo_count": len(photos)
-            })
-            
-            # Validate required fields
-            required_fields = ['title', 'country', 'protein_type']
-            missing_fields = []
-            for field in required_fields:
-                if not data.get(field):
-                    missing_fields.append(field)
-            
-            if missing_fields:
-                error_msg = f"Required fields missing: {', '.join(missing_fields)}"
-                log_error("Validation failed", None, {
-                    "missing_fields": missing_fields,
-                    "provided_fields": list(data.keys())
-                })
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": error_msg}).encode())
+            except ValueError as e:
+                self.log.warning(f"{self.command} request failed - invalid body", {"error": str(e)})
+                self.send_json(400, {"error": str(e)})
                 return
             
-            log_info("Validation passed", {
-                "recipe_title": data.get('title'),
-                "recipe_country": data.get('country'),
-                "recipe_protein": data.get('protein_type')
-            })
-            
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # Upload photos to Cloudinary
-            photo_urls = []
-            for i, photo in enumerate(photos):
-                try:
-                    log_info("Uploading photo to Cloudinary", {
-                        "photo_index": i + 1,
-                        "total_photos": len(photos),
-                        "filename": photo["filename"]
-                    })
-                    result = cloudinary.uploader.upload(
-                        photo['data'],
-                        folder='recipes',
-                        public_id=f'recipe_{uuid.uuid4()}'
-                    )
-                    photo_urls.append(result['secure_url'])
-                    log_info("Photo upload successful", {
-                        "photo_index": i + 1,
-                        "secure_url": result["secure_url"],
-                        "public_id": result.get("public_id")
-                    })
-                except Exception as e:
-                    log_error("Photo upload failed", e, {
-                        "photo_index": i + 1,
-                        "filename": photo["filename"]
-                    })
-                    # Continue with other photos
-            
-            photos_json = json.dumps(photo_urls)
-            log_info("Photo processing completed", {
-                "successful_uploads": len(photo_urls),
-                "total_photos": len(photos)
-            })
-            
-            log_info("Inserting recipe into database")
-            cursor.execute('''
-                INSERT INTO recipes (title, description, country, protein_type, cooking_time, difficulty, ingredients, photos)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                data.get('title'),
-                data.get('description'),
-                data.get('country'),
-                data.get('protein_type'),
-                int(data.get('cooking_time')) if data.get('cooking_time') else None,
-                data.get('difficulty'),
-                data.get('ingredients'),
-                photos_json
-            ))
-            
-            recipe_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            # Photos are already spooled to disk; the photo worker uploads them to Cloudinary
+            spooled_photos = spool_photos(photos)
+            names = {photo.path: photo.filename for photo in photos}
+            
+            try:
+                if recipe_id is None:
+                    recipe_id, job_ids = get_repository().create(data, spooled_photos)
+                else:
+                    job_ids = get_repository().update(recipe_id, data, spooled_photos)
+            except ValueError as e:
+                discard_spooled(spooled_photos)
+                self.log.warning("Validation failed", lambda: {"error": str(e), "provided_fields": sorted(data)})
+                self.send_json(400, {"error": str(e)})
+                return
+            if job_ids is None:
+                discard_spooled(spooled_photos)
+                self.send_json(404, {"error": "Recipe not found"})
+                return
             
-            log_info("Recipe created successfully", {
+            verb = 'created' if self.command == 'POST' else 'updated'
+            self.log.info(f"Recipe {verb} successfully", {
                 "recipe_id": recipe_id,
                 "title": data.get('title'),
                 "country": data.get('country'),
                 "protein_type": data.get('protein_type'),
-                "photo_count": len(photo_urls)
+                "queued_photos": len(job_ids)
             })
             
-            self.send_response(201)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'id': recipe_id,
-                'message': 'Recipe created successfully'
-            }).encode())
-            
+            status = 201 if self.command == 'POST' else 200
+            body = {'id': recipe_id, 'message': f'Recipe {verb} successfully'}
+            if job_ids:
+                # Upload concurrently and report each photo; anything still unfinished at the
+                # deadline keeps going after the response is sent
+                with self.timer.phase('photos'):
+                    results = photo_worker.run_jobs(job_ids, timeout=UPLOAD_WAIT_TIMEOUT)
+                filenames = {job_id: names[path] for job_id, (path, _) in zip(job_ids, spooled_photos)}
+                for result in results:
+                    result['filename'] = filenames[result['job_id']]
+                unfinished = [r for r in results if r['status'] == 'running']
+                retrying = [r for r in results if r['status'] == 'retrying']
+                failed = [r for r in results if r['status'] == 'failed']
+                if failed:
+                    self.log.error("Photo uploads failed", None, {
+                        "recipe_id": recipe_id,
+                        "failed": [{"filename": r['filename'], "error": r.get('error')} for r in failed]
+                    })
+                
+                if unfinished:
+                    self.photo_jobs = job_ids
+                    status = 202
+                    body['message'] = f'Recipe {verb} successfully, some photos are still processing'
+                elif retrying:
+                    # Nothing to finish after the response: the retry waits for a later worker
+                    status = 202
+                    body['message'] = f'Recipe {verb} successfully, some photos failed and will be retried'
+                body['photos'] = results
+            self.send_json(status, body)
+        
+        except Exception as e:
+            self.log.error(f"{self.command} request failed", e, {
+                "path": self.path,
+                "error_type": type(e).__name__
+            })
+            self.send_json(500, {"error": "Internal server error"})
+    
+    def forward_to_primary(self, recipe_id=None):
+        """Stream this write to the primary backend and relay its response"""
+        target = urlparse(PRIMARY_URL)
+        path = target.path.rstrip('/') + '/api/recipes' + (f'/{recipe_id}' if recipe_id is not None else '')
+        connection_class = http.client.HTTPSConnection if target.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(target.netloc, timeout=PRIMARY_TIMEOUT)
+        try:
+            with self.timer.phase('primary'):
+                connection.putrequest(self.command, path)
+                for name in FORWARDED_HEADERS:
+                    if name in self.headers:
+                        connection.putheader(name, self.headers[name])
+                connection.endheaders()
+                remaining = int(self.headers.get('Content-Length') or 0)
+                while remaining > 0:
+                    chunk = self.rfile.read(min(64 * 1024, remaining))
+                    if not chunk:
+                        break
+                    connection.send(chunk)
+                    remaining -= len(chunk)
+                response = connection.getresponse()
+                body = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.log.error(f"{self.command} could not reach the primary", e, {"primary": target.netloc})
+            self.send_json(502, {"error": "Primary database unavailable"})
+            return
+        finally:
+            connection.close()
+        self.send_response(response.status)
+        self.send_header('Content-Type', response.getheader('Content-Type', 'application/json'))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_server_timing()
+        self.end_headers()
+        self.wfile.write(body)
+        self.response_sent(response.status, body)
+    
+    def do_POST(self):
+        self.start_request()
+        if PRIMARY_URL:
+            self.forward_to_primary()
+            return
+        self.write_recipe()
+    
+    def do_PUT(self):
+        self.start_request()
+        recipe_id = self.recipe_id()
+        if recipe_id is None:
+            self.send_json(405, {"error": "PUT requires a recipe id"})
+            return
+        if PRIMARY_URL:
+            self.forward_to_primary(recipe_id)
+            return
+        self.write_recipe(recipe_id)
+    
+    def do_DELETE(self):
+        self.start_request()
+        try:
+            recipe_id = self.recipe_id()
+            if recipe_id is None:
+                self.send_json(405, {"error": "DELETE requires a recipe id"})
+                return
+            if PRIMARY_URL:
+                self.forward_to_primary(recipe_id)
+                return
+            # Also drops queued uploads; photos already on Cloudinary are managed there
+            if not get_repository().delete(recipe_id):
+                self.send_json(404, {"error": "Recipe not found"})
+                return
+            self.log.info("Recipe deleted successfully", {"recipe_id": recipe_id})
+            self.send_json(200, {"message": "Recipe deleted successfully"})
         except Exception as e:
-            log_error("POST request failed", e, {
+            self.log.error("DELETE request failed", e, {
                 "path": self.path,
                 "error_type": type(e).__name__
             })
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Internal server error"}).encode())
+            self.send_json(500, {"error": "Internal server error"})
     
     def do_OPTIONS(self):
         self.send_response(200)
@@ -347,31 +351,11 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         self.end_headers()
     
-    def get_db_connection(self):
-        """Get database connection"""
-        db_path = '/tmp/recipes.db'
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
-    
-    def init_db(self):
-        """Initialize database with recipes table"""
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS recipes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                description TEXT,
-                country TEXT NOT NULL,
-                protein_type TEXT NOT NULL,
-                cooking_time INTEGER,
-                difficulty TEXT,
-                ingredients TEXT,
-                photos TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        conn.close() 
\ No newline at end of file
+    def finish(self):
+        super().finish()
+        # Keep the warm connection usable if the request failed mid-transaction
+        db.release()
+        # The response has been sent; finish queued uploads before the function is frozen
+        if getattr(self, 'photo_jobs', None):
+            photo_worker.notify()
+            photo_worker.wait_idle(timeout=UPLOAD_DRAIN_TIMEOUT)
@@ -0,0 +1,42 @@
+import os
+import sys
+from urllib.parse import urlparse, parse_qsl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from doggiechef import db, logs, metrics, search
+from doggiechef.handlers import JSONHandler
+from doggiechef.recipes import int_param
+
+db.configure('/tmp/recipes.db')
+
+class handler(JSONHandler):
+    def do_GET(self):
+        self.timer = metrics.request('GET /api/search')
+        try:
+            query_params = dict(parse_qsl(urlparse(self.path).query))
+            q = query_params.get('q', '').strip()
+            
+            try:
+                if not q:
+                    raise ValueError('q is required')
+                results, next_offset = search.search_recipes(
+                    db.get_read_connection(), q,
+                    limit=int_param(query_params, 'limit', 20),
+                    offset=int_param(query_params, 'offset', 0),
+                    country=query_params.get('country'),
+                    protein_type=query_params.get('protein_type')
+                )
+            except ValueError as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            
+            self.send_json(200, {
+                'results': results,
+                'next_offset': next_offset
+            })
+            
+        except Exception as e:
+            logs.error("GET /api/search failed", e, {"path": self.path, "error_type": type(e).__name__})
+            self.send_json(500, {'error': 'Internal server error'})
+        finally:
+            db.release()
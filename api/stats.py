@@ -1,44 +1,34 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import sqlite3
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from doggiechef import cache, db, facets, logs, metrics
+
+db.configure('/tmp/recipes.db')
+
+response_cache = cache.ResponseCache(max_entries=1)
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
+        timer = metrics.request('GET /api/stats')
         try:
-            # Initialize database
-            self.init_db()
-            
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # Total recipes
-            cursor.execute('SELECT COUNT(*) as total FROM recipes')
-            total_recipes = cursor.fetchone()['total']
-            
-            # Recipes by country
-            cursor.execute('SELECT country, COUNT(*) as count FROM recipes GROUP BY country ORDER BY count DESC')
-            recipes_by_country = [dict(row) for row in cursor.fetchall()]
-            
-            # Recipes by protein type
-            cursor.execute('SELECT protein_type, COUNT(*) as count FROM recipes GROUP BY protein_type ORDER BY count DESC')
-            recipes_by_protein = [dict(row) for row in cursor.fetchall()]
-            
-            conn.close()
-            
-            result = {
-                'total_recipes': total_recipes,
-                'recipes_by_country': recipes_by_country,
-                'recipes_by_protein': recipes_by_protein
-            }
-            
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            conn = db.get_read_connection()
+            version = cache.data_version(conn)
+            entry = response_cache.get('/api/stats', version)
+            if entry is None:
+                result = facets.get_stats(conn)
+                with timer.phase('encode'):
+                    body = json.dumps(result).encode()
+                entry = response_cache.put('/api/stats', version, body)
+            
+            status, body = cache.send_entry(self, entry, {'Server-Timing': timer.server_timing()})
+            timer.finish(status, 0, len(body) if body else 0)
             
         except Exception as e:
-            self.send_error(500, str(e))
+            logs.error("GET /api/stats failed", e, {"path": self.path, "error_type": type(e).__name__})
+            self.send_error(500)
     
     def do_OPTIONS(self):
         self.send_response(200)
@@ -46,32 +36,3 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
         self.end_headers()
-    
-    def get_db_connection(self):
-        """Get database connection"""
-        db_path = '/tmp/recipes.db'
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
-    
-    def init_db(self):
-        """Initialize database with recipes table"""
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS recipes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                description TEXT,
-                country TEXT NOT NULL,
-                protein_type TEXT NOT NULL,
-                cooking_time INTEGER,
-                difficulty TEXT,
-                ingredients TEXT,
-                photos TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        conn.close() 
\ No newline at end of file
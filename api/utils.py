@@ -1,67 +1,32 @@
 import os
-import sqlite3
-import uuid
-from werkzeug.utils import secure_filename
-import cloudinary
-import cloudinary.uploader
-from cloudinary.utils import cloudinary_url
+import sys
 
-# Configure Cloudinary for image uploads
-cloudinary.config(
-    cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.environ.get('CLOUDINARY_API_KEY'),
-    api_secret=os.environ.get('CLOUDINARY_API_SECRET')
-)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from doggiechef import db
+from doggiechef.recipes import ALLOWED_EXTENSIONS, allowed_file
+from doggiechef.storage import CloudinaryStorage, save_with_retries
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'heic', 'webp'}
+db.configure('/tmp/recipes.db')
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+UPLOAD_TIMEOUT = 15  # seconds per Cloudinary request
+
+# Configures Cloudinary from the environment on the first upload
+cloudinary_storage = CloudinaryStorage('doggiechef')
 
 def get_db_connection():
-    """Get database connection - using SQLite for simplicity, but you can switch to PostgreSQL"""
-    db_path = '/tmp/recipes.db'
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get this thread's warm database connection - SQLite, or PostgreSQL when DOGGIECHEF_DATABASE_URL is set"""
+    return db.get_connection()
 
 def init_db():
-    """Initialize database with recipes table"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS recipes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            country TEXT NOT NULL,
-            protein_type TEXT NOT NULL,
-            cooking_time INTEGER,
-            difficulty TEXT,
-            ingredients TEXT,
-            photos TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    """Initialize database with recipes table (once per process)"""
+    db.init_db()
 
 def upload_to_cloudinary(file, filename):
     """Upload file to Cloudinary and return the URL"""
     try:
-        # Generate unique filename
-        unique_filename = f"{uuid.uuid4()}_{secure_filename(filename)}"
-        
-        # Upload to Cloudinary
-        result = cloudinary.uploader.upload(
-            file,
-            public_id=f"doggiechef/{unique_filename}",
-            folder="doggiechef",
-            resource_type="auto"
-        )
-        
-        return result['secure_url']
+        # Same timeout and retry policy as the recipe photo worker
+        stored = save_with_retries(cloudinary_storage, file, filename, timeout=UPLOAD_TIMEOUT)
+        return stored['url']
     except Exception as e:
         print(f"Error uploading to Cloudinary: {str(e)}")
         return None
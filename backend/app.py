@@ -1,308 +1,442 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, abort, g, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import sqlite3
 import os
+import shutil
+import threading
 import uuid
-from datetime import datetime
-from werkzeug.utils import secure_filename
-from PIL import Image
-import io
+from werkzeug.exceptions import HTTPException
+import sys
+from functools import wraps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from doggiechef import bulk, cache, db, files, ingredients, jobs, logs, metrics, search, writer
+from doggiechef.multipart import MultipartError, RequestTooLarge, parse_multipart
+from doggiechef.images import VARIANT_FORMATS, pick_variant, variant_filename
+from doggiechef.photos import load_variants
+from doggiechef.recipes import (EXPORT_FORMATS, RecipeRepository, discard_spooled, int_param, parse_list_params,
+                                spool_photos)
+from doggiechef.storage import create_storage
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Counts jsonify() time as the request's 'encode' phase"""
+    def dumps(self, obj, **kwargs):
+        with metrics.current().phase('encode'):
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)
 
 # Configuration
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads', 'recipes')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'heic', 'webp'}
+VARIANT_FOLDER = os.path.join(UPLOAD_FOLDER, 'variants')
+SPOOL_FOLDER = os.path.join(os.path.dirname(UPLOAD_FOLDER), 'incoming')
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+# Response headers stored alongside cached bodies
+CACHED_HEADERS = ('X-Next-Cursor', 'Access-Control-Expose-Headers')
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['VARIANT_FOLDER'] = VARIANT_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
-# Ensure upload directory exists
+# Ensure upload directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(SPOOL_FOLDER, exist_ok=True)
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def init_db():
-    conn = sqlite3.connect('recipes.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS recipes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            country TEXT NOT NULL,
-            protein_type TEXT NOT NULL,
-            cooking_time INTEGER,
-            difficulty TEXT,
-            ingredients TEXT,
-            photos TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+db.configure('recipes.db')
+# Plain console lines for local development; DOGGIECHEF_LOG_LEVEL=debug adds per-request details
+logs.configure(format='text')
+
+# Content-addressed files in UPLOAD_FOLDER unless DOGGIECHEF_STORAGE picks another backend
+photo_storage = create_storage('local', local={'folder': UPLOAD_FOLDER}, cloudinary={'folder': 'recipes'})
+# Resizes and stores queued photos off the request thread
+photo_worker = jobs.PhotoWorker(photo_storage, variant_dir=VARIANT_FOLDER,
+                                max_workers=min(4, os.cpu_count() or 1))
+# Merges concurrent recipe writes into shared commits when DOGGIECHEF_GROUP_COMMIT_MS is set
+write_queue = writer.from_env()
+# Size, mtime and ETag of served photos, so a hit does not resolve and stat the path again
+photo_files = files.FileIndex(UPLOAD_FOLDER)
+variant_files = files.FileIndex(VARIANT_FOLDER, accel_prefix=files.ACCEL_PREFIX + 'variants/')
+# Set once a graceful shutdown begins, so /api/ready sends traffic elsewhere
+draining = threading.Event()
+
+def create_app(config=None):
+    """Prepare the app to serve; the entry point for WSGI servers (see wsgi.py and gunicorn.conf.py).
+
+    `config` updates app.config; DATABASE sets the database path unless DOGGIECHEF_DB_PATH is set.
+    The schema is created and the photo worker started before the first request, so photos queued
+    before the last shutdown resume straight away.
+    """
+    if config:
+        app.config.update(config)
+    if app.config.get('DATABASE'):
+        db.configure(app.config['DATABASE'])
+    db.init_db()
+    photo_worker.start()
+    return app
+
+def shutdown(timeout=None):
+    """Finish the photos in flight (for up to `timeout` seconds) once requests have drained.
+
+    Jobs not yet started stay queued in the database for the next process.
+    """
+    draining.set()
+    if not photo_worker.drain(timeout):
+        logs.warning("⚠️ Photo jobs still running at shutdown; another worker will retry them",
+                     {"timeout": timeout})
+    photo_worker.stop(wait=False)
+    if write_queue is not None:
+        write_queue.stop()
+    db.close_connections()
+
+@app.before_request
+def start_timer():
+    # Label by route pattern, not path, so /api/recipes/<id> is one series
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.timer = metrics.request(f"{request.method} {rule}")
+
+@app.after_request
+def record_timing(response):
+    timer = g.pop('timer', metrics.NULL_TIMER)
+    server_timing = timer.server_timing()
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+    timer.finish(response.status_code, request.content_length, response.content_length)
+    return response
 
-def get_db_connection():
-    conn = sqlite3.connect('recipes.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+@app.teardown_request
+def release_db(exc):
+    db.release()
+
+def get_repository():
+    return RecipeRepository(db.get_connection(), storage=photo_storage, variant_dir=VARIANT_FOLDER,
+                            writer=write_queue)
+
+def parse_recipe_form():
+    """Return the form fields and photo uploads, streaming multipart photos straight to SPOOL_FOLDER"""
+    if request.is_json:
+        # As the serverless function accepts, and forwards here in snapshot mode
+        return request.get_json(silent=True) or {}, []
+    if request.mimetype != 'multipart/form-data':
+        return request.form.to_dict(), []
+    data, uploads = parse_multipart(request.stream, request.content_type, request.content_length or 0,
+                                    SPOOL_FOLDER, max_file_size=MAX_CONTENT_LENGTH,
+                                    max_body_size=MAX_CONTENT_LENGTH)
+    return data, [upload for upload in uploads if upload.name == 'photos']
+
+@app.errorhandler(MultipartError)
+def multipart_error(e):
+    return jsonify({'error': str(e)}), 413 if isinstance(e, RequestTooLarge) else 400
+
+response_cache = cache.ResponseCache()
+
+def cached_json(view):
+    """Serve a GET view from the response cache with a strong ETag, answering 304 when it matches.
+
+    Bodies are compressed with br or gzip when the client accepts it; each coding has its own ETag.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = cache.data_version(db.get_connection())
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        entry = response_cache.get(key, version)
+        if entry is None:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            headers = {name: value for name, value in response.headers.items() if name in CACHED_HEADERS}
+            entry = response_cache.put(key, version, response.get_data(), headers)
+        coding, body, etag = entry.encoded(request.headers.get('Accept-Encoding'))
+        response = app.response_class(body, mimetype='application/json', headers=entry.headers)
+        if coding:
+            response.headers['Content-Encoding'] = coding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(etag.strip('"'))
+        response.headers['Cache-Control'] = cache.JSON_CACHE_CONTROL
+        return response.make_conditional(request)
+    return wrapper
+
+def send_photo(index, filename):
+    """Send a stored photo, answering If-None-Match and Range.
+
+    Photo names never change, so browsers may keep them for a year. The file is
+    handed to the WSGI server's file_wrapper (sendfile under gunicorn), or to a
+    fronting server when DOGGIECHEF_PHOTO_SENDFILE is set.
+    """
+    info = index.lookup(filename)
+    if info is None:
+        abort(404)
+    reply = files.prepare(index, info, request.headers)
+    body = ()
+    if reply.length:
+        f = index.open(info, reply)
+        if f is None:
+            abort(404)
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        # Servers may send a wrapped file to its end, so partial bodies are read out here
+        if file_wrapper is not None and reply.status == 200:
+            body = file_wrapper(f, files.BLOCK_SIZE)
+        else:
+            body = files.read_span(f, reply.length)
+    return app.response_class(body, status=reply.status, headers=reply.headers, direct_passthrough=True)
 
 @app.route('/api/recipes', methods=['GET'])
+@cached_json
 def get_recipes():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get filter parameters
-    country = request.args.get('country')
-    protein_type = request.args.get('protein_type')
-    
-    query = "SELECT * FROM recipes"
-    params = []
-    
-    if country or protein_type:
-        query += " WHERE"
-        if country:
-            query += " country = ?"
-            params.append(country)
-        if protein_type:
-            if country:
-                query += " AND"
-            query += " protein_type = ?"
-            params.append(protein_type)
-    
-    query += " ORDER BY created_at DESC"
-    
-    cursor.execute(query, params)
-    recipes = cursor.fetchall()
+    # Filter, pagination and projection parameters
+    try:
+        params = parse_list_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    result = []
-    for recipe in recipes:
-        recipe_dict = dict(recipe)
-        recipe_dict['photos'] = recipe_dict['photos'].split(',') if recipe_dict['photos'] else []
-        result.append(recipe_dict)
+    # Encoded straight from the rows, reusing the fragments of unchanged recipes
+    body, next_cursor = get_repository().list_json(**params)
     
-    conn.close()
-    return jsonify(result)
+    response = app.response_class(body, mimetype='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Access-Control-Expose-Headers'] = 'X-Next-Cursor'
+    return response
+
+@app.route('/api/recipes/export', methods=['GET'])
+def export_recipes():
+    # Streamed batch by batch from one cursor; never cached, since it would hold the whole table
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        chunks = get_repository().export(fmt, country=request.args.get('country'),
+                                         protein_type=request.args.get('protein_type'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = app.response_class(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="recipes.{fmt}"'
+    return response
 
 @app.route('/api/recipes/<int:recipe_id>', methods=['GET'])
+@cached_json
 def get_recipe(recipe_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM recipes WHERE id = ?', (recipe_id,))
-    recipe = cursor.fetchone()
-    conn.close()
-    
+    recipe = get_repository().get(recipe_id)
     if recipe is None:
         return jsonify({'error': 'Recipe not found'}), 404
-    
-    recipe_dict = dict(recipe)
-    recipe_dict['photos'] = recipe_dict['photos'].split(',') if recipe_dict['photos'] else []
-    return jsonify(recipe_dict)
+    return jsonify(recipe)
 
 @app.route('/api/recipes', methods=['POST'])
 def create_recipe():
+    log = logs.request('POST /api/recipes')
     try:
-        print("📝 Creating new recipe...")
-        data = request.form.to_dict()
-        files = request.files.getlist('photos')
-        
-        print(f"📋 Form data: {data}")
-        print(f"📸 Files received: {len(files)}")
+        log.debug("📝 Creating new recipe...")
+        data, uploads = parse_recipe_form()
         
-        # Validate required fields
-        if not data.get('title'):
-            return jsonify({'error': 'Title is required'}), 400
-        if not data.get('country'):
-            return jsonify({'error': 'Country is required'}), 400
-        if not data.get('protein_type'):
-            return jsonify({'error': 'Protein type is required'}), 400
+        # Field names only; the submitted values can be long and are not worth a log line each
+        log.debug("📋 Form data", lambda: {'fields': sorted(data), 'files': len(uploads)})
         
-        # Handle photo uploads
-        photo_paths = []
-        for file in files:
-            if file and file.filename and allowed_file(file.filename):
-                # Generate unique filename
-                filename = f"{uuid.uuid4()}_{secure_filename(file.filename)}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                
-                print(f"💾 Saving photo to: {filepath}")
-                # Save file
-                file.save(filepath)
-                photo_paths.append(f"/api/photos/{filename}")
+        # Photos are already spooled to disk; resizing and storage happen in the photo worker
+        spooled_photos = spool_photos(uploads)
+        try:
+            recipe_id, job_ids = get_repository().create(data, spooled_photos)
+        except ValueError as e:
+            discard_spooled(spooled_photos)
+            return jsonify({'error': str(e)}), 400
         
-        print(f"📸 Photo paths: {photo_paths}")
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO recipes (title, description, country, protein_type, cooking_time, difficulty, ingredients, photos)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('title'),
-            data.get('description'),
-            data.get('country'),
-            data.get('protein_type'),
-            int(data.get('cooking_time')) if data.get('cooking_time') else None,
-            data.get('difficulty'),
-            data.get('ingredients'),
-            ','.join(photo_paths)
-        ))
-        
-        recipe_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        print(f"✅ Recipe created successfully with ID: {recipe_id}")
+        log.info(f"✅ Recipe created successfully with ID: {recipe_id}")
+        if job_ids:
+            photo_worker.notify()
+            return jsonify({
+                'id': recipe_id,
+                'message': 'Recipe created successfully, photos are processing',
+                'photo_jobs': job_ids
+            }), 202
         return jsonify({'id': recipe_id, 'message': 'Recipe created successfully'}), 201
         
+    except (MultipartError, HTTPException):
+        raise  # e.g. 400/413 for a bad or oversized upload
     except Exception as e:
-        print(f"❌ Error creating recipe: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+        log.error("❌ Error creating recipe", e, {"error_type": type(e).__name__})
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/recipes/import', methods=['POST'])
+def import_recipes():
+    """Bulk import an NDJSON or CSV body, or a multipart `records` file plus `photos` files"""
+    spooled = []
+    try:
+        photo_paths = {}
+        if request.mimetype == 'multipart/form-data':
+            _, uploads = parse_multipart(request.stream, request.content_type, request.content_length or 0,
+                                         SPOOL_FOLDER, max_file_size=MAX_CONTENT_LENGTH,
+                                         max_body_size=MAX_CONTENT_LENGTH)
+            spooled = [upload.path for upload in uploads]
+            records = next((upload for upload in uploads if upload.name == 'records'), None)
+            if records is None:
+                return jsonify({'error': 'records file is required'}), 400
+            source_path = records.path
+            fmt = bulk.detect_format(records.filename, records.content_type)
+            photo_paths = {upload.filename: upload.path for upload in uploads if upload.name == 'photos'}
+        else:
+            # Spooled so the default import id can hash it before anything is written
+            source_path = os.path.join(SPOOL_FOLDER, f'import-{uuid.uuid4().hex}')
+            spooled = [source_path]
+            with open(source_path, 'wb') as f:
+                shutil.copyfileobj(request.stream, f)
+            fmt = bulk.detect_format(None, request.content_type)
+        fmt = request.args.get('format', fmt)
+        # Send the same import_id again to resume an import that was cut short
+        import_id = request.args.get('import_id') or bulk.file_digest(source_path)
+        
+        importer = bulk.BulkImporter(db.get_connection(), spool_dir=SPOOL_FOLDER,
+                                     photo_source=lambda name: photo_paths.get(os.path.basename(name)))
+        with open(source_path, 'rb') as f:
+            report = importer.run(bulk.read_records(f, fmt), import_id)
+    except MultipartError:
+        raise  # 400/413 from the error handler
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        # Accepted photos were copied into the job queue's own spool files
+        for path in spooled:
+            if os.path.exists(path):
+                os.remove(path)
+    
+    if report['photo_jobs']:
+        photo_worker.notify()
+    report['photo_jobs'] = len(report['photo_jobs'])
+    return jsonify(report), 202 if report['photo_jobs'] else 200
 
 @app.route('/api/recipes/<int:recipe_id>', methods=['PUT'])
 def update_recipe(recipe_id):
     try:
-        data = request.form.to_dict()
-        files = request.files.getlist('photos')
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        data, uploads = parse_recipe_form()
         
-        # Get existing photos
-        cursor.execute('SELECT photos FROM recipes WHERE id = ?', (recipe_id,))
-        existing_recipe = cursor.fetchone()
-        
-        if existing_recipe is None:
-            conn.close()
+        # New photos are appended after the existing ones
+        spooled_photos = spool_photos(uploads)
+        try:
+            job_ids = get_repository().update(recipe_id, data, spooled_photos)
+        except ValueError as e:
+            discard_spooled(spooled_photos)
+            return jsonify({'error': str(e)}), 400
+        if job_ids is None:
+            discard_spooled(spooled_photos)
             return jsonify({'error': 'Recipe not found'}), 404
         
-        existing_photos = existing_recipe['photos'].split(',') if existing_recipe['photos'] else []
-        
-        # Handle new photo uploads
-        new_photo_paths = []
-        for file in files:
-            if file and allowed_file(file.filename):
-                filename = f"{uuid.uuid4()}_{secure_filename(file.filename)}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                new_photo_paths.append(f"/api/photos/{filename}")
-        
-        # Combine existing and new photos
-        all_photos = existing_photos + new_photo_paths
-        
-        cursor.execute('''
-            UPDATE recipes 
-            SET title = ?, description = ?, country = ?, protein_type = ?, 
-                cooking_time = ?, difficulty = ?, ingredients = ?, photos = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (
-            data.get('title'),
-            data.get('description'),
-            data.get('country'),
-            data.get('protein_type'),
-            data.get('cooking_time'),
-            data.get('difficulty'),
-            data.get('ingredients'),
-            ','.join(all_photos),
-            recipe_id
-        ))
-        
-        conn.commit()
-        conn.close()
-        
+        if job_ids:
+            photo_worker.notify()
+            return jsonify({
+                'message': 'Recipe updated successfully, photos are processing',
+                'photo_jobs': job_ids
+            }), 202
         return jsonify({'message': 'Recipe updated successfully'})
         
+    except (MultipartError, HTTPException):
+        raise  # e.g. 400/413 for a bad or oversized upload
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        logs.error("❌ Error updating recipe", e, {"recipe_id": recipe_id, "error_type": type(e).__name__})
+        return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/recipes/<int:recipe_id>', methods=['DELETE'])
 def delete_recipe(recipe_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get photos to delete
-    cursor.execute('SELECT photos FROM recipes WHERE id = ?', (recipe_id,))
-    recipe = cursor.fetchone()
-    
-    if recipe is None:
-        conn.close()
+    # Also drops queued uploads, stored photos and their variants
+    if not get_repository().delete(recipe_id):
         return jsonify({'error': 'Recipe not found'}), 404
-    
-    # Delete photo files
-    if recipe['photos']:
-        photo_paths = recipe['photos'].split(',')
-        for photo_path in photo_paths:
-            if photo_path.startswith('/api/photos/'):
-                filename = photo_path.replace('/api/photos/', '')
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-    
-    # Delete recipe from database
-    cursor.execute('DELETE FROM recipes WHERE id = ?', (recipe_id,))
-    conn.commit()
-    conn.close()
-    
     return jsonify({'message': 'Recipe deleted successfully'})
 
 @app.route('/api/photos/<filename>')
 def serve_photo(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-
-@app.route('/api/filters', methods=['GET'])
-def get_filters():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # ?size=<width> serves the closest resized variant; the original is served otherwise
+    size = request.args.get('size')
+    if not size or size == 'original':
+        return send_photo(photo_files, filename)
     
-    # Get unique countries
-    cursor.execute('SELECT DISTINCT country FROM recipes ORDER BY country')
-    countries = [row['country'] for row in cursor.fetchall()]
+    if not size.isdigit():
+        return jsonify({'error': 'size must be a width in pixels or "original"'}), 400
     
-    # Get unique protein types
-    cursor.execute('SELECT DISTINCT protein_type FROM recipes ORDER BY protein_type')
-    protein_types = [row['protein_type'] for row in cursor.fetchall()]
+    fmt = request.args.get('format')
+    negotiated = fmt is None
+    if negotiated:
+        fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    elif fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in VARIANT_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(VARIANT_FORMATS)}"}), 400
     
-    conn.close()
+    variant = pick_variant(load_variants(db.get_connection(), filename), int(size), fmt)
+    if variant is None:
+        # Not processed (e.g. HEIC), fall back to the original
+        return send_photo(photo_files, filename)
+    
+    response = send_photo(variant_files, variant_filename(filename, variant['width'], fmt))
+    if negotiated:
+        response.vary.add('Accept')
+    return response
+
+@app.route('/api/search', methods=['GET'])
+@cached_json
+def search_recipes():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        results, next_offset = search.search_recipes(
+            db.get_connection(), q,
+            limit=int_param(request.args, 'limit', 20),
+            offset=int_param(request.args, 'offset', 0),
+            country=request.args.get('country'),
+            protein_type=request.args.get('protein_type')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'countries': countries,
-        'protein_types': protein_types
+        'results': results,
+        'next_offset': next_offset
     })
 
+@app.route('/api/pantry', methods=['GET'])
+@cached_json
+def pantry_recipes():
+    try:
+        results = ingredients.pantry_matches(
+            db.get_connection(),
+            ingredients.parse_pantry(request.args.get('ingredients')),
+            limit=int_param(request.args, 'limit', 20),
+            min_matches=int_param(request.args, 'min_matches', 1),
+            country=request.args.get('country'),
+            protein_type=request.args.get('protein_type')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'results': results})
+
+@app.route('/api/filters', methods=['GET'])
+@cached_json
+def get_filters():
+    # Read from the trigger-maintained counters instead of scanning recipes
+    return jsonify(get_repository().filters())
+
 @app.route('/api/stats', methods=['GET'])
+@cached_json
 def get_stats():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Total recipes
-    cursor.execute('SELECT COUNT(*) as total FROM recipes')
-    total_recipes = cursor.fetchone()['total']
-    
-    # Recipes by country
-    cursor.execute('SELECT country, COUNT(*) as count FROM recipes GROUP BY country ORDER BY count DESC')
-    recipes_by_country = [dict(row) for row in cursor.fetchall()]
-    
-    # Recipes by protein type
-    cursor.execute('SELECT protein_type, COUNT(*) as count FROM recipes GROUP BY protein_type ORDER BY count DESC')
-    recipes_by_protein = [dict(row) for row in cursor.fetchall()]
-    
-    conn.close()
-    
-    return jsonify({
-        'total_recipes': total_recipes,
-        'recipes_by_country': recipes_by_country,
-        'recipes_by_protein': recipes_by_protein
-    })
+    return jsonify(get_repository().stats())
+
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    # 503 while shutting down or when the database cannot be read, so load balancers skip this worker
+    if draining.is_set():
+        return jsonify({'status': 'draining'}), 503
+    try:
+        cache.data_version(db.get_connection())
+    except Exception as e:
+        logs.error("GET /api/ready: database unavailable", e, {"error_type": type(e).__name__})
+        return jsonify({'status': 'unavailable'}), 503
+    return jsonify({'status': 'ready'})
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format: per-route latency, SQL, JSON encoding, photo processing and bytes in/out
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    init_db()
+    # Development server; use `gunicorn -c gunicorn.conf.py wsgi:app` in production
+    create_app()
     print("🌶️ DoggieChef Backend Server Starting...")
     print("📸 Photo uploads will be stored in:", app.config['UPLOAD_FOLDER'])
     print("🌐 Server will run on: http://localhost:5001")
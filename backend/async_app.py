@@ -0,0 +1,281 @@
+"""asyncio variant of the recipe API, on aiohttp.
+
+Serves GET /api/recipes, GET /api/recipes/<id> and POST /api/recipes with the
+same parameters, responses and caching as app.py. Request bodies are read from
+the socket by the event loop and multipart photo parts are written to the
+spool as they arrive, so a slow mobile upload holds a coroutine rather than a
+thread. SQLite runs on a small dedicated thread pool (each thread keeps its
+warm connection), and photos are resized and stored by the same PhotoWorker.
+
+    python async_app.py                                   # port 5002
+    gunicorn 'async_app:create_app()' --worker-class aiohttp.GunicornWebWorker
+
+Route the read and upload paths here behind a proxy; everything else (photos,
+search, stats, ...) is still served by app.py.
+"""
+import asyncio
+import os
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from doggiechef import cache, db, encoding, jobs, logs, metrics, writer
+from doggiechef.multipart import CHUNK_SIZE, MAX_FIELD_SIZE, MultipartError, RequestTooLarge, UploadedFile
+from doggiechef.recipes import RecipeRepository, discard_spooled, parse_list_params, spool_photos
+from doggiechef.storage import create_storage
+
+# Configuration, shared with app.py
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads', 'recipes')
+VARIANT_FOLDER = os.path.join(UPLOAD_FOLDER, 'variants')
+SPOOL_FOLDER = os.path.join(os.path.dirname(UPLOAD_FOLDER), 'incoming')
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+# SQLite serializes writers anyway; a few threads let reads overlap a commit
+DB_THREADS = int(os.environ.get('DOGGIECHEF_DB_THREADS', '4'))
+
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(SPOOL_FOLDER, exist_ok=True)
+
+db.configure('recipes.db')
+logs.configure(format='text')
+
+photo_storage = create_storage('local', local={'folder': UPLOAD_FOLDER}, cloudinary={'folder': 'recipes'})
+photo_worker = jobs.PhotoWorker(photo_storage, variant_dir=VARIANT_FOLDER,
+                                max_workers=min(4, os.cpu_count() or 1))
+response_cache = cache.ResponseCache()
+# DOGGIECHEF_GROUP_COMMIT_MS merges concurrent writes into shared commits
+write_queue = writer.from_env()
+db_executor = ThreadPoolExecutor(DB_THREADS, thread_name_prefix='sqlite')
+
+# Per-request RequestTimer, set by the timing middleware
+TIMER = web.RequestKey('timer', metrics.RequestTimer)
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+}
+
+def error(status, message):
+    return web.json_response({'error': message}, status=status)
+
+async def run_db(request, work):
+    """Run work(repository) on the SQLite pool, adding its time to the request's 'db' phase"""
+    timer = request[TIMER]
+
+    def call():
+        started = loop.time()
+        try:
+            return work(RecipeRepository(db.get_connection(), storage=photo_storage, variant_dir=VARIANT_FOLDER,
+                                         writer=write_queue))
+        finally:
+            db.release()
+            timer.add('db', loop.time() - started)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, call)
+
+@web.middleware
+async def timing(request, handler):
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else 'unmatched'
+    request[TIMER] = timer = metrics.request(f"{request.method} {route}")
+    try:
+        response = await handler(request)
+    except web.HTTPException as e:
+        response = e
+    server_timing = timer.server_timing()
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    timer.finish(response.status, request.content_length, response.content_length)
+    if isinstance(response, web.HTTPException) and response.status >= 400:
+        raise response
+    return response
+
+async def cached_json(request, build):
+    """Answer from the response cache like app.py's cached_json; build(repository) returns (status, body, headers).
+
+    Encoding and compression happen on the SQLite pool too, keeping CPU work off the event loop.
+    """
+    key = (request.path, tuple(sorted(request.query.items())))
+    accept_encoding = request.headers.get('Accept-Encoding')
+
+    def lookup(repository):
+        version = cache.data_version(repository.conn)
+        entry = response_cache.get(key, version)
+        if entry is None:
+            status, body, headers = build(repository)
+            if status != 200:
+                return None, (status, body)
+            entry = response_cache.put(key, version, body, headers)
+        return entry, entry.encoded(accept_encoding)
+
+    entry, result = await run_db(request, lookup)
+    if entry is None:
+        status, body = result
+        return web.Response(body=body, status=status, content_type='application/json')
+    coding, body, etag = result
+    headers = dict(entry.headers)
+    headers.update({'ETag': etag, 'Cache-Control': cache.JSON_CACHE_CONTROL, 'Vary': 'Accept-Encoding'})
+    if cache.etag_matches(request.headers.get('If-None-Match'), etag):
+        return web.Response(status=304, headers=headers)
+    if coding:
+        headers['Content-Encoding'] = coding
+    return web.Response(body=body, headers=headers, content_type='application/json')
+
+async def get_recipes(request):
+    # Filter, pagination and projection parameters
+    try:
+        params = parse_list_params(request.query)
+    except ValueError as e:
+        return error(400, str(e))
+
+    def build(repository):
+        body, next_cursor = repository.list_json(**params)
+        headers = {}
+        if next_cursor:
+            headers = {'X-Next-Cursor': next_cursor, 'Access-Control-Expose-Headers': 'X-Next-Cursor'}
+        return 200, body, headers
+    return await cached_json(request, build)
+
+async def get_recipe(request):
+    recipe_id = int(request.match_info['recipe_id'])
+
+    def build(repository):
+        recipe = repository.get(recipe_id)
+        if recipe is None:
+            return 404, encoding.dumps({'error': 'Recipe not found'}), None
+        return 200, encoding.dumps(recipe), None
+    return await cached_json(request, build)
+
+async def read_recipe_form(request):
+    """Form fields and photo uploads, writing multipart file parts to SPOOL_FOLDER as they arrive"""
+    if request.content_type == 'application/json' or request.content_type.endswith('+json'):
+        # Like app.py's parse_recipe_form: a malformed body reads as empty and fails validation
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        return data if isinstance(data, dict) else {}, []
+    if request.content_type != 'multipart/form-data':
+        return dict(await request.post()), []
+    if (request.content_length or 0) > MAX_CONTENT_LENGTH:
+        raise RequestTooLarge(f'Request body exceeds {MAX_CONTENT_LENGTH} bytes')
+
+    loop = asyncio.get_running_loop()
+    fields = {}
+    uploads = []
+    received = 0
+    try:
+        reader = await request.multipart()
+        async for part in reader:
+            if part.filename is None:
+                value = bytearray()
+                while chunk := await part.read_chunk(CHUNK_SIZE):
+                    value += chunk
+                    if len(value) > MAX_FIELD_SIZE:
+                        raise RequestTooLarge(f'{part.name} exceeds {MAX_FIELD_SIZE} bytes')
+                fields[part.name] = value.decode('utf-8', 'replace')
+                continue
+            path = os.path.join(SPOOL_FOLDER, f"{uuid.uuid4().hex}{os.path.splitext(part.filename)[1].lower()}")
+            upload = UploadedFile(part.name, part.filename, part.headers.get('Content-Type'), path)
+            uploads.append(upload)
+            # Only the disk writes leave the event loop
+            f = await loop.run_in_executor(None, open, path, 'wb')
+            try:
+                while chunk := await part.read_chunk(CHUNK_SIZE):
+                    upload.size += len(chunk)
+                    received += len(chunk)
+                    if upload.size > MAX_CONTENT_LENGTH or received > MAX_CONTENT_LENGTH:
+                        raise RequestTooLarge(f'{part.filename} exceeds {MAX_CONTENT_LENGTH} bytes')
+                    await loop.run_in_executor(None, f.write, chunk)
+            finally:
+                await loop.run_in_executor(None, f.close)
+    except BaseException as e:
+        # Also when the client disconnects mid-upload and the handler is cancelled
+        for upload in uploads:
+            upload.discard()
+        if isinstance(e, ValueError) and not isinstance(e, MultipartError):
+            raise MultipartError(f'Invalid multipart body: {e}') from e
+        raise
+    return fields, [upload for upload in uploads if upload.name == 'photos']
+
+async def create_recipe(request):
+    log = logs.request('POST /api/recipes')
+    try:
+        log.debug("📝 Creating new recipe...")
+        try:
+            data, uploads = await read_recipe_form(request)
+        except MultipartError as e:
+            return error(413 if isinstance(e, RequestTooLarge) else 400, str(e))
+
+        # Field names only; the submitted values can be long and are not worth a log line each
+        log.debug("📋 Form data", lambda: {'fields': sorted(data), 'files': len(uploads)})
+
+        # Photos are already spooled to disk; resizing and storage happen in the photo worker
+        spooled_photos = spool_photos(uploads)
+        try:
+            recipe_id, job_ids = await run_db(request, lambda repository: repository.create(data, spooled_photos))
+        except ValueError as e:
+            discard_spooled(spooled_photos)
+            return error(400, str(e))
+
+        log.info(f"✅ Recipe created successfully with ID: {recipe_id}")
+        if job_ids:
+            photo_worker.notify()
+            return web.json_response({
+                'id': recipe_id,
+                'message': 'Recipe created successfully, photos are processing',
+                'photo_jobs': job_ids
+            }, status=202)
+        return web.json_response({'id': recipe_id, 'message': 'Recipe created successfully'}, status=201)
+
+    except Exception as e:
+        log.error("❌ Error creating recipe", e, {"error_type": type(e).__name__})
+        return error(500, 'Internal server error')
+
+async def preflight(request):
+    return web.Response(headers=CORS_HEADERS)
+
+async def readiness(request):
+    try:
+        await run_db(request, lambda repository: cache.data_version(repository.conn))
+    except Exception as e:
+        logs.error("GET /api/ready: database unavailable", e, {"error_type": type(e).__name__})
+        return web.json_response({'status': 'unavailable'}, status=503)
+    return web.json_response({'status': 'ready'})
+
+async def start_background(app):
+    # Schema work and requeueing stale jobs touch SQLite, so they run on its pool
+    await asyncio.get_running_loop().run_in_executor(db_executor, db.init_db)
+    photo_worker.start()
+
+async def stop_background(app):
+    # aiohttp has already let in-flight requests finish; give running photo jobs a moment too
+    await asyncio.get_running_loop().run_in_executor(None, photo_worker.drain, 20)
+    photo_worker.stop(wait=False)
+    db_executor.shutdown(wait=True)
+    if write_queue is not None:
+        write_queue.stop()
+
+def create_app(config=None):
+    """The aiohttp application; `config` may set DATABASE, like app.create_app()"""
+    if config and config.get('DATABASE'):
+        db.configure(config['DATABASE'])
+    app = web.Application(middlewares=[timing], client_max_size=MAX_CONTENT_LENGTH)
+    app.router.add_get('/api/recipes', get_recipes)
+    app.router.add_post('/api/recipes', create_recipe)
+    app.router.add_get(r'/api/recipes/{recipe_id:\d+}', get_recipe)
+    app.router.add_route('OPTIONS', '/api/recipes', preflight)
+    app.router.add_route('OPTIONS', r'/api/recipes/{recipe_id:\d+}', preflight)
+    app.router.add_get('/api/ready', readiness)
+    app.on_startup.append(start_background)
+    app.on_cleanup.append(stop_background)
+    return app
+
+if __name__ == '__main__':
+    print("🌶️ DoggieChef async backend starting on http://localhost:5002")
+    web.run_app(create_app(), port=5002)
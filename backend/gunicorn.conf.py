@@ -0,0 +1,71 @@
+"""gunicorn settings for the Flask backend: gunicorn -c backend/gunicorn.conf.py
+
+One process per core, each with a few threads: requests mostly wait on
+SQLite, disk and Cloudinary, while SQLite takes one writer at a time, so more
+processes only add lock contention. WEB_CONCURRENCY, DOGGIECHEF_THREADS,
+DOGGIECHEF_GRACEFUL_TIMEOUT and PORT override the defaults.
+
+On SIGTERM each worker stops accepting connections, /api/ready starts
+answering 503, in-flight requests (uploads included) finish, and then the
+photo jobs in flight get the rest of the graceful timeout.
+
+Workers add their metrics up in DOGGIECHEF_METRICS_DIR (by default a
+directory in the system temp folder named after the port), which is emptied
+when gunicorn starts.
+"""
+import multiprocessing
+import os
+import tempfile
+import time
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = 'wsgi:app'
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+# Set before the workers are forked, so each of them imports doggiechef.metrics with it
+os.environ.setdefault('DOGGIECHEF_METRICS_DIR',
+                      os.path.join(tempfile.gettempdir(), f"doggiechef-metrics-{os.environ.get('PORT', '5001')}"))
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('DOGGIECHEF_THREADS', '4'))
+# Each worker opens its own SQLite connections and photo threads after the fork
+preload_app = False
+
+# Slow phones upload photos over mobile networks
+timeout = 120
+graceful_timeout = int(os.environ.get('DOGGIECHEF_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+_term_received = None
+
+
+def on_starting(server):
+    """Drop the metrics of a previous run, whose counters would otherwise be added to this one's"""
+    directory = os.environ['DOGGIECHEF_METRICS_DIR']
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+
+
+def post_worker_init(worker):
+    """Mark the app as draining as soon as the worker is asked to stop"""
+    import signal
+    import app as backend
+
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        global _term_received
+        _term_received = time.monotonic()
+        backend.draining.set()
+        handle_exit(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    """Give in-flight photo jobs what is left of the graceful timeout"""
+    import app as backend
+
+    elapsed = time.monotonic() - _term_received if _term_received else 0
+    backend.shutdown(timeout=max(1.0, graceful_timeout - elapsed - 1))
@@ -0,0 +1,14 @@
+"""Production entry point for the Flask backend.
+
+    gunicorn -c backend/gunicorn.conf.py
+
+gunicorn.conf.py loads `wsgi:app` from this directory. Other WSGI servers can
+load it the same way (e.g. `uvicorn --interface wsgi wsgi:app`), or call
+create_app() with their own config.
+"""
+import os
+
+from app import create_app
+
+# Absolute, so the database does not depend on the server's working directory
+app = create_app({'DATABASE': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recipes.db')})
@@ -0,0 +1,109 @@
+"""Cold-start benchmark for the Vercel Python functions.
+
+Each run starts a fresh interpreter against an empty database in a new temp
+directory, like a function instance on a new /tmp, and reports the median of:
+
+  process   wall time of the whole interpreter, startup included
+  import    loading the api/<name>.py module
+  init db   first db.get_connection(): snapshot copy or schema creation
+  query     the function's first query on the warm connection
+
+Usage:
+    python benchmarks/cold_start.py [--runs 15] [--no-snapshot] [--importtime [NAME]]
+
+--importtime prints the slowest imports of one function (default: recipes)
+as reported by `python -X importtime`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS = ('recipes', 'filters', 'stats', 'search', 'pantry')
+
+CHILD = '''
+import importlib.util, json, sys, time
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location({name!r}, {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+
+from doggiechef import db
+if {no_snapshot!r}:
+    db.SNAPSHOT_PATH = ''
+conn = db.get_connection()
+connected = time.perf_counter()
+
+conn.execute('SELECT * FROM recipes ORDER BY created_at DESC, id DESC LIMIT 20').fetchall()
+conn.execute('SELECT facet, value, count FROM recipe_facets').fetchall()
+queried = time.perf_counter()
+
+print(json.dumps({{
+    'import': imported - started,
+    'init db': connected - imported,
+    'query': queried - connected,
+}}))
+'''
+
+
+def run_once(name, no_snapshot, extra_args=()):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DOGGIECHEF_DB_PATH=os.path.join(tmp, 'recipes.db'))
+        code = CHILD.format(name=name, path=os.path.join(ROOT, 'api', f'{name}.py'), no_snapshot=no_snapshot)
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, *extra_args, '-c', code], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True)
+        elapsed = time.perf_counter() - started
+    return result, elapsed
+
+
+def measure(name, runs, no_snapshot):
+    samples = []
+    for _ in range(runs):
+        result, elapsed = run_once(name, no_snapshot)
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        timings['process'] = elapsed
+        samples.append(timings)
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+
+def report_importtime(name, no_snapshot, top=20):
+    result, _ = run_once(name, no_snapshot, ('-X', 'importtime'))
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, module = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), int(own), module.rstrip()))
+    print(f"\nSlowest imports of api/{name}.py (microseconds)")
+    print(f"{'cumulative':>10} {'self':>8}  module")
+    for cumulative, own, module in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative:>10} {own:>8}  {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--no-snapshot', action='store_true', help='create the schema instead of copying schema.db')
+    parser.add_argument('--importtime', nargs='?', const='recipes', choices=FUNCTIONS)
+    args = parser.parse_args()
+
+    columns = ('process', 'import', 'init db', 'query')
+    print(f"Median of {args.runs} cold starts{' without the schema snapshot' if args.no_snapshot else ''} (ms)")
+    print(f"{'function':<10}" + ''.join(f'{column:>10}' for column in columns))
+    for name in FUNCTIONS:
+        timings = measure(name, args.runs, args.no_snapshot)
+        print(f"{name:<10}" + ''.join(f'{timings[column] * 1000:>10.1f}' for column in columns))
+
+    if args.importtime:
+        report_importtime(args.importtime, args.no_snapshot)
+
+
+if __name__ == '__main__':
+    main()
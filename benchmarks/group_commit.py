@@ -0,0 +1,103 @@
+"""Recipe write throughput: a commit per write versus group commit.
+
+Each run creates recipes from a number of concurrent threads against a new
+database in a temp directory, first with RecipeRepository committing every
+create on its own (the default), then through a GroupCommitWriter, and
+reports writes per second and latency percentiles for both.
+
+Usage:
+    python benchmarks/group_commit.py [--threads 16] [--writes 4000] [--window-ms 2]
+                                      [--synchronous NORMAL|FULL]
+
+--synchronous FULL makes every commit fsync the WAL, as on a database where
+durability across power loss matters; the default NORMAL is what db.py uses.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from doggiechef import db  # noqa: E402
+from doggiechef.recipes import RecipeRepository  # noqa: E402
+from doggiechef.writer import GroupCommitWriter  # noqa: E402
+
+RECIPE = {
+    'title': 'Pad Kra Pao',
+    'description': 'Holy basil stir-fry',
+    'country': 'Thailand',
+    'protein_type': 'Pork',
+    'cooking_time': '15',
+    'difficulty': 'Easy',
+    'ingredients': '300g minced pork\n4 cloves garlic\n2 cups holy basil\n1 tbsp fish sauce',
+}
+
+
+def run(threads, writes, writer=None):
+    """Create `writes` recipes from `threads` threads; returns (seconds, per-write latencies)"""
+    latencies = []
+    lock = threading.Lock()
+    per_thread = writes // threads
+    start = threading.Barrier(threads + 1)
+
+    def work():
+        repository = RecipeRepository(db.get_connection(), writer=writer)
+        mine = []
+        start.wait()
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            repository.create(RECIPE)
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+        db.close_connections()
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started, latencies
+
+
+def report(label, seconds, latencies):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:<16} {len(latencies) / seconds:>10.0f} writes/s   p50 {p50:6.2f}ms   p99 {p99:6.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--writes', type=int, default=4000)
+    parser.add_argument('--window-ms', type=float, default=2.0, help='group commit window (default: %(default)s)')
+    parser.add_argument('--synchronous', choices=('NORMAL', 'FULL'), default='NORMAL')
+    args = parser.parse_args()
+
+    db.PRAGMAS = tuple(p for p in db.PRAGMAS if 'synchronous' not in p) + (
+        f'PRAGMA synchronous = {args.synchronous}',)
+    print(f"{args.writes} creates from {args.threads} threads, synchronous={args.synchronous}")
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(os.path.join(tmp, 'per-write.db'))
+        db.init_db()
+        report('commit per write', *run(args.threads, args.writes))
+
+        db.configure(os.path.join(tmp, 'group.db'))
+        db.init_db()
+        writer = GroupCommitWriter(window=args.window_ms / 1000)
+        seconds, latencies = run(args.threads, args.writes, writer)
+        writer.stop()
+        report('group commit', seconds, latencies)
+        print(f"{'':<16} {writer.writes / writer.batches:>10.1f} writes per commit")
+
+
+if __name__ == '__main__':
+    main()
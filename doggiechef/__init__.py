@@ -0,0 +1 @@
+"""Shared recipe code used by both the Flask backend and the Vercel functions"""
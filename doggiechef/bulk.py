@@ -0,0 +1,279 @@
+"""Bulk recipe import from NDJSON or CSV.
+
+Records are validated with the same rules as a single create, then written
+BATCH_SIZE at a time: one transaction per batch, with the recipe rows in a
+single executemany() (a single COPY on PostgreSQL). Photos named by a
+record are copied into the spool directory and queued as photo jobs in the
+same transaction, for a PhotoWorker pool to resize and store.
+
+Each batch also commits how many input records have been processed under
+the import's id, so running the same import again (after a crash, or
+Ctrl-C) skips straight past what is already in the database. The id
+defaults to a hash of the input file.
+
+    python -m doggiechef.bulk recipes.ndjson --photos ./photos [--db recipes.db]
+"""
+import csv
+import io
+import json
+import os
+import shutil
+import time
+import uuid
+
+from werkzeug.utils import secure_filename
+
+from doggiechef import db, ingredients, jobs
+from doggiechef.recipes import INSERT_RECIPE, RECIPE_COLUMNS, allowed_file, validate_recipe
+
+BATCH_SIZE = 500
+FORMATS = ('ndjson', 'csv')
+# Separates photo filenames in a CSV photos column
+CSV_PHOTO_SEPARATOR = '|'
+
+
+def detect_format(name, content_type=None):
+    """'csv' or 'ndjson' from a filename or Content-Type"""
+    if (content_type and 'csv' in content_type) or (name and name.lower().endswith('.csv')):
+        return 'csv'
+    return 'ndjson'
+
+
+def read_records(stream, format):
+    """Yield (line_number, record) from a binary NDJSON or CSV stream; record is a ValueError if unparseable"""
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if format == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            photos = record.get('photos') or ''
+            record['photos'] = [name.strip() for name in photos.split(CSV_PHOTO_SEPARATOR) if name.strip()]
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError('each line must be a JSON object')
+        except ValueError as e:
+            record = ValueError(f'Invalid JSON: {e}')
+        yield line_number, record
+
+
+def file_digest(path):
+    """Default import id: a hash of the input, so re-running the same file resumes it"""
+    import hashlib
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def directory_photos(photo_dir):
+    """Resolve photo names against a directory, refusing anything outside it"""
+    root = os.path.realpath(photo_dir)
+
+    def resolve(name):
+        path = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            return None
+        return path
+    return resolve
+
+
+class BulkImporter:
+    """Imports batches of records on one connection.
+
+    `photo_source` maps a photo name from a record to a readable file path (or
+    None if missing); accepted photos are copied to `spool_dir` and queued.
+    """
+
+    def __init__(self, conn, photo_source=None, spool_dir=None, batch_size=BATCH_SIZE):
+        self.conn = conn
+        self.photo_source = photo_source
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+
+    def progress(self, import_id):
+        row = self.conn.execute('SELECT * FROM bulk_imports WHERE import_id = ?', (import_id,)).fetchone()
+        return dict(row) if row else None
+
+    def run(self, records, import_id, on_batch=None):
+        """Import (line_number, record) pairs; returns a report with counts, failures and throughput.
+
+        `on_batch(report)` is called after each committed batch, e.g. to print progress.
+        """
+        started = time.perf_counter()
+        with db.transaction(self.conn):
+            self.conn.execute('INSERT INTO bulk_imports (import_id) VALUES (?) ON CONFLICT DO NOTHING', (import_id,))
+        done = self.progress(import_id)['records_done']
+        report = {'import_id': import_id, 'resumed_after': done, 'processed': 0, 'created': 0,
+                  'failed': [], 'photo_jobs': []}
+
+        batch = []
+        for position, (line_number, record) in enumerate(records, 1):
+            if position <= done:
+                continue
+            batch.append((line_number, record))
+            if len(batch) >= self.batch_size:
+                self._write_batch(import_id, done + report['processed'] + len(batch), batch, report)
+                report['processed'] += len(batch)
+                batch = []
+                if on_batch:
+                    on_batch(report)
+        if batch:
+            self._write_batch(import_id, done + report['processed'] + len(batch), batch, report)
+            report['processed'] += len(batch)
+            if on_batch:
+                on_batch(report)
+        with db.transaction(self.conn):
+            self.conn.execute('UPDATE bulk_imports SET finished_at = CURRENT_TIMESTAMP WHERE import_id = ?',
+                              (import_id,))
+
+        seconds = time.perf_counter() - started
+        report['seconds'] = round(seconds, 3)
+        report['recipes_per_second'] = round(report['created'] / seconds, 1) if seconds else None
+        return report
+
+    def _prepare(self, record):
+        """Column values and photo paths for one record; raises ValueError"""
+        if isinstance(record, Exception):
+            raise record
+        values = validate_recipe(record)
+        photos = record.get('photos') or []
+        if isinstance(photos, str):
+            photos = [photos]
+        paths = []
+        for name in photos:
+            if not allowed_file(name):
+                raise ValueError(f'Unsupported photo type: {name}')
+            path = self.photo_source(name) if self.photo_source else None
+            if path is None:
+                raise ValueError(f'Photo not found: {name}')
+            paths.append((path, secure_filename(os.path.basename(name))))
+        return values, paths
+
+    def _write_batch(self, import_id, records_done, batch, report):
+        valid = []
+        for line_number, record in batch:
+            try:
+                valid.append((record, *self._prepare(record)))
+            except ValueError as e:
+                report['failed'].append({'line': line_number, 'error': str(e)})
+
+        spooled = []
+        try:
+            # Spool before the transaction so the write lock is not held during file copies
+            for _, _, photos in valid:
+                spooled.append([(self._spool(path), f"{uuid.uuid4()}_{name}") for path, name in photos])
+
+            with db.transaction(self.conn):
+                recipe_ids = self._insert_recipes([values for _, values, _ in valid])
+                for recipe_id, (record, _, _), uploads in zip(recipe_ids, valid, spooled):
+                    ingredients.index_recipe(self.conn, recipe_id, record.get('ingredients'))
+                    report['photo_jobs'].extend(jobs.enqueue(self.conn, recipe_id, uploads))
+                self.conn.execute('''
+                    UPDATE bulk_imports
+                    SET records_done = ?, recipes_created = recipes_created + ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE import_id = ?
+                ''', (records_done, len(valid), import_id))
+        except BaseException:
+            for uploads in spooled:
+                for path, _ in uploads:
+                    if os.path.exists(path):
+                        os.remove(path)
+            raise
+        report['created'] += len(valid)
+
+    def _insert_recipes(self, rows):
+        """Insert recipe rows, returning their ids in order"""
+        if getattr(self.conn, 'dialect', None) == 'postgres':
+            # Other writers run concurrently there, so the ids are reserved first and COPYed with the rows
+            recipe_ids = self.conn.reserve_ids('recipes', len(rows))
+            self.conn.copy_rows('recipes', ('id',) + RECIPE_COLUMNS,
+                                [(recipe_id,) + values for recipe_id, values in zip(recipe_ids, rows)])
+            return recipe_ids
+        # Holding the write lock, the AUTOINCREMENT ids of one executemany() are consecutive
+        before = self._last_id()
+        self.conn.executemany(INSERT_RECIPE, rows)
+        recipe_ids = range(before + 1, self._last_id() + 1)
+        if len(recipe_ids) != len(rows):
+            raise RuntimeError('recipe ids of the batch are not consecutive')
+        return recipe_ids
+
+    def _last_id(self):
+        row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'recipes'").fetchone()
+        return row['seq'] if row else 0
+
+    def _spool(self, path):
+        """Copy (or hard-link) a source photo into the spool; the worker deletes its copy when done"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        target = os.path.join(self.spool_dir, f'import-{uuid.uuid4().hex}{os.path.splitext(path)[1]}')
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copyfile(path, target)
+        return target
+
+
+def main():
+    import argparse
+    from doggiechef.storage import create_storage
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    uploads = os.path.join(root, 'uploads', 'recipes')
+    parser = argparse.ArgumentParser(description='Bulk import recipes from NDJSON or CSV')
+    parser.add_argument('file')
+    parser.add_argument('--format', choices=FORMATS, help='default: from the file extension')
+    parser.add_argument('--photos', help='directory the records\' photo names are relative to')
+    parser.add_argument('--db', default='backend/recipes.db', help='database path (default: %(default)s)')
+    parser.add_argument('--uploads', default=uploads, help='photo storage directory (default: %(default)s)')
+    parser.add_argument('--import-id', help='resume key (default: a hash of the file)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help='photo processing threads')
+    args = parser.parse_args()
+
+    db.configure(args.db)
+    conn = db.get_connection()
+    import_id = args.import_id or file_digest(args.file)
+    importer = BulkImporter(conn, photo_source=directory_photos(args.photos) if args.photos else None,
+                            spool_dir=os.path.join(os.path.dirname(args.uploads), 'incoming'),
+                            batch_size=args.batch_size)
+    previous = importer.progress(import_id)
+    if previous and previous['records_done']:
+        print(f"⏩ Resuming import {import_id} after {previous['records_done']} records")
+
+    def show(report):
+        print(f"📥 {report['resumed_after'] + report['processed']} records, {report['created']} created, "
+              f"{len(report['failed'])} failed", flush=True)
+
+    with open(args.file, 'rb') as f:
+        report = importer.run(read_records(f, args.format or detect_format(args.file)), import_id, on_batch=show)
+    for failure in report['failed']:
+        print(f"❌ Line {failure['line']}: {failure['error']}")
+    print(f"✅ Imported {report['created']} recipes in {report['seconds']}s "
+          f"({report['recipes_per_second']} recipes/s)")
+
+    if report['photo_jobs']:
+        storage = create_storage('local', local={'folder': args.uploads}, cloudinary={'folder': 'recipes'})
+        worker = jobs.PhotoWorker(storage, variant_dir=os.path.join(args.uploads, 'variants'),
+                                  max_workers=args.workers)
+        started = time.perf_counter()
+        results = worker.run_jobs(report['photo_jobs'])
+        seconds = time.perf_counter() - started
+        done = sum(1 for result in results if result['status'] == 'done')
+        print(f"📸 Processed {done}/{len(results)} photos in {seconds:.1f}s ({done / seconds:.1f} photos/s)")
+        retrying = sum(1 for result in results if result['status'] == 'retrying')
+        if retrying:
+            # Their retry delay outlasts this command; the app's photo worker picks them up
+            print(f"🔁 {retrying} photos failed and are queued for a retry in {jobs.RETRY_DELAY_SECONDS}s")
+        worker.stop()
+
+
+if __name__ == '__main__':
+    main()
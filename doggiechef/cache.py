@@ -0,0 +1,132 @@
+"""In-process response cache and HTTP validators for the read endpoints.
+
+Cached bodies are tagged with the database's data version, a counter that
+triggers bump on every write to recipes, recipe_photos and photo_jobs (see
+db.py). A lookup only hits when the version still matches, so a write from
+any process or thread invalidates every cached response at once without
+tracking which keys it affected. Entries also expire after a TTL and the
+least recently used ones are evicted beyond a fixed count. Compressed
+variants of a body are built on first request and kept with its entry.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from doggiechef import encoding
+
+MAX_ENTRIES = 256
+TTL_SECONDS = 300
+# Clients may keep JSON but must revalidate it with the ETag before use
+JSON_CACHE_CONTROL = 'no-cache'
+# Uploaded photos have UUID names and never change once written
+PHOTO_MAX_AGE = 365 * 24 * 3600
+
+
+def data_version(conn):
+    return conn.execute('SELECT version FROM data_version').fetchone()['version']
+
+
+def make_etag(body):
+    """Strong ETag for a response body"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header lists `etag` (weak comparison, per RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in [tag[2:] if tag.startswith('W/') else tag for tag in candidates]
+
+
+class CachedResponse:
+    """A serialized 200 response body plus the headers that vary with it"""
+
+    def __init__(self, version, body, headers=None):
+        self.version = version
+        self.body = body
+        self.headers = headers or {}
+        self.etag = make_etag(body)
+        self.expires = time.monotonic() + TTL_SECONDS
+        self._variants = {}
+
+    def encoded(self, accept_encoding):
+        """(content_coding, body, etag) for a request's Accept-Encoding; content_coding is None for identity.
+
+        Each coding gets its own strong ETag, since its bytes differ.
+        """
+        coding = encoding.negotiate(accept_encoding)
+        if coding is None or len(self.body) < encoding.MIN_COMPRESS_SIZE:
+            return None, self.body, self.etag
+        variant = self._variants.get(coding)
+        if variant is None:
+            variant = self._variants[coding] = (coding, encoding.compress(self.body, coding),
+                                                f'{self.etag[:-1]}-{coding}"')
+        return variant
+
+
+class ResponseCache:
+    """Thread-safe LRU of CachedResponse keyed by route and query parameters"""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.version != version or entry.expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, body, headers=None):
+        entry = CachedResponse(version, body, headers)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def send_entry(handler, entry, headers=None):
+    """Write a cached JSON response, or a 304, from a BaseHTTPRequestHandler.
+
+    Returns (status, body) with the bytes actually sent, None for a 304.
+
+    `headers` are per-request extras such as Server-Timing, which must not be cached with the entry.
+    """
+    coding, body, etag = entry.encoded(handler.headers.get('Accept-Encoding'))
+    not_modified = etag_matches(handler.headers.get('If-None-Match'), etag)
+    handler.send_response(304 if not_modified else 200)
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    handler.send_header('ETag', etag)
+    handler.send_header('Cache-Control', JSON_CACHE_CONTROL)
+    handler.send_header('Vary', 'Accept-Encoding')
+    for name, value in entry.headers.items():
+        handler.send_header(name, value)
+    for name, value in (headers or {}).items():
+        if value is not None:
+            handler.send_header(name, value)
+    if not_modified:
+        handler.end_headers()
+        return 304, None
+    handler.send_header('Content-Type', 'application/json')
+    if coding:
+        handler.send_header('Content-Encoding', coding)
+    handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+    return 200, body
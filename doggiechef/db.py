@@ -0,0 +1,391 @@
+"""SQLite connection manager shared by every entry point.
+
+Connections are opened once per thread and kept warm for the life of the
+process, and the schema is created once per database path, so a warm request
+does no schema work and no connect calls.
+
+Several processes (gunicorn workers, the bulk importer) can write to one
+database: WAL lets readers run alongside the writer, a busy timeout makes a
+writer wait for the lock instead of failing, and transaction() serializes
+writers, queueing this process's threads on a lock and taking SQLite's write
+lock up front with BEGIN IMMEDIATE.
+
+A new database starts as a copy of schema.db, a pre-built empty database, so
+a cold start on a fresh /tmp copies one small file instead of running every
+CREATE statement and migration. Rebuild it after changing the schema with:
+    python -m doggiechef.db
+
+With DOGGIECHEF_SNAPSHOT_URL set, get_read_connection() reads a published
+read-only snapshot of the primary database instead (see snapshot.py).
+
+With DOGGIECHEF_DATABASE_URL set to a postgresql:// URL, every connection
+comes from a PostgreSQL pool instead, and the SQLite path and schema are not
+used (see postgres.py).
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager, nullcontext
+
+from doggiechef import facets, ingredients, logs, metrics, photos, search
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS recipes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        country TEXT NOT NULL,
+        protein_type TEXT NOT NULL,
+        cooking_time INTEGER,
+        difficulty TEXT,
+        ingredients TEXT,
+        photos TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Keyset pagination indexes: each page is a bounded range scan on (created_at, id)
+    CREATE INDEX IF NOT EXISTS idx_recipes_created ON recipes (created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_recipes_country_created ON recipes (country, created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_recipes_protein_created ON recipes (protein_type, created_at, id);
+
+    CREATE TABLE IF NOT EXISTS recipe_photos (
+        recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        url TEXT NOT NULL,
+        width INTEGER,
+        height INTEGER,
+        bytes INTEGER,
+        PRIMARY KEY (recipe_id, position)
+    ) WITHOUT ROWID;
+    -- Reference counts of content-addressed photos shared between recipes (see storage.py)
+    CREATE INDEX IF NOT EXISTS idx_recipe_photos_url ON recipe_photos (url);
+
+    -- Resized variants of locally stored uploads, keyed by the original's filename
+    CREATE TABLE IF NOT EXISTS photo_variants (
+        filename TEXT NOT NULL,
+        width INTEGER NOT NULL,
+        format TEXT NOT NULL,
+        height INTEGER NOT NULL,
+        bytes INTEGER NOT NULL,
+        PRIMARY KEY (filename, width, format)
+    ) WITHOUT ROWID;
+
+    -- Durable queue of uploads waiting to be resized and stored (see jobs.py)
+    CREATE TABLE IF NOT EXISTS photo_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        source_path TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        not_before TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_photo_jobs_status ON photo_jobs (status, id);
+    CREATE INDEX IF NOT EXISTS idx_photo_jobs_recipe ON photo_jobs (recipe_id);
+
+    -- Full-text index over recipes, kept in sync by triggers (see search.py)
+    CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5 (
+        title, description, ingredients,
+        content = 'recipes', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+    CREATE TRIGGER IF NOT EXISTS recipes_fts_insert AFTER INSERT ON recipes BEGIN
+        INSERT INTO recipes_fts (rowid, title, description, ingredients)
+        VALUES (new.id, new.title, new.description, new.ingredients);
+    END;
+    CREATE TRIGGER IF NOT EXISTS recipes_fts_delete AFTER DELETE ON recipes BEGIN
+        INSERT INTO recipes_fts (recipes_fts, rowid, title, description, ingredients)
+        VALUES ('delete', old.id, old.title, old.description, old.ingredients);
+    END;
+    CREATE TRIGGER IF NOT EXISTS recipes_fts_update AFTER UPDATE OF title, description, ingredients ON recipes BEGIN
+        INSERT INTO recipes_fts (recipes_fts, rowid, title, description, ingredients)
+        VALUES ('delete', old.id, old.title, old.description, old.ingredients);
+        INSERT INTO recipes_fts (rowid, title, description, ingredients)
+        VALUES (new.id, new.title, new.description, new.ingredients);
+    END;
+
+    -- Inverted ingredient index parsed from recipes.ingredients (see ingredients.py)
+    CREATE TABLE IF NOT EXISTS ingredients (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS recipe_ingredients (
+        recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        ingredient_id INTEGER NOT NULL REFERENCES ingredients (id),
+        quantity REAL,
+        unit TEXT,
+        raw TEXT NOT NULL,
+        PRIMARY KEY (recipe_id, position)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_ingredient ON recipe_ingredients (ingredient_id, recipe_id);
+
+    -- Bumped by every write that changes an API response; cached responses are tagged with it (see cache.py)
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO data_version (id, version) VALUES (0, 0);
+    CREATE TRIGGER IF NOT EXISTS recipes_version_insert AFTER INSERT ON recipes BEGIN
+        UPDATE data_version SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS recipes_version_update AFTER UPDATE ON recipes BEGIN
+        UPDATE data_version SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS recipes_version_delete AFTER DELETE ON recipes BEGIN
+        UPDATE data_version SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS recipe_photos_version_insert AFTER INSERT ON recipe_photos BEGIN
+        UPDATE data_version SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS recipe_photos_version_update AFTER UPDATE ON recipe_photos BEGIN
+        UPDATE data_version SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS recipe_photos_version_delete AFTER DELETE ON recipe_photos BEGIN
+        UPDATE data_version SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS photo_jobs_version_insert AFTER INSERT ON photo_jobs BEGIN
+        UPDATE data_version SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS photo_jobs_version_update AFTER UPDATE ON photo_jobs BEGIN
+        UPDATE data_version SET version = version + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS photo_jobs_version_delete AFTER DELETE ON photo_jobs BEGIN
+        UPDATE data_version SET version = version + 1;
+    END;
+
+    -- Progress of each bulk import, committed with every batch so a rerun resumes (see bulk.py)
+    CREATE TABLE IF NOT EXISTS bulk_imports (
+        import_id TEXT PRIMARY KEY,
+        records_done INTEGER NOT NULL DEFAULT 0,
+        recipes_created INTEGER NOT NULL DEFAULT 0,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP
+    );
+'''
+
+
+def _add_job_retry_delay(conn):
+    """Add photo_jobs.not_before to databases created before failed jobs waited to be retried"""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(photo_jobs)')]
+    if 'not_before' not in columns:
+        conn.execute('ALTER TABLE photo_jobs ADD COLUMN not_before TIMESTAMP')
+
+
+# Data migrations, applied in order and tracked with PRAGMA user_version
+MIGRATIONS = (
+    photos.migrate_legacy_photos,
+    search.rebuild_index,
+    ingredients.reindex_all,
+    facets.rebuild,
+    _add_job_retry_delay,
+    # Names parsed before size and preparation words were dropped ("large egg")
+    ingredients.reindex_all,
+)
+
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA mmap_size = 268435456',  # 256MB
+    'PRAGMA cache_size = -16000',  # 16MB
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA foreign_keys = ON',
+)
+
+# Seconds a writer waits for another connection's write lock before raising "database is locked"
+BUSY_TIMEOUT = float(os.environ.get('DOGGIECHEF_BUSY_TIMEOUT', '10'))
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.db')
+# Stored as PRAGMA application_id: a database carrying it (and the last migration) is up to date
+SCHEMA_ID = zlib.crc32((SCHEMA + facets.SCHEMA).encode()) & 0x7fffffff
+
+_db_path = os.environ.get('DOGGIECHEF_DB_PATH')
+DATABASE_URL = os.environ.get('DOGGIECHEF_DATABASE_URL') or None
+if DATABASE_URL and not DATABASE_URL.startswith(('postgres://', 'postgresql://')):
+    raise ValueError('DOGGIECHEF_DATABASE_URL must be a postgresql:// URL')
+# Directory or http(s) URL of published read-only snapshots, for the serverless GET functions
+READ_SNAPSHOT_URL = os.environ.get('DOGGIECHEF_SNAPSHOT_URL')
+_local = threading.local()
+_schema_lock = threading.Lock()
+_initialized = set()
+# Threads of one process take turns at writing here rather than in SQLite's busy handler, which polls
+_write_lock = threading.RLock()
+
+
+def configure(path):
+    """Set the default database path unless DOGGIECHEF_DB_PATH overrides it"""
+    global _db_path
+    if not os.environ.get('DOGGIECHEF_DB_PATH'):
+        _db_path = path
+
+
+def get_db_path():
+    return _db_path or 'recipes.db'
+
+
+def _connect(path):
+    # Room for every fixed statement (see recipes.py) to stay prepared on a warm connection
+    # While metrics are on, statements run during a timed request are counted and timed
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, cached_statements=256, factory=metrics.connection_factory())
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def init_db(path=None):
+    """Create the schema once per process for the given database"""
+    if DATABASE_URL:
+        from doggiechef import postgres
+        postgres.get_pool(DATABASE_URL)
+        return
+    path = path or get_db_path()
+    if path in _initialized:
+        return
+    with _schema_lock:
+        if path in _initialized:
+            return
+        if not os.path.exists(path):
+            _restore_snapshot(path)
+        conn = get_connection(path, init=False)
+        if not _schema_current(conn):
+            _create_schema(conn)
+        _initialized.add(path)
+
+
+def _schema_current(conn):
+    return (conn.execute('PRAGMA application_id').fetchone()[0] == SCHEMA_ID
+            and conn.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS))
+
+
+def _create_schema(conn):
+    conn.executescript(SCHEMA)
+    conn.executescript(facets.SCHEMA)
+    _migrate(conn)
+    conn.execute(f'PRAGMA application_id = {SCHEMA_ID}')
+
+
+def _migrate(conn):
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS, 1):
+        if version < number:
+            with conn:
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {number}')
+
+
+def _restore_snapshot(path):
+    """Start a new database from schema.db; a stale snapshot is brought up to date by init_db"""
+    if not os.path.exists(SNAPSHOT_PATH):
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    shutil.copyfile(SNAPSHOT_PATH, temp_path)
+    try:
+        # link() fails if another process created the database first, unlike a rename
+        os.link(temp_path, path)
+    except OSError:
+        pass
+    finally:
+        os.remove(temp_path)
+
+
+def build_snapshot(path=SNAPSHOT_PATH):
+    """Write an empty, fully migrated database to `path`"""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    _create_schema(conn)
+    conn.execute('VACUUM')
+    conn.close()
+
+
+def get_connection(path=None, init=True):
+    """Return this thread's warm connection, opening it on first use"""
+    if DATABASE_URL and path is None:
+        from doggiechef import postgres
+        return postgres.get_connection(DATABASE_URL)
+    path = path or get_db_path()
+    # Before connecting, so a new database can still be restored from the snapshot
+    if init and path not in _initialized:
+        init_db(path)
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = _connect(path)
+    return conn
+
+
+def get_read_connection():
+    """A connection for read-only requests: the current snapshot if one is configured, else get_connection()"""
+    if READ_SNAPSHOT_URL:
+        from doggiechef import snapshot
+        return snapshot.get_connection(READ_SNAPSHOT_URL)
+    return get_connection()
+
+
+@contextmanager
+def transaction(conn=None):
+    """Run a block as one write transaction, committed on success and rolled back on error.
+
+    BEGIN IMMEDIATE takes the write lock before the block reads anything, so
+    checks like "does this recipe exist" hold until the commit, and a writer in
+    another process makes this one wait (up to BUSY_TIMEOUT) instead of failing
+    when a deferred read transaction tries to upgrade. Nested calls join the
+    outer transaction. PostgreSQL locks rows rather than the database, so its
+    writers are not serialized here.
+    """
+    conn = conn or get_connection()
+    with nullcontext() if getattr(conn, 'dialect', None) == 'postgres' else _write_lock:
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def release():
+    """Roll back anything a failed request left uncommitted; the connection stays open.
+
+    A PostgreSQL connection goes back to the pool for another thread.
+    """
+    if DATABASE_URL:
+        from doggiechef import postgres
+        postgres.release()
+    connections = getattr(_local, 'connections', None) or {}
+    for conn in connections.values():
+        if conn.in_transaction:
+            conn.rollback()
+
+
+def close_connections():
+    """Close the calling thread's connections"""
+    if DATABASE_URL:
+        from doggiechef import postgres
+        postgres.release()
+    connections = getattr(_local, 'connections', None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+
+
+if __name__ == '__main__':
+    build_snapshot()
+    logs.info("📦 Wrote schema snapshot", {"path": SNAPSHOT_PATH, "bytes": os.path.getsize(SNAPSHOT_PATH)})
@@ -0,0 +1,157 @@
+"""JSON encoding and response compression for the read endpoints.
+
+dumps() returns compact UTF-8 bytes, from orjson when it is installed and
+the standard library otherwise, so callers never encode to str and then to
+bytes. FragmentCache keeps each recipe row's encoded JSON so list pages only
+encode rows that changed since they were last served. compress() serves
+br or gzip when the client accepts it (br needs the brotli package).
+"""
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FRAGMENT_CACHE_SIZE = 2048
+# Smaller bodies are not worth the CPU or the Content-Encoding header
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+_stdlib_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def dumps(obj):
+    """Compact JSON as UTF-8 bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _stdlib_encoder.encode(obj).encode()
+
+
+class FragmentCache:
+    """Thread-safe LRU of encoded JSON objects for recipe rows.
+
+    An entry is keyed by recipe id and output fields, and only reused while the
+    row's values are unchanged: updated_at has one-second resolution, so the
+    values themselves are compared (cheap next to encoding them). Fields in
+    `slots` (photos, thumbnail) are not stored; the cached object is split
+    around them so their current values can be spliced in.
+    """
+
+    def __init__(self, max_entries=FRAGMENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, recipe_id, fields, values, slots, slot_values):
+        """JSON bytes for one object with `fields` in order.
+
+        `values` maps the non-slot fields to row values and `slot_values` the
+        slot fields to their (uncached) values.
+        """
+        key = (recipe_id, fields)
+        row = tuple(values[field] for field in fields if field not in slots)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == row:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                segments = entry[1]
+            else:
+                segments = None
+        if segments is None:
+            segments = _segments(fields, values, slots)
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = (row, segments)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        slot_fields = [field for field in fields if field in slots]
+        if not slot_fields:
+            return segments[0]
+        parts = [segments[0]]
+        for field, segment in zip(slot_fields, segments[1:]):
+            parts.append(dumps(slot_values[field]))
+            parts.append(segment)
+        return b''.join(parts)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _segments(fields, values, slots):
+    """Encode an object as the byte runs between its slot values"""
+    segments = []
+    current = [b'{']
+    for index, field in enumerate(fields):
+        if index:
+            current.append(b',')
+        current.append(dumps(field) + b':')
+        if field in slots:
+            segments.append(b''.join(current))
+            current = []
+        else:
+            current.append(dumps(values[field]))
+    current.append(b'}')
+    segments.append(b''.join(current))
+    return segments
+
+
+def join_array(fragments):
+    """A JSON array of already-encoded elements"""
+    return b'[' + b','.join(fragments) + b']'
+
+
+_brotli_module = None  # Imported on first use; False once the import has failed
+
+
+def _brotli():
+    """The brotli module, or None if it is not installed; a failed import is not retried per request"""
+    global _brotli_module
+    if _brotli_module is None:
+        try:
+            import brotli
+        except ImportError:
+            brotli = False
+        _brotli_module = brotli
+    return _brotli_module or None
+
+
+def negotiate(accept_encoding):
+    """The best coding the client accepts: 'br', 'gzip' or None for identity"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    wildcard = accepted.get('*', 0.0)
+    for coding in ('br', 'gzip'):
+        if accepted.get(coding, wildcard) > 0 and (coding != 'br' or _brotli() is not None):
+            return coding
+    return None
+
+
+def compress(body, coding):
+    if coding == 'br':
+        return _brotli().compress(body, quality=BROTLI_QUALITY)
+    if coding == 'gzip':
+        import gzip
+        # mtime=0 keeps the output, and so its ETag, identical for the same body
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
@@ -0,0 +1,178 @@
+"""Recipe counts per facet value, kept current by triggers.
+
+/api/stats and /api/filters read the small recipe_facets table instead of
+scanning recipes with COUNT(*), GROUP BY and SELECT DISTINCT on every call.
+Each facet is a SQL expression over a recipes row; the insert, update and
+delete triggers are generated from FACETS so they cannot drift apart.
+
+On PostgreSQL recipe_facets is a view that counts the recipes table when it
+is read instead, so concurrent writers never queue for the same counter
+rows (see postgres.py); the response cache keeps it off most requests.
+
+Check the counters against the recipes table, and optionally rebuild them:
+    python -m doggiechef.facets [--rebuild] [database]
+"""
+import sys
+
+COOKING_TIME_BUCKETS = ('0-15', '16-30', '31-60', '60+')
+
+# facet name -> SQL expression over a recipes row, '{row}' being new or old;
+# NULL means the recipe is not counted under the facet
+FACETS = {
+    'total': "''",
+    'country': '{row}.country',
+    'protein_type': '{row}.protein_type',
+    'difficulty': "NULLIF({row}.difficulty, '')",
+    'cooking_time': '''CASE
+        WHEN NULLIF({row}.cooking_time, '') IS NULL THEN NULL
+        WHEN {row}.cooking_time <= 15 THEN '0-15'
+        WHEN {row}.cooking_time <= 30 THEN '16-30'
+        WHEN {row}.cooking_time <= 60 THEN '31-60'
+        ELSE '60+' END''',
+}
+
+# cooking_time is an INTEGER column there and never ''
+POSTGRES_FACETS = dict(FACETS, cooking_time='''CASE
+        WHEN {row}.cooking_time IS NULL THEN NULL
+        WHEN {row}.cooking_time <= 15 THEN '0-15'
+        WHEN {row}.cooking_time <= 30 THEN '16-30'
+        WHEN {row}.cooking_time <= 60 THEN '31-60'
+        ELSE '60+' END''')
+
+
+def _facets(conn):
+    return POSTGRES_FACETS if getattr(conn, 'dialect', None) == 'postgres' else FACETS
+
+
+def _counts_query(facet_expressions):
+    selects = ' UNION ALL '.join(
+        f"SELECT '{facet}' AS facet, {expression.format(row='recipes')} AS value FROM recipes"
+        for facet, expression in facet_expressions.items()
+    )
+    return f'''
+        SELECT facet, value, COUNT(*) AS count FROM ({selects}) AS facet_values
+        WHERE value IS NOT NULL GROUP BY facet, value'''
+
+
+def _increment(facet, expression, condition='1'):
+    return f'''
+        INSERT INTO recipe_facets (facet, value, count)
+        SELECT '{facet}', value, 1 FROM (SELECT {expression.format(row='new')} AS value)
+        WHERE value IS NOT NULL AND {condition}
+        ON CONFLICT (facet, value) DO UPDATE SET count = count + 1;'''
+
+
+def _decrement(facet, expression, condition='1'):
+    value = expression.format(row='old')
+    return f'''
+        UPDATE recipe_facets SET count = count - 1
+        WHERE facet = '{facet}' AND value = {value} AND {condition};
+        DELETE FROM recipe_facets WHERE facet = '{facet}' AND value = {value} AND count <= 0;'''
+
+
+def _schema():
+    changed = '({old}) IS NOT ({new})'
+    updated = [f for f in FACETS if f != 'total']
+    update_body = ''
+    for facet in updated:
+        condition = changed.format(old=FACETS[facet].format(row='old'), new=FACETS[facet].format(row='new'))
+        update_body += _decrement(facet, FACETS[facet], condition)
+        update_body += _increment(facet, FACETS[facet], condition)
+    columns = ', '.join(updated)
+    return f'''
+    CREATE TABLE IF NOT EXISTS recipe_facets (
+        facet TEXT NOT NULL,
+        value TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (facet, value)
+    ) WITHOUT ROWID;
+    CREATE TRIGGER IF NOT EXISTS recipe_facets_insert AFTER INSERT ON recipes BEGIN
+        {''.join(_increment(facet, expression) for facet, expression in FACETS.items())}
+    END;
+    CREATE TRIGGER IF NOT EXISTS recipe_facets_delete AFTER DELETE ON recipes BEGIN
+        {''.join(_decrement(facet, expression) for facet, expression in FACETS.items())}
+    END;
+    CREATE TRIGGER IF NOT EXISTS recipe_facets_update AFTER UPDATE OF {columns} ON recipes BEGIN
+        {update_body}
+    END;
+'''
+
+
+SCHEMA = _schema()
+# Reads filtered on one facet only scan that facet's branch of the UNION
+POSTGRES_SCHEMA = f'CREATE OR REPLACE VIEW recipe_facets AS {_counts_query(POSTGRES_FACETS)};'
+
+
+def expected_counts(conn):
+    """Facet counts computed from scratch with one scan of recipes"""
+    return {(row['facet'], row['value']): row['count'] for row in conn.execute(_counts_query(_facets(conn)))}
+
+
+def stored_counts(conn):
+    return {(row['facet'], row['value']): row['count']
+            for row in conn.execute('SELECT facet, value, count FROM recipe_facets')}
+
+
+def check(conn):
+    """Differences between the counters and the recipes table as {(facet, value): (stored, expected)}"""
+    stored = stored_counts(conn)
+    expected = expected_counts(conn)
+    return {key: (stored.get(key, 0), expected.get(key, 0))
+            for key in stored.keys() | expected.keys()
+            if stored.get(key, 0) != expected.get(key, 0)}
+
+
+def rebuild(conn):
+    """Recompute every counter; call inside a transaction"""
+    conn.execute('DELETE FROM recipe_facets')
+    conn.executemany('INSERT INTO recipe_facets (facet, value, count) VALUES (?, ?, ?)',
+                     [(facet, value, count) for (facet, value), count in expected_counts(conn).items()])
+
+
+def _facet(conn, facet):
+    rows = conn.execute(
+        'SELECT value, count FROM recipe_facets WHERE facet = ? ORDER BY count DESC, value', (facet,)
+    ).fetchall()
+    if facet == 'cooking_time':
+        rows.sort(key=lambda row: COOKING_TIME_BUCKETS.index(row['value']))
+    return rows
+
+
+def get_stats(conn):
+    """Body of /api/stats"""
+    total = conn.execute("SELECT count FROM recipe_facets WHERE facet = 'total'").fetchone()
+    stats = {'total_recipes': total['count'] if total else 0}
+    for key, facet in (('recipes_by_country', 'country'), ('recipes_by_protein', 'protein_type'),
+                       ('recipes_by_difficulty', 'difficulty'), ('recipes_by_cooking_time', 'cooking_time')):
+        stats[key] = [{facet: row['value'], 'count': row['count']} for row in _facet(conn, facet)]
+    return stats
+
+
+def get_filters(conn):
+    """Body of /api/filters: the values that at least one recipe has, per facet"""
+    return {
+        'countries': sorted(row['value'] for row in _facet(conn, 'country')),
+        'protein_types': sorted(row['value'] for row in _facet(conn, 'protein_type')),
+        'difficulties': sorted(row['value'] for row in _facet(conn, 'difficulty')),
+        'cooking_times': [row['value'] for row in _facet(conn, 'cooking_time')],
+    }
+
+
+if __name__ == '__main__':
+    from doggiechef import db
+
+    args = [arg for arg in sys.argv[1:] if arg != '--rebuild']
+    if args:
+        db.configure(args[0])
+    conn = db.get_connection()
+    problems = check(conn)
+    for (facet, value), (stored, expected) in sorted(problems.items()):
+        print(f"⚠️ {facet}={value!r}: stored {stored}, expected {expected}")
+    if not problems:
+        print(f"✅ Facet counters match the recipes table in {db.get_db_path()}")
+    elif '--rebuild' in sys.argv:
+        with conn:
+            rebuild(conn)
+        print(f"🔧 Rebuilt facet counters in {db.get_db_path()}")
+    else:
+        sys.exit(1)
@@ -0,0 +1,226 @@
+"""Serving stored photo files.
+
+FileIndex remembers the size, mtime, ETag and content type of every photo it
+has served, so a hit costs an open() and the send rather than a path
+resolution and stat() each time. Photo names are content hashes or UUIDs and
+never change once written; an entry is trusted until opening its file fails.
+Photos are sent as stored: JPEG, PNG and WebP are already compressed.
+
+prepare() answers a request's If-None-Match and Range with a
+Reply (status, headers and the byte span to send). The bytes then go out
+through os.sendfile() from a socket handler (send_reply), the WSGI server's
+file_wrapper, or not through Python at all: with DOGGIECHEF_PHOTO_SENDFILE
+set to x-sendfile (Apache, lighttpd) or x-accel-redirect (nginx) the
+response only names the file, and the fronting server reads it and handles
+Range itself.
+"""
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+
+from doggiechef import cache
+
+INDEX_SIZE = 10000
+BLOCK_SIZE = 256 * 1024
+# Not in every mimetypes table
+CONTENT_TYPES = {'.heic': 'image/heic', '.webp': 'image/webp'}
+PHOTO_CACHE_CONTROL = f'public, max-age={cache.PHOTO_MAX_AGE}, immutable'
+
+SENDFILE_MODES = ('x-sendfile', 'x-accel-redirect')
+SENDFILE = os.environ.get('DOGGIECHEF_PHOTO_SENDFILE', '').lower() or None
+if SENDFILE is not None and SENDFILE not in SENDFILE_MODES:
+    raise ValueError(f"DOGGIECHEF_PHOTO_SENDFILE must be one of: {', '.join(SENDFILE_MODES)}")
+# The nginx `internal` location aliased to the upload folder
+ACCEL_PREFIX = os.environ.get('DOGGIECHEF_PHOTO_ACCEL_PREFIX', '/internal/photos/')
+
+
+class FileInfo:
+    __slots__ = ('filename', 'path', 'size', 'last_modified', 'etag', 'content_type')
+
+    def __init__(self, filename, path, stat):
+        self.filename = filename
+        self.path = path
+        self.size = stat.st_size
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        extension = os.path.splitext(filename)[1].lower()
+        self.content_type = (CONTENT_TYPES.get(extension) or mimetypes.guess_type(filename)[0]
+                             or 'application/octet-stream')
+
+
+class Reply:
+    """What to answer for one photo request; `length` bytes of `path` from `offset` make up the body"""
+
+    def __init__(self, status, headers, path=None, offset=0, length=0):
+        self.status = status
+        self.headers = headers
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+
+class FileIndex:
+    """Thread-safe LRU of FileInfo for the files in one folder"""
+
+    def __init__(self, folder, accel_prefix=ACCEL_PREFIX, max_entries=INDEX_SIZE):
+        self.folder = folder
+        self.accel_prefix = accel_prefix
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, filename):
+        """FileInfo for a file directly in the folder, or None if it is missing or the name is unsafe"""
+        if not filename or filename.startswith('.') or os.path.basename(filename) != filename \
+                or '\\' in filename or '\0' in filename:
+            return None
+        with self._lock:
+            info = self._entries.get(filename)
+            if info is not None:
+                self._entries.move_to_end(filename)
+                return info
+        # Misses are not remembered: the photo may be stored a moment later
+        path = os.path.join(self.folder, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        info = FileInfo(filename, path, stat)
+        with self._lock:
+            self._entries[filename] = info
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return info
+
+    def forget(self, filename):
+        with self._lock:
+            self._entries.pop(filename, None)
+
+    def open(self, info, reply):
+        """The reply's file positioned at its offset, or None (and the entry dropped) if it was deleted"""
+        try:
+            f = open(reply.path, 'rb')
+        except FileNotFoundError:
+            self.forget(info.filename)
+            return None
+        if reply.offset:
+            f.seek(reply.offset)
+        return f
+
+    def offload_header(self, info):
+        """(name, value) telling the fronting server which file to send, or None to send it ourselves"""
+        if SENDFILE == 'x-sendfile':
+            return 'X-Sendfile', info.path
+        if SENDFILE == 'x-accel-redirect':
+            return 'X-Accel-Redirect', self.accel_prefix + info.filename
+        return None
+
+
+def parse_range(value, size):
+    """Inclusive (first, last) byte positions of a single bytes range.
+
+    None means the header should be ignored and the whole file sent (also for
+    multiple ranges, which RFC 9110 allows); False means it is unsatisfiable.
+    """
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, dash, last = spec.strip().partition('-')
+    if not dash or not (first or last) or (first and not first.isdecimal()) or (last and not last.isdecimal()):
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            return False
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        return False
+    return start, min(end, size - 1)
+
+
+def prepare(index, info, request_headers):
+    """The Reply to a GET for `info`, given the request's headers (any mapping with .get)"""
+    range_header = request_headers.get('Range')
+    offload = index.offload_header(info)
+    etag = info.etag
+
+    headers = {
+        'Content-Type': info.content_type,
+        'ETag': etag,
+        'Last-Modified': info.last_modified,
+        'Cache-Control': PHOTO_CACHE_CONTROL,
+        'Accept-Ranges': 'bytes',
+    }
+    if cache.etag_matches(request_headers.get('If-None-Match'), etag):
+        return Reply(304, headers)
+    if offload is not None:
+        name, value = offload
+        headers[name] = value
+        return Reply(200, headers)
+
+    # If-Range: only honour the range while the client's copy is still current
+    if range_header and request_headers.get('If-Range', etag) == etag:
+        span = parse_range(range_header, info.size)
+        if span is False:
+            headers['Content-Range'] = f'bytes */{info.size}'
+            headers['Content-Length'] = '0'
+            return Reply(416, headers)
+        if span is not None:
+            first, last = span
+            headers['Content-Range'] = f'bytes {first}-{last}/{info.size}'
+            headers['Content-Length'] = str(last - first + 1)
+            return Reply(206, headers, info.path, first, last - first + 1)
+    headers['Content-Length'] = str(info.size)
+    return Reply(200, headers, info.path, 0, info.size)
+
+
+def read_span(f, length):
+    """Yield `length` bytes of an open file in blocks, closing it afterwards"""
+    try:
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        f.close()
+
+
+def send_reply(handler, index, info, reply, headers=None):
+    """Write a Reply from a BaseHTTPRequestHandler, the body with os.sendfile() where available.
+
+    Returns (status, bytes sent); a file deleted since it was indexed is answered with a 404.
+    `headers` are extras such as Server-Timing.
+    """
+    f = None
+    if reply.length:
+        f = index.open(info, reply)
+        if f is None:
+            handler.send_error(404)
+            return 404, 0
+    try:
+        handler.send_response(reply.status)
+        handler.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in reply.headers.items():
+            handler.send_header(name, value)
+        for name, value in (headers or {}).items():
+            if value is not None:
+                handler.send_header(name, value)
+        handler.end_headers()
+        if f is None:
+            return reply.status, 0
+        handler.wfile.flush()
+        # socket.sendfile() copies in the kernel, falling back to send() where os.sendfile is missing
+        return reply.status, handler.connection.sendfile(f, reply.offset, reply.length)
+    finally:
+        if f is not None:
+            f.close()
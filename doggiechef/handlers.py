@@ -0,0 +1,29 @@
+"""Base class for the read-only JSON endpoints in api/, which Vercel runs as separate functions."""
+import json
+from http.server import BaseHTTPRequestHandler
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    """Answers with send_json(); each do_* method sets self.timer = metrics.request(route) first"""
+
+    ALLOWED_METHODS = 'GET, OPTIONS'
+
+    def send_json(self, status, data):
+        with self.timer.phase('encode'):
+            payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        server_timing = self.timer.server_timing()
+        if server_timing:
+            self.send_header('Server-Timing', server_timing)
+        self.end_headers()
+        self.wfile.write(payload)
+        self.timer.finish(status, 0, len(payload))
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', self.ALLOWED_METHODS)
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        self.end_headers()
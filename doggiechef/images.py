@@ -0,0 +1,82 @@
+"""Upload-time image pipeline.
+
+Each upload is decoded once, rotated according to its EXIF orientation and
+written out as metadata-free WebP and JPEG variants at a few fixed widths, so
+recipe cards never have to download the full-size original.
+"""
+import os
+
+VARIANT_WIDTHS = (160, 480, 1200)
+ORIENTATION_TAG = 0x0112
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_filename(filename, width, fmt):
+    """Name of the stored variant of an uploaded photo"""
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}_{width}.{VARIANT_FORMATS[fmt][1]}"
+
+
+def _flatten(img):
+    """Convert to RGB, compositing any transparency onto white"""
+    from PIL import Image
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def process_image(source_path, variant_dir, filename):
+    """Write the responsive variants of an uploaded photo.
+
+    Returns the oriented size of the original and one entry per written variant,
+    or None if Pillow cannot decode the file (e.g. HEIC without a plugin).
+    """
+    # Pillow is only needed where uploads are processed, not on every import of this module
+    from PIL import Image, ImageOps
+    try:
+        img = Image.open(source_path)
+        width, height = img.size
+        if img.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+            width, height = height, width
+        # Let the JPEG decoder downscale while decoding when the original is far larger than we need
+        img.draft('RGB', (max(VARIANT_WIDTHS), max(VARIANT_WIDTHS)))
+        img = _flatten(ImageOps.exif_transpose(img))
+    except Exception:
+        return None
+
+    os.makedirs(variant_dir, exist_ok=True)
+    variants = []
+    # Largest first so every smaller variant is resampled from an already reduced image
+    source = img
+    for target in sorted({min(w, width) for w in VARIANT_WIDTHS}, reverse=True):
+        target_height = max(1, round(height * target / width))
+        if source.size != (target, target_height):
+            source = source.resize((target, target_height), Image.LANCZOS)
+        for fmt, (pil_format, _, options) in VARIANT_FORMATS.items():
+            path = os.path.join(variant_dir, variant_filename(filename, target, fmt))
+            # No exif/icc arguments, so metadata is stripped
+            source.save(path, pil_format, **options)
+            variants.append({
+                'width': target,
+                'height': target_height,
+                'format': fmt,
+                'bytes': os.path.getsize(path),
+            })
+    img.close()
+
+    return {'width': width, 'height': height, 'variants': variants}
+
+
+def pick_variant(variants, size, fmt):
+    """Smallest variant at least `size` wide in `fmt`, else the largest one available"""
+    candidates = sorted((v for v in variants if v['format'] == fmt), key=lambda v: v['width'])
+    for variant in candidates:
+        if variant['width'] >= size:
+            return variant
+    return candidates[-1] if candidates else None
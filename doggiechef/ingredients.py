@@ -0,0 +1,251 @@
+"""Structured ingredient index for "what can I cook with" queries.
+
+The free-text recipes.ingredients column is parsed on write into one row per
+ingredient (recipe_ingredients) pointing at a normalized ingredient name
+(ingredients). A pantry query then counts, per recipe, how many of the given
+names it uses with a single indexed GROUP BY instead of LIKE scans.
+
+Backfill existing recipes with:  python -m doggiechef.ingredients [database]
+"""
+import re
+import sys
+
+from doggiechef.photos import load_photos
+
+MAX_RESULTS = 50
+MAX_PANTRY_ITEMS = 100
+
+UNITS = {
+    'cup': 'cup', 'cups': 'cup', 'c': 'cup',
+    'tablespoon': 'tbsp', 'tablespoons': 'tbsp', 'tbsp': 'tbsp', 'tbs': 'tbsp', 'tbl': 'tbsp',
+    'teaspoon': 'tsp', 'teaspoons': 'tsp', 'tsp': 'tsp',
+    'gram': 'g', 'grams': 'g', 'g': 'g', 'gr': 'g',
+    'kilogram': 'kg', 'kilograms': 'kg', 'kg': 'kg',
+    'milliliter': 'ml', 'milliliters': 'ml', 'millilitre': 'ml', 'millilitres': 'ml', 'ml': 'ml',
+    'liter': 'l', 'liters': 'l', 'litre': 'l', 'litres': 'l', 'l': 'l',
+    'ounce': 'oz', 'ounces': 'oz', 'oz': 'oz',
+    'pound': 'lb', 'pounds': 'lb', 'lb': 'lb', 'lbs': 'lb',
+    'clove': 'clove', 'cloves': 'clove',
+    'pinch': 'pinch', 'pinches': 'pinch',
+    'can': 'can', 'cans': 'can', 'tin': 'can', 'tins': 'can',
+    'slice': 'slice', 'slices': 'slice',
+    'piece': 'piece', 'pieces': 'piece', 'pcs': 'piece',
+    'bunch': 'bunch', 'bunches': 'bunch',
+    'handful': 'handful', 'handfuls': 'handful',
+}
+UNICODE_FRACTIONS = {'¼': '1/4', '½': '1/2', '¾': '3/4', '⅓': '1/3', '⅔': '2/3', '⅛': '1/8'}
+# Size, preparation and state words dropped from names, so "2 large eggs" is indexed as "egg"
+DESCRIPTORS = frozenset('''
+    large small medium big extra jumbo whole thick thin heaping level generous
+    fresh freshly dried frozen ripe raw cooked boiled uncooked leftover
+    chopped minced diced sliced grated crushed ground peeled shredded cubed halved quartered
+    julienned mashed melted softened beaten sifted packed rinsed drained trimmed deseeded
+    finely roughly coarsely thinly lightly
+    boneless skinless lean organic optional about
+'''.split())
+
+# Words that start a note after a comma rather than another ingredient: "cut into rings", "to taste"
+NOTE_WORDS = frozenset(('cut', 'to', 'for', 'divided', 'plus', 'or', 'and', 'at', 'if', 'as', 'such'))
+
+_BULLET_RE = re.compile(r'^\s*(?:[-*•·]|\d+[.)](?=\s))\s*')
+# "1", "1.5", "1/2", "1 1/2", optionally a range such as "2-3" (the lower bound is kept)
+_QUANTITY_RE = re.compile(r'^(\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?)(?:\s*(?:-|to)\s*[\d./]+)?\s*')
+_UNIT_RE = re.compile(r'^([a-z]+)\.?(?:\s+|$)(?:of\s+)?')
+_PARENTHETICAL_RE = re.compile(r'\([^)]*\)')
+_NON_WORD_RE = re.compile(r"[^a-z\s'-]+")
+
+
+def normalize_name(name):
+    """Canonical ingredient name: lowercase, singular, no punctuation or DESCRIPTORS"""
+    words = _NON_WORD_RE.sub(' ', (name or '').lower()).split()
+    # A name made only of descriptors ("ground") is kept as it is
+    words = [word for word in words if word not in DESCRIPTORS] or words
+    return ' '.join(_singular(word) for word in words)
+
+
+def _singular(word):
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'ches', 'shes')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def _parse_quantity(text):
+    from fractions import Fraction  # only needed on writes
+    return float(sum(Fraction(part) for part in text.split()))
+
+
+def _is_note(text):
+    """Whether a comma-separated part describes the ingredient before it: "minced", "finely chopped" """
+    words = _NON_WORD_RE.sub(' ', text.lower()).split()
+    return bool(words) and (words[0] in DESCRIPTORS or words[0] in NOTE_WORDS)
+
+
+def _split_lines(text):
+    """One ingredient per line; a single line is treated as a comma-separated list.
+
+    A part that only describes the previous one stays with it, so "3 cloves garlic, minced" is one ingredient.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) != 1:
+        return lines
+    items = []
+    for part in re.split(r'[,;]', lines[0]):
+        if items and _is_note(part):
+            items[-1] += ',' + part
+        else:
+            items.append(part)
+    return items
+
+
+def parse_ingredients(text):
+    """Parse free text into [{'name', 'quantity', 'unit', 'raw'}] with duplicate names dropped"""
+    if not text:
+        return []
+    parsed = []
+    seen = set()
+    for line in _split_lines(text):
+        raw = line.strip()
+        rest = _BULLET_RE.sub('', raw)
+        for symbol, fraction in UNICODE_FRACTIONS.items():
+            rest = rest.replace(symbol, f' {fraction}')
+        rest = rest.strip()
+
+        quantity = unit = None
+        match = _QUANTITY_RE.match(rest)
+        if match:
+            quantity = _parse_quantity(match.group(1))
+            rest = rest[match.end():]
+        match = _UNIT_RE.match(rest.lower())
+        if match and match.group(1) in UNITS and match.end() < len(rest):
+            unit = UNITS[match.group(1)]
+            rest = rest[match.end():]
+
+        # Drop notes such as "(optional)" and preparation after a comma: "onion, finely chopped"
+        rest = _PARENTHETICAL_RE.sub(' ', rest).split(',')[0]
+        name = normalize_name(rest)
+        if not name or name in seen:
+            continue
+        seen.add(name)
+        parsed.append({'name': name, 'quantity': quantity, 'unit': unit, 'raw': raw})
+    return parsed
+
+
+def _ingredient_ids(conn, names):
+    """Ids of the given normalized names, creating the missing ones"""
+    conn.executemany('INSERT INTO ingredients (name) VALUES (?) ON CONFLICT DO NOTHING', [(name,) for name in names])
+    placeholders = ', '.join('?' * len(names))
+    return {row['name']: row['id'] for row in conn.execute(
+        f'SELECT id, name FROM ingredients WHERE name IN ({placeholders})', list(names)
+    )}
+
+
+def index_recipe(conn, recipe_id, text):
+    """Replace a recipe's rows in the ingredient index; call inside the write's transaction"""
+    conn.execute('DELETE FROM recipe_ingredients WHERE recipe_id = ?', (recipe_id,))
+    parsed = parse_ingredients(text)
+    if not parsed:
+        return
+    ids = _ingredient_ids(conn, [item['name'] for item in parsed])
+    conn.executemany('''
+        INSERT INTO recipe_ingredients (recipe_id, position, ingredient_id, quantity, unit, raw)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(recipe_id, position, ids[item['name']], item['quantity'], item['unit'], item['raw'])
+          for position, item in enumerate(parsed)])
+
+
+def reindex_all(conn):
+    """Rebuild the ingredient index from recipes.ingredients; returns the number of recipes"""
+    rows = conn.execute('SELECT id, ingredients FROM recipes').fetchall()
+    for row in rows:
+        index_recipe(conn, row['id'], row['ingredients'])
+    # Names no recipe uses any more
+    conn.execute('''
+        DELETE FROM ingredients
+        WHERE NOT EXISTS (SELECT 1 FROM recipe_ingredients WHERE ingredient_id = ingredients.id)
+    ''')
+    return len(rows)
+
+
+def parse_pantry(value):
+    """Split a comma-separated pantry list into normalized names"""
+    names = []
+    for item in (value or '').split(','):
+        name = normalize_name(item)
+        if name and name not in names:
+            names.append(name)
+    if len(names) > MAX_PANTRY_ITEMS:
+        raise ValueError(f'At most {MAX_PANTRY_ITEMS} pantry ingredients are allowed')
+    return names
+
+
+def pantry_matches(conn, pantry, limit=20, min_matches=1, country=None, protein_type=None):
+    """Recipes ranked by how many pantry ingredients they use, then by how few they lack.
+
+    Raises ValueError for an empty pantry or an out-of-range limit.
+    """
+    if not pantry:
+        raise ValueError('At least one ingredient is required')
+    if not 1 <= limit <= MAX_RESULTS:
+        raise ValueError(f'limit must be between 1 and {MAX_RESULTS}')
+
+    placeholders = ', '.join('?' * len(pantry))
+    postgres = getattr(conn, 'dialect', None) == 'postgres'
+    group_concat = "string_agg(i.name, '|')" if postgres else "GROUP_CONCAT(i.name, '|')"
+    query = f'''
+        WITH matched AS (
+            SELECT ri.recipe_id, COUNT(*) AS matched, {group_concat} AS names
+            FROM ingredients AS i
+            JOIN recipe_ingredients AS ri ON ri.ingredient_id = i.id
+            WHERE i.name IN ({placeholders})
+            GROUP BY ri.recipe_id
+            HAVING COUNT(*) >= ?
+        )
+        SELECT r.id, r.title, r.country, r.protein_type, r.cooking_time, r.difficulty,
+               m.matched, m.names,
+               (SELECT COUNT(*) FROM recipe_ingredients WHERE recipe_id = r.id) AS ingredient_count
+        FROM matched AS m
+        JOIN recipes AS r ON r.id = m.recipe_id
+    '''
+    params = list(pantry) + [min_matches]
+    conditions = []
+    if country:
+        conditions.append('r.country = ?')
+        params.append(country)
+    if protein_type:
+        conditions.append('r.protein_type = ?')
+        params.append(protein_type)
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    # Wrapped so the ORDER BY can use ingredient_count, which PostgreSQL only allows on its own
+    query = f'SELECT * FROM ({query}) AS ranked ORDER BY matched DESC, ingredient_count - matched, id DESC LIMIT ?'
+    params.append(limit)
+
+    rows = conn.execute(query, params).fetchall()
+    thumbnails = load_photos(conn, [row['id'] for row in rows], first_only=True)
+    results = []
+    for row in rows:
+        result = dict(row)
+        names = result.pop('names').split('|')
+        result['matched_ingredients'] = sorted(names)
+        result['missing_count'] = result['ingredient_count'] - result['matched']
+        photos = thumbnails[row['id']]
+        result['thumbnail'] = photos[0] if photos else None
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    from doggiechef import db
+
+    if len(sys.argv) > 1:
+        db.configure(sys.argv[1])
+    conn = db.get_connection()
+    with conn:
+        count = reindex_all(conn)
+    print(f"🥕 Indexed ingredients for {count} recipes in {db.get_db_path()}")
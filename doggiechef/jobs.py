@@ -0,0 +1,348 @@
+"""Durable photo job queue backed by the photo_jobs table.
+
+Uploads are spooled to disk and queued in the same transaction as their
+recipe, so a POST can return as soon as the recipe row is committed. A
+PhotoWorker then resizes and stores each photo off the request thread and
+inserts its recipe_photos row when it is done.
+"""
+import os
+import threading
+import time
+
+from doggiechef import db, logs, metrics
+from doggiechef.images import process_image
+from doggiechef.photos import (IN_BATCH_SIZE, add_variants, lock_photo, next_position, stored_photo,
+                               unreferenced)
+from doggiechef.storage import save_with_retries
+
+MAX_ATTEMPTS = 3
+# A failed job waits this long before its second attempt, doubling after each further failure
+RETRY_DELAY_SECONDS = 30
+# Running jobs untouched for this long belonged to a process that died
+STALE_AFTER_SECONDS = 600
+
+
+def enqueue(conn, recipe_id, uploads):
+    """Queue spooled uploads, given as (source_path, filename) pairs; returns the job ids"""
+    start = next_position(conn, recipe_id)
+    job_ids = []
+    for offset, (source_path, filename) in enumerate(uploads):
+        cursor = conn.execute('''
+            INSERT INTO photo_jobs (recipe_id, position, source_path, filename)
+            VALUES (?, ?, ?, ?)
+        ''', (recipe_id, start + offset, source_path, filename))
+        job_ids.append(cursor.lastrowid)
+    return job_ids
+
+
+def claim(conn):
+    """Atomically take the oldest pending job that is not waiting out a retry delay, or return None"""
+    # PostgreSQL runs workers' claims concurrently: each skips the rows another one has locked
+    skip_locked = ' FOR UPDATE SKIP LOCKED' if getattr(conn, 'dialect', None) == 'postgres' else ''
+    with db.transaction(conn):
+        row = conn.execute(f'''
+            UPDATE photo_jobs
+            SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM photo_jobs
+                WHERE status = 'pending' AND (not_before IS NULL OR not_before <= CURRENT_TIMESTAMP)
+                ORDER BY id LIMIT 1{skip_locked}
+            )
+            RETURNING *
+        ''').fetchone()
+    return dict(row) if row else None
+
+
+def claim_ids(conn, job_ids):
+    """Atomically take the given jobs if they are still pending"""
+    job_ids = list(job_ids)
+    claimed = []
+    with db.transaction(conn):
+        # A whole bulk import's jobs would not fit in one IN (...) under SQLite's bound-parameter limit
+        for start in range(0, len(job_ids), IN_BATCH_SIZE):
+            batch = job_ids[start:start + IN_BATCH_SIZE]
+            placeholders = ', '.join('?' * len(batch))
+            rows = conn.execute(f'''
+                UPDATE photo_jobs
+                SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id IN ({placeholders}) AND status = 'pending'
+                RETURNING *
+            ''', batch).fetchall()
+            claimed.extend(dict(row) for row in rows)
+    return claimed
+
+
+def complete(conn, job, photo, storage=None):
+    """Attach a stored photo to its recipe; returns False if the recipe was deleted meanwhile.
+
+    With `storage`, a cancelled job's photo is removed unless another recipe uses it, and a
+    content-addressed file that a recipe delete removed after save() found it is stored again.
+    """
+    with db.transaction(conn):
+        lock_photo(conn, photo['url'])
+        if conn.execute('SELECT 1 FROM recipes WHERE id = ?', (job['recipe_id'],)).fetchone() is None:
+            conn.execute("UPDATE photo_jobs SET status = 'cancelled' WHERE id = ?", (job['id'],))
+            # Another recipe may share the same content-addressed file
+            if storage is not None and unreferenced(conn, [photo['url']]):
+                storage.delete(photo['url'])
+            return False
+        if storage is not None and not storage.exists(photo['url']):
+            # The spooled upload is still there; its variants went with the file, so the original is served
+            photo = dict(photo, **storage.save(job['source_path'], job['filename']))
+            photo.pop('variants', None)
+        conn.execute('''
+            INSERT INTO recipe_photos (recipe_id, position, url, width, height, bytes)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (job['recipe_id'], job['position'], photo['url'],
+              photo.get('width'), photo.get('height'), photo.get('bytes')))
+        if photo.get('variants'):
+            add_variants(conn, photo.get('filename', job['filename']), photo['variants'])
+        conn.execute('''
+            UPDATE photo_jobs SET status = 'done', error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (job['id'],))
+    return True
+
+
+def fail(conn, job, error):
+    """Put a job back in the queue after a retry delay, or give up on it after MAX_ATTEMPTS"""
+    status = 'pending' if job['attempts'] < MAX_ATTEMPTS else 'failed'
+    # A bad image or a storage outage would otherwise use up every attempt within milliseconds
+    delay = RETRY_DELAY_SECONDS * 2 ** (job['attempts'] - 1)
+    not_before = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() + delay))
+    with db.transaction(conn):
+        conn.execute('''
+            UPDATE photo_jobs SET status = ?, error = ?, not_before = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (status, str(error), not_before, job['id']))
+    return status
+
+
+def cancel(conn, recipe_id):
+    """Drop a recipe's queued jobs, returning their spooled files for removal"""
+    rows = conn.execute(
+        "SELECT source_path FROM photo_jobs WHERE recipe_id = ? AND status = 'pending'", (recipe_id,)
+    ).fetchall()
+    conn.execute("DELETE FROM photo_jobs WHERE recipe_id = ? AND status = 'pending'", (recipe_id,))
+    return [row['source_path'] for row in rows]
+
+
+def requeue_stale(conn):
+    # Timestamps are UTC 'YYYY-MM-DD HH:MM:SS' in both databases
+    cutoff = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - STALE_AFTER_SECONDS))
+    with db.transaction(conn):
+        conn.execute('''
+            UPDATE photo_jobs SET status = 'pending'
+            WHERE status = 'running' AND updated_at < ?
+        ''', (cutoff,))
+
+
+def has_pending(conn):
+    """Whether a job is ready to claim; jobs waiting out a retry delay do not count"""
+    return conn.execute('''
+        SELECT 1 FROM photo_jobs
+        WHERE status = 'pending' AND (not_before IS NULL OR not_before <= CURRENT_TIMESTAMP)
+        LIMIT 1
+    ''').fetchone() is not None
+
+
+def job_status(conn, recipe_id):
+    """Jobs of a recipe that have not finished successfully; a pending job waiting to be retried is 'retrying'"""
+    return [dict(row) for row in conn.execute('''
+        SELECT id, position,
+               CASE WHEN status = 'pending' AND not_before > CURRENT_TIMESTAMP THEN 'retrying' ELSE status END
+                   AS status,
+               error
+        FROM photo_jobs
+        WHERE recipe_id = ? AND status != 'done'
+        ORDER BY position
+    ''', (recipe_id,))]
+
+
+class PhotoWorker:
+    """Processes queued photo jobs on a bounded thread pool"""
+
+    def __init__(self, storage, variant_dir=None, max_workers=2, poll_interval=1.0,
+                 upload_timeout=30, retries=2):
+        self.storage = storage
+        self.variant_dir = variant_dir
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.upload_timeout = upload_timeout
+        self.retries = retries
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._executor = None
+        self._thread = None
+
+    def _ensure_executor(self):
+        # concurrent.futures is imported on first use to keep it out of read-only cold starts
+        from concurrent.futures import ThreadPoolExecutor
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='photo-worker')
+        return self._executor
+
+    def start(self):
+        """Start the dispatcher thread; safe to call on every request"""
+        if self._thread is not None:
+            return
+        self._ensure_executor()
+        with self._lock:
+            if self._thread is not None:
+                return
+            requeue_stale(db.get_connection())
+            self._thread = threading.Thread(target=self._dispatch, name='photo-dispatcher', daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """Wake the dispatcher after enqueueing jobs"""
+        self.start()
+        self._wakeup.set()
+
+    def stop(self, wait=True):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def drain(self, timeout=None):
+        """Stop claiming jobs and wait for the ones in flight; returns False if some are still running.
+
+        Pending jobs stay queued for whichever process runs next.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                self._thread = None
+        while self._inflight:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def wait_idle(self, timeout=None):
+        """Block until the queue is empty and nothing is in flight; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        conn = db.get_connection()
+        while self._inflight or has_pending(conn):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def run_jobs(self, job_ids, timeout=None):
+        """Process specific jobs concurrently and wait up to `timeout` seconds for them.
+
+        Returns one result per job, ordered by position. Jobs still running at the
+        deadline are reported as 'running' and finish in the background; failed jobs
+        queued for another attempt are 'retrying'.
+        """
+        from concurrent.futures import wait
+        executor = self._ensure_executor()
+        # Count the jobs as in flight before claiming them so wait_idle never sees a gap
+        self._add_inflight(len(job_ids))
+        claimed = claim_ids(db.get_connection(), job_ids)
+        self._add_inflight(len(claimed) - len(job_ids))
+
+        futures = {executor.submit(self._execute, job): job for job in claimed}
+        done, _ = wait(futures, timeout=timeout)
+        results = []
+        for future, job in futures.items():
+            if future in done:
+                results.append(future.result())
+            else:
+                results.append({'job_id': job['id'], 'position': job['position'], 'status': 'running'})
+        return sorted(results, key=lambda result: result['position'])
+
+    def _add_inflight(self, count):
+        with self._lock:
+            self._inflight += count
+
+    def _dispatch(self):
+        conn = db.get_connection()
+        while not self._stopped.is_set():
+            self._slots.acquire()
+            if self._stopped.is_set():
+                self._slots.release()
+                break
+            self._add_inflight(1)
+            job = claim(conn)
+            if job is None:
+                self._add_inflight(-1)
+                self._slots.release()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._executor.submit(self._run, job)
+        db.close_connections()
+
+    def _run(self, job):
+        try:
+            self._execute(job)
+        finally:
+            self._slots.release()
+
+    def _execute(self, job):
+        """Process one claimed job and record the outcome; returns a per-photo result"""
+        conn = db.get_connection()
+        result = {'job_id': job['id'], 'position': job['position']}
+        try:
+            try:
+                photo = self.process(job)
+                if complete(conn, job, photo, self.storage):
+                    result.update(status='done', url=photo['url'])
+                else:
+                    result.update(status='cancelled')
+            except Exception as e:
+                logs.error("Photo job failed", e, {"job_id": job['id'], "recipe_id": job['recipe_id'],
+                                                   "attempt": job['attempts'], "error_type": type(e).__name__})
+                db.release()
+                # A pooled PostgreSQL connection went back to the pool; take one again
+                status = fail(db.get_connection(), job, e)
+                result.update(status='retrying' if status == 'pending' else status, error=str(e))
+            if result['status'] != 'retrying' and os.path.exists(job['source_path']):
+                os.remove(job['source_path'])
+        finally:
+            # A pooled PostgreSQL connection goes back for the next job, whichever thread runs it
+            db.release()
+            self._add_inflight(-1)
+        return result
+
+    def process(self, job):
+        """Store one spooled upload, then resize it if the storage keeps it on this machine"""
+        source_path = job['source_path']
+        photo = {'bytes': os.path.getsize(source_path)}
+        started = time.perf_counter()
+        stored = save_with_retries(self.storage, source_path, job['filename'],
+                                   timeout=self.upload_timeout, retries=self.retries)
+        metrics.PHOTO_UPLOAD_SECONDS.observe(time.perf_counter() - started)
+        metrics.PHOTO_BYTES.inc(photo['bytes'])
+        photo.update({k: v for k, v in stored.items() if v is not None})
+
+        # Variants are named after the stored file, so identical uploads share them too
+        filename = photo.setdefault('filename', job['filename'])
+        stored_path = self.storage.local_path(filename) if self.variant_dir else None
+        if stored_path:
+            known = stored_photo(db.get_connection(), photo['url'])
+            if known:
+                photo.update(known)  # A duplicate upload: already resized
+            else:
+                started = time.perf_counter()
+                processed = process_image(stored_path, self.variant_dir, filename)
+                metrics.PHOTO_RESIZE_SECONDS.observe(time.perf_counter() - started)
+                if processed:
+                    photo.update(width=processed['width'], height=processed['height'],
+                                 variants=processed['variants'])
+        return photo
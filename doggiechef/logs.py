@@ -0,0 +1,152 @@
+"""Leveled, sampled request logging.
+
+A RequestLog decides once per request whether its route is sampled, and
+info/debug records of unsampled requests are dropped before anything is
+formatted. Record data can be a callable that is only called when the record
+is written, so an expensive summary costs nothing when it is filtered out.
+Errors are always written. Response sizes are taken from the bytes already
+encoded for the response; the body is never serialized again for logging.
+
+Configured from the environment:
+    DOGGIECHEF_LOG_LEVEL     debug, info (default), warning or error
+    DOGGIECHEF_LOG_SAMPLING  per-route rates, e.g. "GET /api/recipes=0.1,*=1"
+"""
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+LEVEL_NAMES = {value: name.upper() for name, value in LEVELS.items()}
+
+_level = INFO
+_sampling = {}
+_format = 'json'
+_prefix = '[DoggieChef API]'
+
+
+def parse_sampling(value):
+    """Parse "GET /api/recipes=0.1,*=1" into {'GET /api/recipes': 0.1, '*': 1.0}"""
+    rates = {}
+    for item in (value or '').split(','):
+        route, _, rate = item.rpartition('=')
+        if route.strip():
+            rates[route.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def configure(level=None, sampling=None, format=None, prefix=None):
+    """Set the process-wide level, default per-route sample rates and output format ('json' or 'text').
+
+    The DOGGIECHEF_LOG_LEVEL and DOGGIECHEF_LOG_SAMPLING environment variables win over arguments.
+    """
+    global _level, _sampling, _format, _prefix
+    level = os.environ.get('DOGGIECHEF_LOG_LEVEL') or level
+    if level:
+        _level = LEVELS[level.lower()] if isinstance(level, str) else level
+    _sampling = dict(sampling or {})
+    _sampling.update(parse_sampling(os.environ.get('DOGGIECHEF_LOG_SAMPLING')))
+    if format:
+        _format = format
+    if prefix:
+        _prefix = prefix
+
+
+def enabled(level):
+    return level >= _level
+
+
+def sample_rate(route):
+    return _sampling.get(route, _sampling.get('*', 1.0))
+
+
+def _write(level, message, data, error=None):
+    if callable(data):
+        data = data()
+    if _format == 'text':
+        details = ' '.join(f'{key}={value}' for key, value in (data or {}).items())
+        line = ' '.join(part for part in (message, details, f'error={error}' if error else '') if part)
+        print(line, file=sys.stderr if level >= ERROR else sys.stdout, flush=True)
+        return
+    entry = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+        "level": LEVEL_NAMES[level],
+        "message": message,
+        "data": data or {}
+    }
+    if level >= ERROR:
+        entry["error"] = str(error) if error else None
+        print(f"{_prefix[:-1]} ERROR] {json.dumps(entry, default=str)}", file=sys.stderr, flush=True)
+    else:
+        print(f"{_prefix} {json.dumps(entry, default=str)}", flush=True)
+
+
+def log(level, message, data=None, error=None):
+    """Write an unsampled record, e.g. for process start-up"""
+    if enabled(level):
+        _write(level, message, data, error)
+
+
+def debug(message, data=None):
+    log(DEBUG, message, data)
+
+
+def info(message, data=None):
+    log(INFO, message, data)
+
+
+def warning(message, data=None):
+    log(WARNING, message, data)
+
+
+def error(message, error=None, data=None):
+    log(ERROR, message, data, error)
+
+
+class RequestLog:
+    """Records for one request, sampled together by route"""
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        rate = sample_rate(route)
+        self.sampled = rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+    def _log(self, level, message, data, error=None):
+        if level >= ERROR or (self.sampled and enabled(level)):
+            if callable(data):
+                data = data()
+            _write(level, message, dict(data or {}, route=self.route), error)
+
+    def debug(self, message, data=None):
+        self._log(DEBUG, message, data)
+
+    def info(self, message, data=None):
+        self._log(INFO, message, data)
+
+    def warning(self, message, data=None):
+        self._log(WARNING, message, data)
+
+    def error(self, message, error=None, data=None):
+        self._log(ERROR, message, data, error)
+
+    def response(self, status, body=None, data=None):
+        """Log the outcome with the size of the already-encoded body and the elapsed time"""
+        level = ERROR if status >= 500 else INFO
+
+        def summary():
+            extra = data() if callable(data) else data
+            return dict(extra or {}, status=status, bytes=len(body) if body is not None else None,
+                        duration_ms=round((time.perf_counter() - self.started) * 1000, 1))
+
+        self._log(level, "Response sent", summary)
+
+
+def request(route):
+    return RequestLog(route)
+
+
+configure()
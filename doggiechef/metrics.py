@@ -0,0 +1,315 @@
+"""In-process request metrics in the Prometheus text format.
+
+Each sampled request gets a RequestTimer that collects its phases: SQL
+statements (counted and timed by the instrumented connection class db.py
+uses while metrics are on), JSON encoding and anything else wrapped in
+timer.phase(). When the request finishes its totals go into per-route
+histograms, and timer.server_timing() renders them as a Server-Timing header.
+Photo resize and upload times are recorded by the photo worker directly.
+
+Metrics live in the process that recorded them. With DOGGIECHEF_METRICS_DIR
+set to a directory shared by the workers (gunicorn.conf.py sets one up), each
+worker writes its numbers there every few seconds and render() adds up every
+worker's file, including those of workers that have exited, so a scrape of
+/api/metrics sees totals that only grow whichever worker answers it. Without
+it, render() answers with its own process's numbers, labelled worker="<pid>".
+
+DOGGIECHEF_METRICS_SAMPLE sets the share of requests that are timed (default
+1). With 0, request() hands out a shared no-op timer and connections are not
+instrumented at all, so the only cost left is one function call per request.
+"""
+import atexit
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+SAMPLE_RATE = min(1.0, max(0.0, float(os.environ.get('DOGGIECHEF_METRICS_SAMPLE', '1'))))
+# Directory shared by every worker process; their metrics are added up in render()
+MULTIPROCESS_DIR = os.environ.get('DOGGIECHEF_METRICS_DIR') or None
+# Seconds between writes of this process's metrics to MULTIPROCESS_DIR
+FLUSH_INTERVAL = 5.0
+
+_local = threading.local()
+_lock = threading.Lock()
+_flusher_pid = None
+_process_file = None
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in labels)
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, values, other):
+        for key, value in other:
+            values[key] = values.get(key, 0) + value
+
+    def render(self, extra_labels=(), values=None):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in sorted((self.values if values is None else values).items()):
+            lines.append(f'{self.name}{_format_labels(key + extra_labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def merge(self, values, other):
+        for key, series in other:
+            total = values.get(key)
+            values[key] = series if total is None else [a + b for a, b in zip(total, series)]
+
+    def render(self, extra_labels=(), values=None):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, series in sorted((self.values if values is None else values).items()):
+            key += extra_labels
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", bound),))} {count}')
+            lines.append(f'{self.name}_bucket{_format_labels(key + (("le", "+Inf"),))} {series[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {series[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {series[-1]}')
+        return lines
+
+
+REQUESTS = Counter('doggiechef_requests_total', 'Requests handled, by route and status')
+REQUEST_SECONDS = Histogram('doggiechef_request_duration_seconds', 'Request latency by route')
+SQL_STATEMENTS = Counter('doggiechef_sql_statements_total', 'SQL statements executed, by route')
+SQL_SECONDS = Histogram('doggiechef_sql_duration_seconds', 'Time spent executing SQL per request, by route')
+ENCODE_SECONDS = Histogram('doggiechef_json_encode_seconds', 'Time spent encoding JSON per request, by route')
+REQUEST_BYTES = Counter('doggiechef_request_bytes_total', 'Request body bytes received, by route')
+RESPONSE_BYTES = Counter('doggiechef_response_bytes_total', 'Response body bytes sent, by route')
+PHOTO_RESIZE_SECONDS = Histogram('doggiechef_photo_resize_seconds', 'Time to build the resized variants of one photo')
+PHOTO_UPLOAD_SECONDS = Histogram('doggiechef_photo_upload_seconds', 'Time to store one photo, retries included')
+PHOTO_BYTES = Counter('doggiechef_photo_bytes_total', 'Photo bytes stored')
+
+METRICS = (REQUESTS, REQUEST_SECONDS, SQL_STATEMENTS, SQL_SECONDS, ENCODE_SECONDS, REQUEST_BYTES,
+           RESPONSE_BYTES, PHOTO_RESIZE_SECONDS, PHOTO_UPLOAD_SECONDS, PHOTO_BYTES)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format.
+
+    With MULTIPROCESS_DIR these are the totals of every worker; otherwise they are this
+    process's only, and every series carries a worker label with its pid.
+    """
+    if MULTIPROCESS_DIR:
+        flush()
+        totals = {metric.name: {} for metric in METRICS}
+        for snapshot in _read_snapshots():
+            for metric in METRICS:
+                metric.merge(totals[metric.name], snapshot.get(metric.name, ()))
+        lines = [line for metric in METRICS for line in metric.render(values=totals[metric.name])]
+        return '\n'.join(lines) + '\n'
+    worker = (('worker', os.getpid()),)
+    with _lock:
+        lines = [line for metric in METRICS for line in metric.render(worker)]
+    return '\n'.join(lines) + '\n'
+
+
+def flush():
+    """Write this process's metrics to its file in MULTIPROCESS_DIR"""
+    global _process_file
+    if not MULTIPROCESS_DIR:
+        return
+    with _lock:
+        snapshot = {metric.name: [[[list(label) for label in key], value] for key, value in metric.values.items()]
+                    for metric in METRICS}
+    if _process_file is None or not _process_file.startswith(f'{os.getpid()}-'):
+        # Unique per process, so a later worker that reuses a pid does not overwrite an exited one's totals
+        _process_file = f'{os.getpid()}-{time.time_ns()}.json'
+    os.makedirs(MULTIPROCESS_DIR, exist_ok=True)
+    path = os.path.join(MULTIPROCESS_DIR, _process_file)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(path + '.tmp', path)
+
+
+def _read_snapshots():
+    for name in os.listdir(MULTIPROCESS_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(MULTIPROCESS_DIR, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        yield {metric: [(tuple(tuple(label) for label in key), value) for key, value in values]
+               for metric, values in snapshot.items()}
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _start_flusher():
+    """Write this worker's metrics every FLUSH_INTERVAL seconds and when it exits"""
+    global _flusher_pid
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True).start()
+    atexit.register(flush)
+
+
+class RequestTimer:
+    """Phase timings for one request, attributed to its route"""
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.phases = {}  # name -> [seconds, count]
+
+    def add(self, name, seconds, count=1):
+        phase = self.phases.get(name)
+        if phase is None:
+            self.phases[name] = [seconds, count]
+        else:
+            phase[0] += seconds
+            phase[1] += count
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def server_timing(self):
+        """Server-Timing header value: each phase and the total so far, in milliseconds"""
+        entries = [f'{name};dur={seconds * 1000:.2f}' for name, (seconds, _) in self.phases.items()]
+        entries.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.2f}')
+        return ', '.join(entries)
+
+    def finish(self, status, bytes_in=0, bytes_out=0):
+        """Record the request in the route's metrics and stop attributing SQL to it"""
+        if getattr(_local, 'timer', None) is self:
+            _local.timer = None
+        route = self.route
+        REQUESTS.inc(route=route, status=status)
+        REQUEST_SECONDS.observe(time.perf_counter() - self.started, route=route)
+        sql_seconds, sql_count = self.phases.get('db', (0.0, 0))
+        SQL_STATEMENTS.inc(sql_count, route=route)
+        SQL_SECONDS.observe(sql_seconds, route=route)
+        if 'encode' in self.phases:
+            ENCODE_SECONDS.observe(self.phases['encode'][0], route=route)
+        REQUEST_BYTES.inc(bytes_in or 0, route=route)
+        RESPONSE_BYTES.inc(bytes_out or 0, route=route)
+
+
+class _NullTimer:
+    """Stand-in for unsampled requests"""
+
+    route = None
+    phases = {}
+
+    def add(self, name, seconds, count=1):
+        pass
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def server_timing(self):
+        return None
+
+    def finish(self, status, bytes_in=0, bytes_out=0):
+        pass
+
+
+_NULL_PHASE = nullcontext()
+NULL_TIMER = _NullTimer()
+
+
+def enabled():
+    return SAMPLE_RATE > 0.0
+
+
+def request(route):
+    """Start timing a request on this thread; SQL it runs is attributed to it until finish()"""
+    if MULTIPROCESS_DIR and _flusher_pid != os.getpid():
+        _start_flusher()
+    if SAMPLE_RATE <= 0.0 or (SAMPLE_RATE < 1.0 and random.random() >= SAMPLE_RATE):
+        _local.timer = None
+        return NULL_TIMER
+    timer = _local.timer = RequestTimer(route)
+    return timer
+
+
+def current():
+    return getattr(_local, 'timer', None) or NULL_TIMER
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection that adds statement time to the thread's current RequestTimer.
+
+    Only execute() itself is timed, which covers the first step of a query;
+    rows that are fetched lazily afterwards are not.
+    """
+
+    def execute(self, sql, parameters=()):
+        timer = getattr(_local, 'timer', None)
+        if timer is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            timer.add('db', time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        timer = getattr(_local, 'timer', None)
+        if timer is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            timer.add('db', time.perf_counter() - started)
+
+
+def connection_factory():
+    """The sqlite3 connection class db.py should use"""
+    return TimedConnection if enabled() else sqlite3.Connection
@@ -0,0 +1,195 @@
+"""Streaming multipart/form-data parser.
+
+Replaces cgi.FieldStorage (removed in Python 3.13). The body is read in
+fixed-size chunks and file parts are written straight to spool files on
+disk, so an upload never sits in memory more than one chunk at a time.
+Size limits are enforced while streaming, before the whole body is read.
+"""
+import os
+import re
+import uuid
+from urllib.parse import unquote
+
+CHUNK_SIZE = 64 * 1024
+MAX_HEADER_SIZE = 16 * 1024
+MAX_FIELD_SIZE = 1024 * 1024  # plain form fields such as ingredients
+MAX_FILE_SIZE = 16 * 1024 * 1024
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+_OPTION_RE = re.compile(r';\s*([\w\-*]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+
+class MultipartError(ValueError):
+    """The body is not valid multipart/form-data"""
+
+
+class RequestTooLarge(MultipartError):
+    """A part or the whole body exceeds its size limit"""
+
+
+def parse_options_header(value):
+    """Split 'form-data; name="photos"; filename="a.jpg"' into ('form-data', {...})"""
+    main, _, rest = (value or '').partition(';')
+    options = {}
+    for key, raw in _OPTION_RE.findall(';' + rest):
+        key = key.lower()
+        raw = raw.strip()
+        if raw.startswith('"'):
+            raw = re.sub(r'\\(.)', r'\1', raw[1:-1])
+        if key.endswith('*'):
+            # RFC 5987: filename*=UTF-8''na%C3%AFve.jpg
+            charset, _, encoded = raw.partition("''")
+            key, raw = key[:-1], unquote(encoded, encoding=charset or 'utf-8')
+        options[key] = raw
+    return main.strip().lower(), options
+
+
+class UploadedFile:
+    """A file part spooled to disk"""
+
+    def __init__(self, name, filename, content_type, path):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.path = path
+        self.size = 0
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MultipartParser:
+    def __init__(self, stream, boundary, content_length, spool_dir,
+                 max_file_size=MAX_FILE_SIZE, max_body_size=MAX_BODY_SIZE,
+                 max_field_size=MAX_FIELD_SIZE):
+        if content_length > max_body_size:
+            raise RequestTooLarge(f'Request body exceeds {max_body_size} bytes')
+        self.stream = stream
+        self.boundary = b'--' + boundary.encode('latin-1')
+        self.delimiter = b'\r\n' + self.boundary
+        self.remaining = content_length
+        self.spool_dir = spool_dir
+        self.max_file_size = max_file_size
+        self.max_field_size = max_field_size
+        self.buffer = bytearray()
+
+    def _fill(self):
+        """Read the next chunk into the buffer; False once the body is exhausted"""
+        if self.remaining <= 0:
+            return False
+        chunk = self.stream.read(min(CHUNK_SIZE, self.remaining))
+        if not chunk:
+            raise MultipartError('Unexpected end of request body')
+        self.remaining -= len(chunk)
+        self.buffer += chunk
+        return True
+
+    def parse(self):
+        """Return (fields, files); files are UploadedFile objects in body order"""
+        fields = {}
+        files = []
+        try:
+            final = self._skip_preamble()
+            while not final:
+                disposition, content_type = self._read_part_headers()
+                kind, options = parse_options_header(disposition)
+                if kind != 'form-data' or 'name' not in options:
+                    raise MultipartError('Part without a form-data name')
+                name = options['name']
+                if 'filename' in options:
+                    upload = self._spool_file(name, options['filename'], content_type)
+                    files.append(upload)
+                    final = self._read_file_body(upload)
+                else:
+                    value = bytearray()
+                    final = self._read_body(value.extend, self.max_field_size, name)
+                    fields[name] = value.decode('utf-8', 'replace')
+        except Exception:
+            for upload in files:
+                upload.discard()
+            raise
+        return fields, files
+
+    def _skip_preamble(self):
+        while True:
+            index = self.buffer.find(self.boundary)
+            if index >= 0:
+                del self.buffer[:index + len(self.boundary)]
+                return self._after_boundary()
+            # Keep a possible partial boundary at the end of the buffer
+            del self.buffer[:max(0, len(self.buffer) - len(self.boundary))]
+            if not self._fill():
+                raise MultipartError('Missing multipart boundary')
+
+    def _after_boundary(self):
+        """Consume what follows a boundary; True if it was the closing one"""
+        while len(self.buffer) < 2:
+            if not self._fill():
+                raise MultipartError('Unexpected end of request body')
+        if self.buffer[:2] == b'--':
+            return True
+        while True:
+            end = self.buffer.find(b'\r\n')
+            if end >= 0:
+                del self.buffer[:end + 2]
+                return False
+            if len(self.buffer) > MAX_HEADER_SIZE or not self._fill():
+                raise MultipartError('Malformed multipart boundary line')
+
+    def _read_part_headers(self):
+        while True:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end >= 0:
+                break
+            if len(self.buffer) > MAX_HEADER_SIZE:
+                raise MultipartError('Multipart part headers too large')
+            if not self._fill():
+                raise MultipartError('Unexpected end of request body')
+        raw = bytes(self.buffer[:end]).decode('utf-8', 'replace')
+        del self.buffer[:end + 4]
+        headers = {}
+        for line in raw.split('\r\n'):
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+        return headers.get('content-disposition', ''), headers.get('content-type')
+
+    def _spool_file(self, name, filename, content_type):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        extension = os.path.splitext(filename)[1].lower()
+        path = os.path.join(self.spool_dir, f"{uuid.uuid4().hex}{extension}")
+        return UploadedFile(name, filename, content_type, path)
+
+    def _read_file_body(self, upload):
+        with open(upload.path, 'wb') as f:
+            def write(data):
+                upload.size += len(data)
+                f.write(data)
+            return self._read_body(write, self.max_file_size, upload.filename)
+
+    def _read_body(self, write, limit, label):
+        """Stream one part body to `write`; True if it ended with the closing boundary"""
+        written = 0
+        keep = len(self.delimiter) - 1
+        while True:
+            index = self.buffer.find(self.delimiter)
+            end = index if index >= 0 else max(0, len(self.buffer) - keep)
+            if end:
+                written += end
+                if written > limit:
+                    raise RequestTooLarge(f'{label} exceeds {limit} bytes')
+                write(bytes(self.buffer[:end]))
+                del self.buffer[:end]
+            if index >= 0:
+                del self.buffer[:len(self.delimiter)]
+                return self._after_boundary()
+            if not self._fill():
+                raise MultipartError('Unexpected end of request body')
+
+
+def parse_multipart(stream, content_type, content_length, spool_dir, **limits):
+    """Parse a multipart/form-data body from `stream` into (fields, files)"""
+    kind, options = parse_options_header(content_type)
+    if kind != 'multipart/form-data' or not options.get('boundary'):
+        raise MultipartError('Expected multipart/form-data with a boundary')
+    return MultipartParser(stream, options['boundary'], content_length, spool_dir, **limits).parse()
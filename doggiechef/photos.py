@@ -0,0 +1,139 @@
+"""Recipe photo rows stored in the recipe_photos table.
+
+Photos are hydrated for a whole page of recipes with one batched IN (...)
+query instead of being parsed out of a text column row by row. Content-
+addressed storage lets several rows share a URL, so the rows referring to a
+URL are its reference count; writers adding or dropping the last reference
+hold lock_photo() so a file is never removed while a new row points at it.
+"""
+import json
+import os
+
+# Stay well under SQLite's bound-parameter limit when hydrating unpaginated lists
+IN_BATCH_SIZE = 500
+
+
+def parse_legacy_photos(value):
+    """Parse the old recipes.photos column, which was either comma-joined or a JSON list"""
+    if not value:
+        return []
+    value = value.strip()
+    if value.startswith('['):
+        try:
+            return [url for url in json.loads(value) if url]
+        except ValueError:
+            pass
+    return [url for url in value.split(',') if url]
+
+
+def migrate_legacy_photos(conn):
+    """Move photos out of recipes.photos into recipe_photos"""
+    rows = conn.execute(
+        "SELECT id, photos FROM recipes WHERE photos IS NOT NULL AND photos != ''"
+    ).fetchall()
+    for row in rows:
+        conn.executemany(
+            'INSERT INTO recipe_photos (recipe_id, position, url) VALUES (?, ?, ?) ON CONFLICT DO NOTHING',
+            [(row['id'], position, url) for position, url in enumerate(parse_legacy_photos(row['photos']))]
+        )
+    conn.execute("UPDATE recipes SET photos = NULL WHERE photos IS NOT NULL")
+
+
+def add_photos(conn, recipe_id, photos):
+    """Append photos to a recipe.
+
+    Each photo is a URL or a dict with url/width/height/bytes, plus filename and
+    variants for locally processed uploads.
+    """
+    if not photos:
+        return
+    start = next_position(conn, recipe_id)
+    rows = []
+    for offset, photo in enumerate(photos):
+        if isinstance(photo, str):
+            photo = {'url': photo}
+        rows.append((recipe_id, start + offset, photo['url'],
+                     photo.get('width'), photo.get('height'), photo.get('bytes')))
+        if photo.get('variants'):
+            add_variants(conn, photo['filename'], photo['variants'])
+    conn.executemany('''
+        INSERT INTO recipe_photos (recipe_id, position, url, width, height, bytes)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+
+def next_position(conn, recipe_id):
+    """First free photo position, counting photos still queued for processing"""
+    return conn.execute('''
+        SELECT COALESCE(MAX(position) + 1, 0) FROM (
+            SELECT position FROM recipe_photos WHERE recipe_id = ?
+            UNION ALL
+            SELECT position FROM photo_jobs WHERE recipe_id = ?
+        ) AS positions
+    ''', (recipe_id, recipe_id)).fetchone()[0]
+
+
+def load_photos(conn, recipe_ids, first_only=False):
+    """Return {recipe_id: [url, ...]} for a page of recipes in a single query"""
+    photos = {recipe_id: [] for recipe_id in recipe_ids}
+    ids = list(photos)
+    for start in range(0, len(ids), IN_BATCH_SIZE):
+        batch = ids[start:start + IN_BATCH_SIZE]
+        placeholders = ', '.join('?' * len(batch))
+        query = f'SELECT recipe_id, url FROM recipe_photos WHERE recipe_id IN ({placeholders})'
+        if first_only:
+            # Positions can have gaps when a queued photo failed to process
+            query += (' AND position = (SELECT MIN(position) FROM recipe_photos AS first'
+                      ' WHERE first.recipe_id = recipe_photos.recipe_id)')
+        query += ' ORDER BY recipe_id, position'
+        for row in conn.execute(query, batch):
+            photos[row['recipe_id']].append(row['url'])
+    return photos
+
+
+def add_variants(conn, filename, variants):
+    """Record the resized variants written for an uploaded photo"""
+    conn.executemany('''
+        INSERT INTO photo_variants (filename, width, format, height, bytes)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (filename, width, format) DO UPDATE SET height = excluded.height, bytes = excluded.bytes
+    ''', [(filename, v['width'], v['format'], v['height'], v['bytes']) for v in variants])
+
+
+def load_variants(conn, filename):
+    return [dict(row) for row in conn.execute(
+        'SELECT width, format, height, bytes FROM photo_variants WHERE filename = ?', (filename,)
+    )]
+
+
+def stored_photo(conn, url):
+    """Size and variants of a photo some recipe already uses, or None"""
+    row = conn.execute('SELECT width, height FROM recipe_photos WHERE url = ? LIMIT 1', (url,)).fetchone()
+    if row is None:
+        return None
+    variants = load_variants(conn, os.path.basename(url))
+    if not variants:
+        return None
+    return {'width': row['width'], 'height': row['height'], 'variants': variants}
+
+
+def lock_photo(conn, url):
+    """Within a write transaction, wait for any other transaction adding or dropping references to `url`.
+
+    SQLite's write lock already serializes them; PostgreSQL takes an advisory lock on the URL.
+    """
+    if getattr(conn, 'dialect', None) == 'postgres':
+        conn.execute('SELECT pg_advisory_xact_lock(hashtext(?))', (url,))
+
+
+def unreferenced(conn, urls):
+    """The URLs no recipe_photos row refers to any more"""
+    return [url for url in urls
+            if conn.execute('SELECT 1 FROM recipe_photos WHERE url = ? LIMIT 1', (url,)).fetchone() is None]
+
+
+def delete_variants(conn, filename):
+    """Forget the variants of a photo, returning them so their files can be removed"""
+    variants = load_variants(conn, filename)
+    conn.execute('DELETE FROM photo_variants WHERE filename = ?', (filename,))
+    return variants
@@ -0,0 +1,493 @@
+"""PostgreSQL backend, used instead of SQLite when DOGGIECHEF_DATABASE_URL is set.
+
+SQLite takes one writer at a time per database file; PostgreSQL locks rows,
+so gunicorn workers, serverless instances and the bulk importer can all
+write at once. db.get_connection() then hands out a PostgresConnection from
+a thread-safe pool: it speaks the sqlite3 interface the rest of the package
+uses (execute() with ? placeholders, rows by name or index, lastrowid,
+BEGIN IMMEDIATE, savepoints), so the same queries run on both.
+
+- Every query is PREPAREd on first use and run with EXECUTE afterwards, up
+  to STATEMENT_CACHE_SIZE per connection, like sqlite3's statement cache.
+- Search uses a GIN index over a weighted tsvector expression, plus a
+  pg_trgm index on titles for typo-tolerant matches where the extension
+  is available (see search.py).
+- Bulk imports load recipe rows with COPY (see bulk.py).
+- The rows every write would otherwise update are views here, so writers
+  never wait on each other's row locks: data_version reads a sequence that
+  is bumped after each commit, and recipe_facets counts the recipes table
+  on read (see facets.py), which the response cache keeps off the hot path.
+
+The schema is created on first connection, under an advisory lock so only
+one process runs it.
+"""
+import io
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+from doggiechef import facets, logs, metrics
+
+POOL_SIZE = int(os.environ.get('DOGGIECHEF_PG_POOL_SIZE', '10'))
+# Seconds a thread waits for a free pooled connection
+POOL_TIMEOUT = float(os.environ.get('DOGGIECHEF_PG_POOL_TIMEOUT', '30'))
+STATEMENT_CACHE_SIZE = 256
+# Key of the advisory lock held while the schema is created
+SCHEMA_LOCK_ID = 0x646f6767
+
+# Same weights as BM25_WEIGHTS in search.py: title (A) 10, ingredients (B) 5, description (C) 2
+SEARCH_VECTOR = ("setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+                 "setweight(to_tsvector('simple', coalesce(ingredients, '')), 'B') || "
+                 "setweight(to_tsvector('simple', coalesce(description, '')), 'C')")
+
+SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS recipes (
+        id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        title TEXT NOT NULL,
+        description TEXT,
+        country TEXT NOT NULL,
+        protein_type TEXT NOT NULL,
+        cooking_time INTEGER,
+        difficulty TEXT,
+        ingredients TEXT,
+        photos TEXT,
+        created_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_recipes_created ON recipes (created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_recipes_country_created ON recipes (country, created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_recipes_protein_created ON recipes (protein_type, created_at, id);
+    CREATE INDEX IF NOT EXISTS idx_recipes_search ON recipes USING GIN (({SEARCH_VECTOR}));
+
+    CREATE TABLE IF NOT EXISTS recipe_photos (
+        recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        url TEXT NOT NULL,
+        width INTEGER,
+        height INTEGER,
+        bytes INTEGER,
+        PRIMARY KEY (recipe_id, position)
+    );
+    CREATE INDEX IF NOT EXISTS idx_recipe_photos_url ON recipe_photos (url);
+
+    CREATE TABLE IF NOT EXISTS photo_variants (
+        filename TEXT NOT NULL,
+        width INTEGER NOT NULL,
+        format TEXT NOT NULL,
+        height INTEGER NOT NULL,
+        bytes INTEGER NOT NULL,
+        PRIMARY KEY (filename, width, format)
+    );
+
+    CREATE TABLE IF NOT EXISTS photo_jobs (
+        id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        source_path TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        not_before TIMESTAMP(0),
+        created_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP
+    );
+    ALTER TABLE photo_jobs ADD COLUMN IF NOT EXISTS not_before TIMESTAMP(0);
+    CREATE INDEX IF NOT EXISTS idx_photo_jobs_status ON photo_jobs (status, id);
+    CREATE INDEX IF NOT EXISTS idx_photo_jobs_recipe ON photo_jobs (recipe_id);
+
+    CREATE TABLE IF NOT EXISTS ingredients (
+        id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS recipe_ingredients (
+        recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        ingredient_id INTEGER NOT NULL REFERENCES ingredients (id),
+        quantity REAL,
+        unit TEXT,
+        raw TEXT NOT NULL,
+        PRIMARY KEY (recipe_id, position)
+    );
+    CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_ingredient ON recipe_ingredients (ingredient_id, recipe_id);
+
+    -- Bumped after every commit (see PostgresConnection.commit); never locked, unlike a counter row.
+    -- A new sequence reports last_value 1 before and after its first nextval(), so is_called counts too.
+    CREATE SEQUENCE IF NOT EXISTS data_version_seq;
+    CREATE OR REPLACE VIEW data_version AS
+        SELECT last_value + is_called::int AS version FROM data_version_seq;
+
+    {facets.POSTGRES_SCHEMA}
+
+    CREATE TABLE IF NOT EXISTS bulk_imports (
+        import_id TEXT PRIMARY KEY,
+        records_done INTEGER NOT NULL DEFAULT 0,
+        recipes_created INTEGER NOT NULL DEFAULT 0,
+        started_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP(0) DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP(0)
+    );
+'''
+
+TRIGRAM_SCHEMA = '''
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS idx_recipes_title_trgm ON recipes USING GIN (title gin_trgm_ops);
+'''
+
+# Timestamps come back as the text PostgreSQL prints for TIMESTAMP(0), which is
+# what SQLite stores: '2024-05-01 12:30:00'. Cursors and JSON stay identical.
+TIMESTAMP_AS_TEXT = psycopg2.extensions.new_type((1114,), 'TIMESTAMP_AS_TEXT', lambda value, cursor: value)
+
+_PLACEHOLDER_RE = re.compile(r"'(?:[^']|'')*'|\?")
+_PREPARED_KINDS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+_WRITE_KINDS = ('INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def _placeholders(sql, style):
+    """Replace ? outside string literals with %s, or $1, $2, ... for PREPARE; returns (sql, count)"""
+    count = 0
+
+    def replace(match):
+        nonlocal count
+        if match.group() != '?':
+            return match.group()
+        count += 1
+        return f'${count}' if style == 'numeric' else '%s'
+    # psycopg2 only interpolates, and so only needs % escaped, when there are parameters
+    escaped = sql.replace('%', '%%') if style == 'pyformat' else sql
+    converted = _PLACEHOLDER_RE.sub(replace, escaped)
+    return (converted if count else sql), count
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class PostgresError(Exception):
+    pass
+
+
+class Cursor:
+    """The sqlite3.Cursor surface the package uses"""
+
+    def __init__(self, conn, cursor):
+        self._conn = conn
+        self._cursor = cursor
+
+    @property
+    def lastrowid(self):
+        """Id generated by the INSERT just executed; read it before the next one"""
+        return self._conn._raw_execute('SELECT lastval()').fetchone()[0]
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+
+class PostgresConnection:
+    """A pooled psycopg2 connection with sqlite3's interface.
+
+    Runs in autocommit mode, so statements outside a transaction commit on
+    their own as in sqlite3, and BEGIN/COMMIT are issued explicitly.
+    """
+    dialect = 'postgres'
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._prepared = OrderedDict()  # sql -> (statement name, parameter count)
+        self._counter = 0
+        self._wrote = False
+
+    @property
+    def closed(self):
+        return bool(self._raw.closed)
+
+    @property
+    def in_transaction(self):
+        return self._raw.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    @property
+    def trigram(self):
+        """Whether pg_trgm is installed, for search's typo-tolerant fallback"""
+        return self._pool.trigram
+
+    def _raw_execute(self, sql, parameters=None):
+        cursor = self._raw.cursor()
+        cursor.execute(sql, parameters)
+        return cursor
+
+    def _statement(self, sql):
+        """Name and parameter count of the prepared form of `sql`, preparing it on first use"""
+        entry = self._prepared.get(sql)
+        if entry is not None:
+            self._prepared.move_to_end(sql)
+            return entry
+        self._counter += 1
+        name = f'doggiechef_{self._counter}'
+        numbered, count = _placeholders(sql, 'numeric')
+        self._raw_execute(f'PREPARE {name} AS {numbered}')
+        entry = self._prepared[sql] = (name, count)
+        while len(self._prepared) > STATEMENT_CACHE_SIZE:
+            _, (evicted, _) = self._prepared.popitem(last=False)
+            self._raw_execute(f'DEALLOCATE {evicted}')
+        return entry
+
+    def _execute_sql(self, sql):
+        """The statement to run for `sql` and its parameter style"""
+        statement = sql.strip()
+        if statement.upper() == 'BEGIN IMMEDIATE':
+            # Row locks make taking the whole database up front unnecessary
+            return 'BEGIN', 0
+        if statement.split(None, 1)[0].upper() not in _PREPARED_KINDS:
+            return _placeholders(statement, 'pyformat')
+        name, count = self._statement(statement)
+        if not count:
+            return f'EXECUTE {name}', 0
+        return f"EXECUTE {name} ({', '.join(['%s'] * count)})", count
+
+    def _timed(self, run):
+        started = time.perf_counter()
+        try:
+            return run()
+        finally:
+            metrics.current().add('db', time.perf_counter() - started)
+
+    def _changed(self, sql):
+        """Note a write, so cached responses are invalidated once it is committed"""
+        if sql.lstrip().split(None, 1)[0].upper() not in _WRITE_KINDS:
+            return
+        if self.in_transaction:
+            self._wrote = True
+        else:
+            self._bump_version()
+
+    def execute(self, sql, parameters=()):
+        statement, count = self._execute_sql(sql)
+        cursor = self._raw.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        self._timed(lambda: cursor.execute(statement, tuple(parameters) if count else None))
+        self._changed(sql)
+        return Cursor(self, cursor)
+
+    def executemany(self, sql, seq_of_parameters):
+        statement, count = self._execute_sql(sql)
+        cursor = self._raw.cursor()
+        rows = [tuple(parameters) for parameters in seq_of_parameters]
+        # Many EXECUTEs per round trip
+        self._timed(lambda: psycopg2.extras.execute_batch(cursor, statement, rows, page_size=100))
+        self._changed(sql)
+        return Cursor(self, cursor)
+
+    def stream(self, sql, parameters=(), batch_size=200):
+        """Execute a query on a server-side cursor, so fetchmany() reads rows as it goes.
+
+        execute() receives the whole result at once, unlike sqlite3; use this for exports.
+        """
+        statement, count = _placeholders(sql, 'pyformat')
+        self._counter += 1
+        cursor = self._raw.cursor(name=f'doggiechef_stream_{self._counter}', withhold=True,
+                                  cursor_factory=psycopg2.extras.DictCursor)
+        cursor.itersize = batch_size
+        cursor.execute(statement, tuple(parameters) if count else None)
+        return Cursor(self, cursor)
+
+    def reserve_ids(self, table, count):
+        """`count` new ids from a table's identity sequence, for rows inserted with COPY"""
+        cursor = self._raw_execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)', (table, 'id', count))
+        return [row[0] for row in cursor.fetchall()]
+
+    def copy_rows(self, table, columns, rows):
+        """Load rows into a table with COPY FROM STDIN"""
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor = self._raw.cursor()
+        self._timed(lambda: cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer))
+        self._changed('INSERT')
+
+    def _bump_version(self):
+        # After the commit, so a reader that saw the new version also sees the new rows
+        self._raw_execute("SELECT nextval('data_version_seq')")
+
+    def commit(self):
+        if self.in_transaction:
+            self._raw_execute('COMMIT')
+        if self._wrote:
+            self._wrote = False
+            self._bump_version()
+
+    def rollback(self):
+        if self.in_transaction:
+            self._raw_execute('ROLLBACK')
+        self._wrote = False
+
+    def __enter__(self):
+        if not self.in_transaction:
+            self._raw_execute('BEGIN')
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def close(self):
+        self._raw.close()
+
+
+class ConnectionPool:
+    """Thread-safe pool of up to `size` connections; get() waits up to `timeout` seconds for one"""
+
+    def __init__(self, url, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.url = url
+        self.size = size
+        self.timeout = timeout
+        self.trigram = False
+        self._idle = []
+        self._open = 0
+        self._condition = threading.Condition()
+
+    def _connect(self):
+        # UTC, so CURRENT_TIMESTAMP matches what SQLite stores
+        raw = psycopg2.connect(self.url, options='-c timezone=UTC', application_name='doggiechef')
+        raw.autocommit = True
+        psycopg2.extensions.register_type(TIMESTAMP_AS_TEXT, raw)
+        return PostgresConnection(self, raw)
+
+    def get(self):
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while not self._idle and self._open >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PostgresError(f'No free PostgreSQL connection after {self.timeout}s '
+                                        f'(DOGGIECHEF_PG_POOL_SIZE={self.size})')
+                self._condition.wait(remaining)
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+        try:
+            return self._connect()
+        except BaseException:
+            with self._condition:
+                self._open -= 1
+                self._condition.notify()
+            raise
+
+    def put(self, conn):
+        """Return a connection, rolling back anything left open; broken ones are dropped"""
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                conn.close()
+        with self._condition:
+            if conn.closed:
+                self._open -= 1
+            else:
+                self._idle.append(conn)
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_pool(url):
+    """The process's pool for `url`, creating the schema when it is first opened"""
+    pool = _pools.get(url)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(url)
+        if pool is None:
+            pool = ConnectionPool(url)
+            conn = pool.get()
+            try:
+                create_schema(conn)
+            finally:
+                pool.put(conn)
+            _pools[url] = pool
+    return pool
+
+
+def create_schema(conn):
+    """Create every table, index and view that is missing; safe to run from several processes at once"""
+    raw = conn._raw
+    with raw.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        trigram = cursor.fetchone() is not None
+        cursor.execute('BEGIN')
+        try:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', (SCHEMA_LOCK_ID,))
+            cursor.execute(SCHEMA)
+            if trigram:
+                cursor.execute('SAVEPOINT trigram')
+                try:
+                    cursor.execute(TRIGRAM_SCHEMA)
+                except psycopg2.Error as e:
+                    # Available but not installable by this role: search works without it
+                    cursor.execute('ROLLBACK TO SAVEPOINT trigram')
+                    logs.warning("⚠️ pg_trgm not enabled, typo-tolerant search is off", {"error": str(e).strip()})
+                    trigram = False
+            cursor.execute('COMMIT')
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+    conn._pool.trigram = trigram
+
+
+def get_connection(url):
+    """This thread's pooled connection, borrowed until release()"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and not conn.closed:
+        return conn
+    if conn is not None:
+        conn._pool.put(conn)
+    conn = _local.conn = get_pool(url).get()
+    return conn
+
+
+def release():
+    """Give this thread's connection back to its pool, rolled back if a request left it mid-transaction"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.conn = None
+        conn._pool.put(conn)
@@ -0,0 +1,401 @@
+"""Recipe service shared by the Flask app and the serverless functions.
+
+Every entry point goes through RecipeRepository for its queries, row-to-dict
+mapping and validation, so both deployments return the same JSON and pick up
+the same query improvements. Fixed statements are module constants so that
+sqlite3's per-connection statement cache reuses their prepared form.
+"""
+import base64
+import json
+import os
+import uuid
+
+from doggiechef import db, encoding, facets, ingredients, jobs
+from doggiechef.images import variant_filename
+from doggiechef.photos import delete_variants, load_photos, lock_photo, unreferenced
+
+MAX_PAGE_SIZE = 100
+REQUIRED_FIELDS = ('title', 'country', 'protein_type')
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'heic', 'webp'}
+
+# Columns the list endpoint can project with ?fields=; 'thumbnail' is the first photo
+RECIPE_FIELDS = ('id', 'title', 'description', 'country', 'protein_type', 'cooking_time',
+                 'difficulty', 'ingredients', 'photos', 'created_at', 'updated_at')
+LIST_FIELDS = RECIPE_FIELDS + ('thumbnail',)
+
+# Written by INSERT_RECIPE, and in this order by the bulk importer's COPY
+RECIPE_COLUMNS = ('title', 'description', 'country', 'protein_type', 'cooking_time', 'difficulty', 'ingredients')
+
+SELECT_RECIPE = 'SELECT * FROM recipes WHERE id = ?'
+RECIPE_EXISTS = 'SELECT 1 FROM recipes WHERE id = ?'
+INSERT_RECIPE = '''
+    INSERT INTO recipes (title, description, country, protein_type, cooking_time, difficulty, ingredients)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+UPDATE_RECIPE = '''
+    UPDATE recipes
+    SET title = ?, description = ?, country = ?, protein_type = ?,
+        cooking_time = ?, difficulty = ?, ingredients = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+DELETE_RECIPE = 'DELETE FROM recipes WHERE id = ?'
+
+# Encoded list rows, shared by every connection in the process; see list_json()
+row_fragments = encoding.FragmentCache()
+# List fields filled from recipe_photos rather than the recipes row
+PHOTO_FIELDS = frozenset(('photos', 'thumbnail'))
+
+# Export formats and their content types; rows are fetched and sent this many at a time
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+EXPORT_BATCH_SIZE = 200
+
+
+def encode_cursor(created_at, recipe_id):
+    """Encode the (created_at, id) keyset position of the last row on a page"""
+    raw = json.dumps([created_at, recipe_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, recipe_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(created_at), int(recipe_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def parse_fields(fields):
+    """Parse a ?fields= projection, always keeping the id"""
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in requested if f not in LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ['id'] + [f for f in requested if f != 'id']
+
+
+def int_param(args, name, default=None):
+    """An integer query parameter from a {name: value} mapping, or `default` if it is missing; raises ValueError"""
+    value = args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer')
+
+
+def parse_list_params(args):
+    """Validate list query parameters from a {name: value} mapping; raises ValueError"""
+    limit = int_param(args, 'limit')
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    cursor = args.get('cursor')
+    return {
+        'country': args.get('country') or None,
+        'protein_type': args.get('protein_type') or None,
+        'limit': limit,
+        'after': decode_cursor(cursor) if cursor else None,
+        'fields': parse_fields(args.get('fields')),
+    }
+
+
+def validate_recipe(data):
+    """Column values for INSERT_RECIPE/UPDATE_RECIPE from submitted form or JSON data; raises ValueError"""
+    missing = [field for field in REQUIRED_FIELDS if not data.get(field)]
+    if missing:
+        raise ValueError(f"Required fields missing: {', '.join(missing)}")
+    cooking_time = data.get('cooking_time')
+    if cooking_time in (None, ''):
+        cooking_time = None
+    else:
+        try:
+            cooking_time = int(cooking_time)
+        except (TypeError, ValueError):
+            raise ValueError('cooking_time must be a whole number of minutes')
+    return (
+        data.get('title'),
+        data.get('description'),
+        data.get('country'),
+        data.get('protein_type'),
+        cooking_time,
+        data.get('difficulty'),
+        data.get('ingredients'),
+    )
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def spool_photos(uploads):
+    """Pick the allowed photo uploads for the photo worker; returns (path, filename) pairs"""
+    if not uploads:
+        return []
+    # Imported here so read-only cold starts skip werkzeug
+    from werkzeug.utils import secure_filename
+    spooled = []
+    for upload in uploads:
+        if upload.filename and allowed_file(upload.filename):
+            spooled.append((upload.path, f"{uuid.uuid4()}_{secure_filename(upload.filename)}"))
+        else:
+            upload.discard()
+    return spooled
+
+
+def discard_spooled(spooled):
+    """Remove spooled photos that were never queued, e.g. because validation failed"""
+    for path, _ in spooled:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class RecipeRepository:
+    """Recipe reads and writes on one connection.
+
+    `storage` and `variant_dir` are where this deployment keeps photos, so
+    deleting a recipe can remove its files too. Writes go through `writer`, a
+    GroupCommitWriter, when one is given, and commit on `conn` otherwise.
+    """
+
+    def __init__(self, conn, storage=None, variant_dir=None, writer=None):
+        self.conn = conn
+        self.storage = storage
+        self.variant_dir = variant_dir
+        self.writer = writer
+
+    def _write(self, work):
+        """Run work(conn) in a write transaction and return its result"""
+        if self.writer is not None:
+            return self.writer.run(work)
+        with db.transaction(self.conn):
+            return work(self.conn)
+
+    def _page(self, country, protein_type, limit, after, fields):
+        """Rows of one page, newest first, with their photos and the next cursor"""
+        if fields is None:
+            columns = ['*']
+        else:
+            # created_at is always selected so the next cursor can be built
+            columns = [f for f in fields if f not in ('photos', 'thumbnail')]
+            if 'created_at' not in columns:
+                columns.append('created_at')
+
+        query = f"SELECT {', '.join(columns)} FROM recipes"
+        conditions = []
+        params = []
+        if country:
+            conditions.append('country = ?')
+            params.append(country)
+        if protein_type:
+            conditions.append('protein_type = ?')
+            params.append(protein_type)
+        if after:
+            conditions.append('(created_at, id) < (?, ?)')
+            params.extend(after)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY created_at DESC, id DESC'
+        if limit is not None:
+            # Fetch one extra row to know whether another page exists
+            query += ' LIMIT ?'
+            params.append(limit + 1)
+
+        rows = self.conn.execute(query, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+
+        # Hydrate photos for the whole page in one query; a thumbnail-only view just needs the first
+        wants_photos = fields is None or 'photos' in fields
+        wants_thumbnail = fields is not None and 'thumbnail' in fields
+        page_photos = {}
+        if wants_photos or wants_thumbnail:
+            page_photos = load_photos(self.conn, [row['id'] for row in rows], first_only=not wants_photos)
+        return rows, page_photos, next_cursor
+
+    def list(self, country=None, protein_type=None, limit=None, after=None, fields=None):
+        """One page of recipes, newest first, as (recipes, next_cursor)"""
+        rows, page_photos, next_cursor = self._page(country, protein_type, limit, after, fields)
+        wants_photos = fields is None or 'photos' in fields
+        wants_thumbnail = fields is not None and 'thumbnail' in fields
+        recipes = []
+        for row in rows:
+            recipe = dict(row)
+            photos = page_photos.get(recipe['id'], [])
+            if wants_photos:
+                recipe['photos'] = photos
+            if wants_thumbnail:
+                recipe['thumbnail'] = photos[0] if photos else None
+            if fields is not None:
+                recipe = {f: recipe[f] for f in fields}
+            recipes.append(recipe)
+        return recipes, next_cursor
+
+    def list_json(self, country=None, protein_type=None, limit=None, after=None, fields=None):
+        """The same page as list(), already encoded as a JSON array, as (body, next_cursor).
+
+        Rows are encoded straight from sqlite3.Row without building dicts, and
+        each row's encoding is reused from row_fragments until its values change.
+        """
+        rows, page_photos, next_cursor = self._page(country, protein_type, limit, after, fields)
+        if not rows:
+            return b'[]', next_cursor
+        if fields is None:
+            # Same key order as dict(row); the legacy photos column is replaced by recipe_photos
+            output = tuple(rows[0].keys())
+            if 'photos' not in output:
+                output += ('photos',)
+        else:
+            output = tuple(fields)
+        fragments = []
+        for row in rows:
+            photos = page_photos.get(row['id'], [])
+            slot_values = {'photos': photos, 'thumbnail': photos[0] if photos else None}
+            fragments.append(row_fragments.encode(row['id'], output, row, PHOTO_FIELDS, slot_values))
+        return encoding.join_array(fragments), next_cursor
+
+    def export(self, format='ndjson', country=None, protein_type=None, batch_size=EXPORT_BATCH_SIZE):
+        """Every recipe in id order as an iterator of encoded chunks, one per batch of rows.
+
+        The query runs before this returns, so bad arguments raise ValueError up front;
+        rows are then read with fetchmany(), so memory stays flat however many there are
+        (on PostgreSQL from a server-side cursor).
+        """
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+        query = 'SELECT * FROM recipes'
+        conditions = []
+        params = []
+        if country:
+            conditions.append('country = ?')
+            params.append(country)
+        if protein_type:
+            conditions.append('protein_type = ?')
+            params.append(protein_type)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        execute = getattr(self.conn, 'stream', self.conn.execute)
+        cursor = execute(query + ' ORDER BY id', params)
+        return self._export_chunks(cursor, format, batch_size)
+
+    def _export_chunks(self, cursor, format, batch_size):
+        array = format == 'json'
+        try:
+            if array:
+                yield b'['
+            separator = b''
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                page_photos = load_photos(self.conn, [row['id'] for row in rows])
+                encoded = []
+                for row in rows:
+                    recipe = dict(row)
+                    recipe['photos'] = page_photos[recipe['id']]
+                    encoded.append(encoding.dumps(recipe))
+                if array:
+                    yield separator + b','.join(encoded)
+                    separator = b','
+                else:
+                    yield b'\n'.join(encoded) + b'\n'
+            if array:
+                yield b']'
+        finally:
+            # Also runs when the client disconnects and the generator is closed early
+            cursor.close()
+
+    def get(self, recipe_id):
+        """A recipe with its photos and unfinished photo jobs, or None"""
+        row = self.conn.execute(SELECT_RECIPE, (recipe_id,)).fetchone()
+        if row is None:
+            return None
+        recipe = dict(row)
+        recipe['photos'] = load_photos(self.conn, [recipe_id])[recipe_id]
+        # Photos still queued (or failed) in the background worker
+        recipe['photo_jobs'] = jobs.job_status(self.conn, recipe_id)
+        return recipe
+
+    def exists(self, recipe_id):
+        return self.conn.execute(RECIPE_EXISTS, (recipe_id,)).fetchone() is not None
+
+    def create(self, data, photos=()):
+        """Insert a recipe and queue its spooled photos in one transaction; returns (id, job_ids)"""
+        values = validate_recipe(data)
+
+        def write(conn):
+            recipe_id = conn.execute(INSERT_RECIPE, values).lastrowid
+            ingredients.index_recipe(conn, recipe_id, data.get('ingredients'))
+            return recipe_id, jobs.enqueue(conn, recipe_id, photos)
+        return self._write(write)
+
+    def update(self, recipe_id, data, photos=()):
+        """Replace a recipe's fields and append photos; returns the job ids, or None if it does not exist"""
+        values = validate_recipe(data)
+
+        def write(conn):
+            if conn.execute(RECIPE_EXISTS, (recipe_id,)).fetchone() is None:
+                return None
+            conn.execute(UPDATE_RECIPE, values + (recipe_id,))
+            ingredients.index_recipe(conn, recipe_id, data.get('ingredients'))
+            return jobs.enqueue(conn, recipe_id, photos)
+        return self._write(write)
+
+    def delete(self, recipe_id):
+        """Delete a recipe, its queued uploads and the stored photos no other recipe uses.
+
+        Returns False if it does not exist.
+        """
+        def write(conn):
+            if conn.execute(RECIPE_EXISTS, (recipe_id,)).fetchone() is None:
+                return None
+            spool_paths = jobs.cancel(conn, recipe_id)
+            photos = load_photos(conn, [recipe_id])[recipe_id]
+            # recipe_photos and photo_jobs rows cascade
+            conn.execute(DELETE_RECIPE, (recipe_id,))
+            # Content-addressed photos can be shared; only the last reference removes the files (see _remove_files)
+            photos = unreferenced(conn, list(dict.fromkeys(photos)))
+            return spool_paths, photos, {url: delete_variants(conn, os.path.basename(url)) for url in photos}
+
+        # Files are only removed once the delete has been committed
+        deleted = self._write(write)
+        if deleted is None:
+            return False
+        spool_paths, photos, variants = deleted
+
+        for path in spool_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        if photos and (self.storage is not None or self.variant_dir):
+            self._write(lambda conn: self._remove_files(conn, photos, variants))
+        return True
+
+    def _remove_files(self, conn, photos, variants):
+        """Remove the stored files of photos no recipe uses, in a write transaction.
+
+        A photo job may have attached the same content since the delete committed, so the
+        references are checked again under lock_photo(), which jobs.complete() holds too.
+        """
+        for url in sorted(photos):
+            lock_photo(conn, url)
+            if not unreferenced(conn, [url]):
+                continue
+            if self.storage is not None:
+                self.storage.delete(url)
+            if self.variant_dir:
+                filename = os.path.basename(url)
+                for variant in variants[url]:
+                    path = os.path.join(self.variant_dir, variant_filename(filename, variant['width'], variant['format']))
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def stats(self):
+        return facets.get_stats(self.conn)
+
+    def filters(self):
+        return facets.get_filters(self.conn)
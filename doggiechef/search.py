@@ -0,0 +1,162 @@
+"""Full-text recipe search over the recipes_fts FTS5 index.
+
+The index covers title, description and ingredients and is kept in sync with
+the recipes table by triggers, so writers never have to touch it.
+
+On PostgreSQL the same search runs against a GIN index over a weighted
+tsvector of those columns, and when nothing matches, titles are matched by
+trigram similarity so a misspelt query still finds something (with pg_trgm).
+
+Highlights and snippets are HTML: the recipe text in them is escaped and only
+the <mark> tags around matched terms are markup.
+"""
+import html
+import re
+
+from doggiechef.photos import load_photos
+
+MAX_RESULTS = 50
+# bm25() column weights: title, description, ingredients
+BM25_WEIGHTS = (10.0, 2.0, 5.0)
+SNIPPET_TOKENS = 12
+# ts_rank() weights for D, C (description), B (ingredients) and A (title), scaled from BM25_WEIGHTS
+TS_RANK_WEIGHTS = '{0.1, 0.2, 0.5, 1.0}'
+# Matches are delimited with private-use characters, which survive escaping, then turned into <mark> tags
+MARK_START, MARK_END = '\ue000', '\ue001'
+HEADLINE_OPTIONS = f'StartSel={MARK_START}, StopSel={MARK_END}'
+SNIPPET_OPTIONS = f'{HEADLINE_OPTIONS}, MaxFragments=1, MaxWords={SNIPPET_TOKENS}, MinWords=3, FragmentDelimiter=…'
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def rebuild_index(conn):
+    """Re-index every recipe; used when the index is first created"""
+    conn.execute("INSERT INTO recipes_fts (recipes_fts) VALUES ('rebuild')")
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Quoting each term keeps user input from being parsed as FTS5 syntax.
+    """
+    terms = _TERM_RE.findall(text or '')
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def build_tsquery(text):
+    """The PostgreSQL equivalent of build_match_query(): every word, as a prefix"""
+    terms = _TERM_RE.findall(text or '')
+    return ' & '.join(f"'{term}':*" for term in terms)
+
+
+def search_recipes(conn, text, limit=20, offset=0, country=None, protein_type=None):
+    """BM25-ranked matches with highlighted snippets; returns (results, next_offset)
+
+    Raises ValueError for an out-of-range limit or offset.
+    """
+    if not 1 <= limit <= MAX_RESULTS:
+        raise ValueError(f'limit must be between 1 and {MAX_RESULTS}')
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+    if getattr(conn, 'dialect', None) == 'postgres':
+        rows = _search_postgres(conn, text, limit, offset, country, protein_type)
+        if rows is None:
+            return [], None
+        return _results(conn, rows, limit, offset)
+    match = build_match_query(text)
+    if not match:
+        return [], None
+
+    query = f'''
+        SELECT r.id, r.title, r.country, r.protein_type, r.cooking_time, r.difficulty,
+               highlight(recipes_fts, 0, '{MARK_START}', '{MARK_END}') AS title_highlight,
+               snippet(recipes_fts, -1, '{MARK_START}', '{MARK_END}', '…', {SNIPPET_TOKENS}) AS snippet,
+               bm25(recipes_fts, {', '.join(map(str, BM25_WEIGHTS))}) AS rank
+        FROM recipes_fts
+        JOIN recipes AS r ON r.id = recipes_fts.rowid
+        WHERE recipes_fts MATCH ?
+    '''
+    params = [match]
+    if country:
+        query += ' AND r.country = ?'
+        params.append(country)
+    if protein_type:
+        query += ' AND r.protein_type = ?'
+        params.append(protein_type)
+    # One extra row tells us whether there is another page
+    query += ' ORDER BY rank, r.id LIMIT ? OFFSET ?'
+    params.extend([limit + 1, offset])
+
+    return _results(conn, conn.execute(query, params).fetchall(), limit, offset)
+
+
+def _filters(country, protein_type):
+    conditions = ''
+    params = []
+    if country:
+        conditions += ' AND country = ?'
+        params.append(country)
+    if protein_type:
+        conditions += ' AND protein_type = ?'
+        params.append(protein_type)
+    return conditions, params
+
+
+def _search_postgres(conn, text, limit, offset, country, protein_type):
+    """Rows of one page (plus one) from PostgreSQL, or None if the text has no terms"""
+    from doggiechef.postgres import SEARCH_VECTOR
+
+    tsquery = build_tsquery(text)
+    if not tsquery:
+        return None
+    conditions, filter_params = _filters(country, protein_type)
+    # Headlines re-parse the text, so they are only made for the page, not every match
+    rows = conn.execute(f'''
+        SELECT r.id, r.title, r.country, r.protein_type, r.cooking_time, r.difficulty,
+               ts_headline('simple', r.title, query, '{HEADLINE_OPTIONS}, HighlightAll=true') AS title_highlight,
+               ts_headline('simple', concat_ws(' ', r.title, r.description, r.ingredients), query,
+                           '{SNIPPET_OPTIONS}') AS snippet,
+               page.rank
+        FROM (
+            SELECT id, -ts_rank('{TS_RANK_WEIGHTS}', {SEARCH_VECTOR}, query) AS rank
+            FROM recipes, to_tsquery('simple', ?) AS query
+            WHERE {SEARCH_VECTOR} @@ query{conditions}
+            ORDER BY rank, id LIMIT ? OFFSET ?
+        ) AS page
+        JOIN recipes AS r ON r.id = page.id, to_tsquery('simple', ?) AS query
+        ORDER BY page.rank, r.id
+    ''', [tsquery, *filter_params, limit + 1, offset, tsquery]).fetchall()
+    if rows or offset or not conn.trigram:
+        return rows
+    # Nothing matched word for word: fall back to titles that look alike, via the trigram index
+    return conn.execute(f'''
+        SELECT id, title, country, protein_type, cooking_time, difficulty,
+               title AS title_highlight, left(coalesce(description, ''), 120) AS snippet,
+               -similarity(title, ?) AS rank
+        FROM recipes
+        WHERE title % ?{conditions}
+        ORDER BY rank, id LIMIT ?
+    ''', [text, text, *filter_params, limit + 1]).fetchall()
+
+
+def markup(text):
+    """HTML for a highlighted title or snippet: the text escaped, its matches wrapped in <mark>"""
+    if text is None:
+        return None
+    return html.escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def _results(conn, rows, limit, offset):
+    next_offset = offset + limit if len(rows) > limit else None
+    rows = rows[:limit]
+
+    thumbnails = load_photos(conn, [row['id'] for row in rows], first_only=True)
+    results = []
+    for row in rows:
+        result = dict(row)
+        result['title_highlight'] = markup(result['title_highlight'])
+        result['snippet'] = markup(result['snippet'])
+        photos = thumbnails[row['id']]
+        result['thumbnail'] = photos[0] if photos else None
+        results.append(result)
+    return results, next_offset
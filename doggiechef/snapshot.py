@@ -0,0 +1,259 @@
+"""Read-only database snapshots for the serverless GET functions.
+
+Each Vercel instance otherwise reads its own private /tmp database. In
+snapshot mode the primary database (the Flask backend's) is published as a
+compacted, read-only copy: VACUUM INTO a new file, ANALYZE for the query
+planner, an optimized FTS index, and a rollback journal so the file is
+complete on its own. Files are named by the data version they contain and
+never modified afterwards, and manifest.json names the current one.
+
+GET functions with DOGGIECHEF_SNAPSHOT_URL set (a directory path, or an
+http(s) URL serving one) read through db.get_read_connection(): the current
+snapshot is downloaded into /tmp once, opened with mode=ro&immutable=1, so
+SQLite takes no locks and reads no WAL, and the manifest is checked again
+every DOGGIECHEF_SNAPSHOT_TTL seconds. Any number of instances can read
+this way, each from its own copy. Writes go to the primary, and readers
+see them once the next snapshot is published.
+
+    python -m doggiechef.snapshot publish backend/recipes.db snapshots/ [--every 5]
+    python -m doggiechef.snapshot serve snapshots/ [--port 8765]
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from doggiechef import logs, metrics
+
+MANIFEST = 'manifest.json'
+# Older snapshots are kept a while for readers still on them
+KEEP_SNAPSHOTS = 3
+TTL_SECONDS = float(os.environ.get('DOGGIECHEF_SNAPSHOT_TTL', '30'))
+CACHE_DIR = os.path.join('/tmp', 'doggiechef-snapshots')
+DOWNLOAD_TIMEOUT = 20
+PRAGMAS = (
+    'PRAGMA mmap_size = 268435456',  # 256MB
+    'PRAGMA cache_size = -16000',  # 16MB
+    'PRAGMA temp_store = MEMORY',
+)
+
+_lock = threading.Lock()
+_local = threading.local()
+_current = None  # manifest of the snapshot being served, plus its local 'path'
+_checked_at = 0.0
+
+
+def _digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def publish(db_path, out_dir, force=False):
+    """Publish a snapshot of the database at `db_path` into `out_dir`.
+
+    Returns the new manifest, or None if the current snapshot already has
+    this data version.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    previous = _read_manifest_file(os.path.join(out_dir, MANIFEST))
+    source = sqlite3.connect(db_path)
+    try:
+        version = source.execute('SELECT version FROM data_version').fetchone()[0]
+        if previous and previous['version'] == version and not force:
+            return None
+        temp_path = os.path.join(out_dir, f'.{uuid.uuid4().hex}.tmp')
+        # One consistent read of the primary, written compacted and without free pages
+        source.execute('VACUUM INTO ?', (temp_path,))
+    finally:
+        source.close()
+
+    try:
+        snapshot = sqlite3.connect(temp_path)
+        # The copy can be a newer version than the one read above if a write landed in between
+        version = snapshot.execute('SELECT version FROM data_version').fetchone()[0]
+        snapshot.execute('PRAGMA journal_mode = DELETE')
+        snapshot.execute("INSERT INTO recipes_fts (recipes_fts) VALUES ('optimize')")
+        snapshot.execute('ANALYZE')
+        snapshot.commit()
+        snapshot.execute('VACUUM')
+        snapshot.close()
+
+        filename = f'recipes-{version}.db'
+        manifest = {
+            'version': version,
+            'file': filename,
+            'bytes': os.path.getsize(temp_path),
+            'sha256': _digest(temp_path),
+            'built_at': time.time(),
+        }
+        os.replace(temp_path, os.path.join(out_dir, filename))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # The manifest is replaced last, so readers only ever see a complete snapshot
+    manifest_temp = os.path.join(out_dir, f'.{uuid.uuid4().hex}.json')
+    with open(manifest_temp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_temp, os.path.join(out_dir, MANIFEST))
+    _prune(out_dir, keep=filename)
+    return manifest
+
+
+def _prune(directory, keep):
+    snapshots = sorted(
+        (name for name in os.listdir(directory) if name.startswith('recipes-') and name.endswith('.db')),
+        key=lambda name: os.path.getmtime(os.path.join(directory, name)), reverse=True)
+    for name in snapshots[KEEP_SNAPSHOTS:]:
+        if name != keep:
+            os.remove(os.path.join(directory, name))
+
+
+def _is_url(source):
+    return source.startswith(('http://', 'https://'))
+
+
+def _read_manifest_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _fetch_manifest(source):
+    if not _is_url(source):
+        manifest = _read_manifest_file(os.path.join(source, MANIFEST))
+        if manifest is None:
+            raise FileNotFoundError(f'No snapshot published in {source}')
+        return manifest
+    from urllib.request import urlopen
+    with urlopen(f"{source.rstrip('/')}/{MANIFEST}", timeout=DOWNLOAD_TIMEOUT) as response:
+        return json.load(response)
+
+
+def _download(source, manifest):
+    """Local path of a manifest's snapshot, downloading and verifying it if needed"""
+    if not _is_url(source):
+        # Published files are never modified, so they are opened in place
+        return os.path.join(source, manifest['file'])
+    path = os.path.join(CACHE_DIR, manifest['file'])
+    if os.path.exists(path):
+        return path
+    from urllib.request import urlopen
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with urlopen(f"{source.rstrip('/')}/{manifest['file']}", timeout=DOWNLOAD_TIMEOUT) as response, \
+                open(temp_path, 'wb') as f:
+            while True:
+                block = response.read(1 << 20)
+                if not block:
+                    break
+                f.write(block)
+        if _digest(temp_path) != manifest['sha256']:
+            raise ValueError(f"Snapshot {manifest['file']} does not match its manifest")
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return path
+
+
+def current(source, ttl=TTL_SECONDS):
+    """Manifest of the snapshot to read, checking `source` for a newer one at most every `ttl` seconds.
+
+    A failed check keeps serving the snapshot already loaded; only the first one raises.
+    """
+    global _current, _checked_at
+    if _current is not None and time.monotonic() - _checked_at < ttl:
+        return _current
+    with _lock:
+        if _current is not None and time.monotonic() - _checked_at < ttl:
+            return _current
+        try:
+            manifest = _fetch_manifest(source)
+            if _current is None or manifest['version'] != _current['version']:
+                manifest['path'] = _download(source, manifest)
+                previous, _current = _current, manifest
+                if previous is not None and _is_url(source) and previous['path'] != manifest['path']:
+                    # Threads still reading it keep their open file; the name goes now
+                    os.remove(previous['path'])
+        except Exception as e:
+            if _current is None:
+                raise
+            logs.warning("⚠️ Could not refresh the database snapshot", {
+                "serving_version": _current['version'], "source": source, "error": str(e),
+                "error_type": type(e).__name__})
+        _checked_at = time.monotonic()
+        return _current
+
+
+def _connect(path):
+    conn = sqlite3.connect(f'file:{path}?mode=ro&immutable=1', uri=True, cached_statements=256,
+                           factory=metrics.connection_factory())
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_connection(source):
+    """This thread's read-only connection to the current snapshot from `source`"""
+    path = current(source)['path']
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.path == path:
+        return conn
+    if conn is not None:
+        conn.close()
+    _local.conn = _connect(path)
+    _local.path = path
+    return _local.conn
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Publish or serve read-only database snapshots')
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish_parser = commands.add_parser('publish', help='snapshot the primary database into a directory')
+    publish_parser.add_argument('db')
+    publish_parser.add_argument('out_dir')
+    publish_parser.add_argument('--every', type=float, help='keep running, publishing changes every N seconds')
+    publish_parser.add_argument('--force', action='store_true', help='publish even if nothing changed')
+    serve_parser = commands.add_parser('serve', help='serve a snapshot directory over HTTP, e.g. for tests')
+    serve_parser.add_argument('out_dir')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        from functools import partial
+        from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+        handler = partial(SimpleHTTPRequestHandler, directory=args.out_dir)
+        print(f"📦 Serving snapshots from {args.out_dir} on http://localhost:{args.port}")
+        ThreadingHTTPServer(('', args.port), handler).serve_forever()
+        return
+
+    force = args.force
+    while True:
+        started = time.perf_counter()
+        manifest = publish(args.db, args.out_dir, force=force)
+        force = False
+        if manifest:
+            print(f"📦 Published {manifest['file']} ({manifest['bytes']} bytes) "
+                  f"in {time.perf_counter() - started:.2f}s", flush=True)
+        if not args.every:
+            if manifest is None:
+                print("✅ Snapshot already up to date")
+            return
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
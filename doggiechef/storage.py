@@ -0,0 +1,184 @@
+"""Where processed photos end up.
+
+Every backend takes a spooled upload on disk and returns the stored photo's
+URL; the caller removes the spooled file if the backend did not move it.
+ContentAddressedStorage is the local default: files are named by their
+SHA-256, so the same photo uploaded twice is stored once, and a file is only
+deleted once no recipe_photos row refers to it (see RecipeRepository.delete)
+and stored again if a job finds it gone when attaching it (see jobs.complete).
+MemoryStorage is a stand-in for tests and offline development.
+
+Deployments pick a backend with create_storage(), which DOGGIECHEF_STORAGE
+(local, cloudinary or memory) overrides.
+"""
+import os
+import shutil
+import time
+import uuid
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+class PhotoStorage:
+    """Interface every photo backend implements"""
+
+    def save(self, source_path, filename, timeout=None):
+        """Store a spooled file; returns a dict with the photo's url, plus filename/width/height/bytes if known"""
+        raise NotImplementedError
+
+    def delete(self, url):
+        """Remove a stored photo that no recipe refers to any more"""
+        raise NotImplementedError
+
+    def exists(self, url):
+        """Whether a stored photo is still there; remote backends are trusted to keep what they stored"""
+        return True
+
+    def local_path(self, filename):
+        """Path of a stored file on this machine, or None if the backend keeps photos elsewhere"""
+        return None
+
+
+class LocalStorage(PhotoStorage):
+    """Photos kept in a folder under their upload name and served by /api/photos/<filename>"""
+
+    def __init__(self, folder, url_prefix='/api/photos/'):
+        self.folder = folder
+        self.url_prefix = url_prefix
+        os.makedirs(folder, exist_ok=True)
+
+    def save(self, source_path, filename, timeout=None):
+        shutil.move(source_path, os.path.join(self.folder, filename))
+        return {'url': self.url_prefix + filename, 'filename': filename}
+
+    def delete(self, url):
+        if url.startswith(self.url_prefix):
+            path = self.local_path(url[len(self.url_prefix):])
+            if os.path.exists(path):
+                os.remove(path)
+
+    def exists(self, url):
+        return url.startswith(self.url_prefix) and os.path.exists(self.local_path(url[len(self.url_prefix):]))
+
+    def local_path(self, filename):
+        return os.path.join(self.folder, os.path.basename(filename))
+
+
+class ContentAddressedStorage(LocalStorage):
+    """Local photos named <sha256>.<ext>, so identical uploads share one file.
+
+    Deleting is reference counted by the caller: RecipeRepository.delete only
+    calls delete() for URLs no remaining recipe uses.
+    """
+
+    def save(self, source_path, filename, timeout=None):
+        import hashlib
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(block)
+        name = digest.hexdigest() + os.path.splitext(filename)[1].lower()
+        target = self.local_path(name)
+        # Already stored otherwise; the caller removes the spooled duplicate
+        if not os.path.exists(target):
+            # The rename is atomic, so a reader never sees a partly written photo
+            temp_path = f'{target}.{uuid.uuid4().hex}.tmp'
+            shutil.move(source_path, temp_path)
+            os.replace(temp_path, target)
+        return {'url': self.url_prefix + name, 'filename': name, 'bytes': os.path.getsize(target)}
+
+
+class CloudinaryStorage(PhotoStorage):
+    """Photos uploaded to Cloudinary, which handles its own resizing.
+
+    The SDK is imported and configured on the first upload, so functions that
+    only read recipes never pay for loading it.
+    """
+
+    _configured = False
+
+    def __init__(self, folder='recipes'):
+        self.folder = folder
+
+    @classmethod
+    def _uploader(cls):
+        import cloudinary
+        import cloudinary.uploader
+        if not cls._configured:
+            cloudinary.config(
+                cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME', 'demo'),
+                api_key=os.environ.get('CLOUDINARY_API_KEY', ''),
+                api_secret=os.environ.get('CLOUDINARY_API_SECRET', '')
+            )
+            cls._configured = True
+        return cloudinary.uploader
+
+    def save(self, source_path, filename, timeout=None):
+        """Upload a spooled file (or any file object Cloudinary accepts)"""
+        options = {'timeout': timeout} if timeout else {}
+        result = self._uploader().upload(
+            source_path,
+            folder=self.folder,
+            public_id=f'recipe_{uuid.uuid4()}',
+            **options
+        )
+        return {
+            'url': result['secure_url'],
+            'width': result.get('width'),
+            'height': result.get('height'),
+            'bytes': result.get('bytes')
+        }
+
+    def delete(self, url):
+        pass  # Cloudinary assets are managed from the Cloudinary console
+
+
+class MemoryStorage(PhotoStorage):
+    """Photos kept in a dict, for tests and offline development"""
+
+    def __init__(self, url_prefix='memory://'):
+        self.url_prefix = url_prefix
+        self.files = {}
+
+    def save(self, source_path, filename, timeout=None):
+        with open(source_path, 'rb') as f:
+            self.files[filename] = f.read()
+        return {'url': self.url_prefix + filename, 'filename': filename}
+
+    def delete(self, url):
+        self.files.pop(url[len(self.url_prefix):], None)
+
+    def exists(self, url):
+        return url[len(self.url_prefix):] in self.files
+
+
+STORAGES = {
+    'local': ContentAddressedStorage,
+    'cloudinary': CloudinaryStorage,
+    'memory': MemoryStorage,
+}
+
+
+def create_storage(default, **options):
+    """The backend named by DOGGIECHEF_STORAGE, else `default`.
+
+    `options` maps backend names to constructor arguments, e.g.
+    create_storage('local', local={'folder': UPLOAD_FOLDER}, cloudinary={'folder': 'recipes'}).
+    """
+    name = os.environ.get('DOGGIECHEF_STORAGE') or default
+    if name not in STORAGES:
+        raise ValueError(f"DOGGIECHEF_STORAGE must be one of: {', '.join(STORAGES)}")
+    return STORAGES[name](**options.get(name, {}))
+
+
+def save_with_retries(storage, source_path, filename, timeout=None, retries=2, backoff=0.5):
+    """Store a photo, retrying failed attempts with exponential backoff"""
+    for attempt in range(retries + 1):
+        if hasattr(source_path, 'seek'):
+            source_path.seek(0)
+        try:
+            return storage.save(source_path, filename, timeout=timeout)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
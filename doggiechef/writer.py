@@ -0,0 +1,133 @@
+"""Group commit: one writer thread merging concurrent writes into shared transactions.
+
+Every write otherwise commits on its own, and under load the writers of a
+process queue up for SQLite's write lock one commit at a time. A
+GroupCommitWriter takes write callables from a queue, runs everything that
+arrived within a short window (or up to max_batch of them) inside one
+BEGIN IMMEDIATE ... COMMIT, and hands each caller its result through a
+future once the commit has succeeded. Each write runs in its own savepoint,
+so one that raises is rolled back alone and its caller gets the exception.
+
+RecipeRepository uses one when given `writer=`; DOGGIECHEF_GROUP_COMMIT_MS
+turns it on for the Flask and asyncio backends (see from_env()).
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from doggiechef import db
+
+MAX_BATCH = 64
+WINDOW_SECONDS = 0.002
+
+
+class GroupCommitWriter:
+    def __init__(self, window=WINDOW_SECONDS, max_batch=MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, work):
+        """Queue work(conn) for the next group commit; the future resolves after COMMIT"""
+        future = Future()
+        self._start()
+        self._queue.put((work, future))
+        return future
+
+    def run(self, work, timeout=None):
+        """Run work(conn) in a group commit and return its result, re-raising its exception"""
+        return self.submit(work).result(timeout)
+
+    def stop(self):
+        """Commit what is queued, then stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def _collect(self, first):
+        """The first item plus whatever arrives within the window, up to max_batch; None marks a stop"""
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                # Whatever queued up during the previous commit is taken without waiting
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            batch.append(item)
+            if item is None:
+                break
+        return batch
+
+    def _loop(self):
+        conn = db.get_connection()
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            if batch[-1] is None:
+                batch.pop()
+                stopping = True
+            if batch:
+                self._commit(conn, batch)
+        db.close_connections()
+
+    def _commit(self, conn, batch):
+        results = []
+        try:
+            with db.transaction(conn):
+                for work, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute('SAVEPOINT group_write')
+                    try:
+                        results.append((future, work(conn), None))
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO group_write')
+                        results.append((future, None, e))
+                    conn.execute('RELEASE group_write')
+        except Exception as e:
+            # BEGIN or COMMIT failed: none of the batch was written
+            for _, future in batch:
+                if not future.cancelled():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.writes += len(results)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def from_env():
+    """A writer if DOGGIECHEF_GROUP_COMMIT_MS sets a window in milliseconds, else None (commit per write)"""
+    window = os.environ.get('DOGGIECHEF_GROUP_COMMIT_MS')
+    if not window:
+        return None
+    return GroupCommitWriter(window=float(window) / 1000)
@@ -3,6 +3,9 @@ import { Link } from 'react-router-dom';
 import { Search, Filter, Eye, Edit, Trash2 } from 'lucide-react';
 import axios from 'axios';
 
+// Locally stored photos can be served as resized variants; remote URLs are used as-is
+const cardPhotoUrl = (url) => (url.startsWith('/api/photos/') ? `${url}?size=480` : url);
+
 const RecipeList = () => {
   const [recipes, setRecipes] = useState([]);
   const [filters, setFilters] = useState({});
@@ -135,7 +138,7 @@ const RecipeList = () => {
             <div key={recipe.id} className="card">
               {recipe.photos && recipe.photos.length > 0 && (
                 <img 
-                  src={recipe.photos[0]} 
+                  src={cardPhotoUrl(recipe.photos[0])} 
                   alt={recipe.title}
                   className="card-image"
                 />
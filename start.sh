@@ -30,7 +30,12 @@ echo ""
 # Start backend in background
 echo "🔧 Starting backend server on http://localhost:5001"
 cd ../backend
-python3 app.py &
+if [ "$1" = "--production" ]; then
+    # Multi-process gunicorn instead of the Flask development server
+    gunicorn -c gunicorn.conf.py &
+else
+    python3 app.py &
+fi
 BACKEND_PID=$!
 
 # Wait a moment for backend to start
@@ -0,0 +1,61 @@
+"""Fixtures shared by the test suite: a fresh SQLite database for every test.
+
+    python -m pytest -q
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from doggiechef import db  # noqa: E402
+from doggiechef.storage import MemoryStorage  # noqa: E402
+
+RECIPE = {
+    'title': 'Pad Kra Pao',
+    'description': 'Holy basil stir-fry',
+    'country': 'Thailand',
+    'protein_type': 'Pork',
+    'cooking_time': '15',
+    'difficulty': 'Easy',
+    'ingredients': '300g minced pork\n4 cloves garlic\n2 cups holy basil',
+}
+
+
+def create(repository, title, **fields):
+    """Create a variation of RECIPE and return its id"""
+    recipe_id, _ = repository.create(dict(RECIPE, title=title, **fields))
+    return recipe_id
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    """This thread's connection to an empty, migrated SQLite database in a temp directory"""
+    monkeypatch.setattr(db, 'DATABASE_URL', None)
+    monkeypatch.setattr(db, '_db_path', str(tmp_path / 'recipes.db'))
+    db.init_db()
+    yield db.get_connection()
+    db.close_connections()
+
+
+@pytest.fixture
+def storage():
+    return MemoryStorage()
+
+
+@pytest.fixture
+def spool(tmp_path):
+    """Write a spooled upload and return its (source_path, filename) pair, like spool_photos()"""
+    directory = tmp_path / 'incoming'
+    directory.mkdir()
+    count = 0
+
+    def write(filename, content=b'photo bytes'):
+        nonlocal count
+        count += 1
+        path = directory / f'{count}-{filename}'
+        path.write_bytes(content)
+        return str(path), filename
+    return write
@@ -0,0 +1,48 @@
+import asyncio
+import os
+import sys
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from conftest import ROOT
+from doggiechef.recipes import RecipeRepository
+
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+import async_app  # noqa: E402
+
+RECIPE = {'title': 'Pad Kra Pao', 'country': 'Thailand', 'protein_type': 'Pork', 'cooking_time': '15'}
+
+
+def test_create_accepts_json_and_form_bodies_and_hides_server_errors(conn, monkeypatch, capsys):
+    def broken_create(self, data, photos=()):
+        raise RuntimeError('database password is hunter2')
+
+    async def scenario():
+        # One client for the whole scenario: the app's cleanup shuts down its SQLite pool
+        async with TestClient(TestServer(async_app.create_app())) as client:
+            created = await client.post('/api/recipes', json=RECIPE)
+            assert created.status == 201
+            recipe_id = (await created.json())['id']
+
+            response = await client.get(f'/api/recipes/{recipe_id}')
+            recipe = await response.json()
+            assert (recipe['title'], recipe['cooking_time']) == ('Pad Kra Pao', 15)
+
+            form = await client.post('/api/recipes', data=dict(RECIPE, title='Tom Yum'))
+            assert form.status == 201
+
+            for body in ('{"title": "Nameless"}', '{not json', '["a list"]'):
+                response = await client.post('/api/recipes', data=body, headers={'Content-Type': 'application/json'})
+                assert response.status == 400
+                assert (await response.json())['error'].startswith('Required fields missing')
+
+            response = await client.get('/api/recipes')
+            assert [recipe['title'] for recipe in await response.json()] == ['Tom Yum', 'Pad Kra Pao']
+
+            # Unexpected errors are logged, not sent to the client
+            monkeypatch.setattr(RecipeRepository, 'create', broken_create)
+            response = await client.post('/api/recipes', json=RECIPE)
+            assert response.status == 500
+            assert await response.json() == {'error': 'Internal server error'}
+    asyncio.run(scenario())
+    assert 'hunter2' in capsys.readouterr().err
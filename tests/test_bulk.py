@@ -0,0 +1,49 @@
+import io
+import sqlite3
+
+from doggiechef import jobs
+from doggiechef.bulk import BulkImporter, directory_photos, read_records
+from doggiechef.photos import IN_BATCH_SIZE
+
+CSV = 'title,country,protein_type,ingredients,photos\n'
+
+
+def importer(conn, tmp_path):
+    photos = tmp_path / 'photos'
+    photos.mkdir(exist_ok=True)
+    (photos / 'curry.jpg').write_bytes(b'curry')
+    return BulkImporter(conn, photo_source=directory_photos(photos), spool_dir=str(tmp_path / 'incoming'),
+                        batch_size=100)
+
+
+def test_import_reports_failures_and_resumes(conn, tmp_path):
+    body = CSV + 'Pad Kra Pao,Thailand,Pork,pork|basil,\nNo country,,Pork,,\nMassaman,Thailand,Beef,,curry.jpg\n'
+    bulk = importer(conn, tmp_path)
+
+    report = bulk.run(read_records(io.BytesIO(body.encode()), 'csv'), 'import-1')
+    assert (report['processed'], report['created']) == (3, 2)
+    assert [failure['line'] for failure in report['failed']] == [3]
+    assert len(report['photo_jobs']) == 1
+
+    again = bulk.run(read_records(io.BytesIO(body.encode()), 'csv'), 'import-1')
+    assert (again['resumed_after'], again['processed'], again['created']) == (3, 0, 0)
+    assert conn.execute('SELECT COUNT(*) FROM recipes').fetchone()[0] == 2
+
+
+def test_photo_jobs_of_a_large_import_are_claimed_in_batches(conn, tmp_path, storage):
+    # More jobs than one IN (...) may bind; the default limit is too high to reach in a test
+    count = IN_BATCH_SIZE * 2 + 50
+    conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, IN_BATCH_SIZE + 10)
+    body = CSV + ''.join(f'Curry {n},Thailand,Beef,,curry.jpg\n' for n in range(count))
+
+    report = importer(conn, tmp_path).run(read_records(io.BytesIO(body.encode()), 'csv'), 'import-2')
+    assert len(report['photo_jobs']) == count
+
+    worker = jobs.PhotoWorker(storage, max_workers=4)
+    try:
+        results = worker.run_jobs(report['photo_jobs'], timeout=30)
+    finally:
+        worker.stop()
+    assert len(results) == count
+    assert {result['status'] for result in results} == {'done'}
+    assert conn.execute('SELECT COUNT(*) FROM recipe_photos').fetchone()[0] == count
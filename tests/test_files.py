@@ -0,0 +1,20 @@
+from doggiechef import files
+
+
+def test_photos_are_sent_as_stored_with_ranges_and_etags(tmp_path):
+    (tmp_path / 'curry.jpg').write_bytes(b'0123456789')
+    (tmp_path / 'curry.jpg.gz').write_bytes(b'not served')
+    index = files.FileIndex(str(tmp_path))
+    info = index.lookup('curry.jpg')
+
+    reply = files.prepare(index, info, {'Accept-Encoding': 'gzip, br'})
+    assert (reply.status, reply.path, reply.length) == (200, info.path, 10)
+    assert 'Content-Encoding' not in reply.headers and 'Vary' not in reply.headers
+    assert reply.headers['Content-Type'] == 'image/jpeg'
+
+    assert files.prepare(index, info, {'If-None-Match': info.etag}).status == 304
+    reply = files.prepare(index, info, {'Range': 'bytes=-4'})
+    assert (reply.status, reply.offset, reply.length) == (206, 6, 4)
+    assert reply.headers['Content-Range'] == 'bytes 6-9/10'
+    assert files.prepare(index, info, {'Range': 'bytes=10-'}).status == 416
+    assert index.lookup('../curry.jpg') is None and index.lookup('.hidden') is None
@@ -0,0 +1,41 @@
+import pytest
+
+from doggiechef import ingredients
+from doggiechef.recipes import RecipeRepository
+
+RECIPE = {'country': 'Thailand', 'protein_type': 'Pork'}
+
+
+def names(text):
+    return [item['name'] for item in ingredients.parse_ingredients(text)]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2 large eggs\n1 onion', ['egg', 'onion']),
+    ('1 cup chopped onions', ['onion']),
+    ('3 cloves garlic, minced', ['garlic']),
+    ('1 onion, finely chopped; 2 tbsp soy sauce', ['onion', 'soy sauce']),
+    ('eggs, onions, garlic', ['egg', 'onion', 'garlic']),
+    ('300g minced pork\n2 cups fresh holy basil\n1 tsp ground cumin', ['pork', 'holy basil', 'cumin']),
+])
+def test_names_keep_the_ingredient_and_drop_size_and_preparation(text, expected):
+    assert names(text) == expected
+
+
+def test_quantity_and_unit_come_before_the_descriptors():
+    (garlic,) = ingredients.parse_ingredients('3 cloves garlic, minced')
+    assert (garlic['quantity'], garlic['unit'], garlic['raw']) == (3.0, 'clove', '3 cloves garlic, minced')
+
+
+def test_pantry_matches_ingredients_written_with_descriptors(conn):
+    repository = RecipeRepository(conn)
+    omelette, _ = repository.create(dict(RECIPE, title='Kai Jeow', ingredients='2 large eggs\n1 onion'))
+    stir_fry, _ = repository.create(dict(RECIPE, title='Pad Kra Pao', ingredients='3 cloves garlic, minced'))
+
+    pantry = ingredients.parse_pantry('Eggs, chopped onion')
+    assert pantry == ['egg', 'onion']
+    results = ingredients.pantry_matches(conn, pantry)
+    assert [(result['id'], result['matched_ingredients']) for result in results] == [(omelette, ['egg', 'onion'])]
+
+    (result,) = ingredients.pantry_matches(conn, ['garlic', 'minced'])
+    assert (result['id'], result['matched_ingredients'], result['missing_count']) == (stir_fry, ['garlic'], 0)
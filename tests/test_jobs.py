@@ -0,0 +1,39 @@
+import os
+import time
+
+from doggiechef import jobs
+from doggiechef.recipes import RecipeRepository
+from doggiechef.storage import MemoryStorage
+
+RECIPE = {'title': 'Massaman', 'country': 'Thailand', 'protein_type': 'Beef'}
+
+
+class BrokenStorage(MemoryStorage):
+    def save(self, source_path, filename, timeout=None):
+        raise OSError('storage is down')
+
+
+def test_a_failed_job_waits_out_its_retry_delay_without_holding_up_the_worker(conn, spool):
+    repository = RecipeRepository(conn)
+    recipe_id, job_ids = repository.create(RECIPE, [spool('curry.jpg')])
+    worker = jobs.PhotoWorker(BrokenStorage(), retries=0)
+    try:
+        (result,) = worker.run_jobs(job_ids, timeout=10)
+        assert (result['status'], result['error']) == ('retrying', 'storage is down')
+
+        started = time.monotonic()
+        assert worker.wait_idle(timeout=4)
+        assert time.monotonic() - started < 1
+    finally:
+        worker.stop()
+
+    assert not jobs.has_pending(conn)
+    assert jobs.claim(conn) is None
+    assert [job['status'] for job in repository.get(recipe_id)['photo_jobs']] == ['retrying']
+    # The spooled upload stays for the next attempt
+    assert os.path.exists(conn.execute('SELECT source_path FROM photo_jobs').fetchone()[0])
+
+    conn.execute("UPDATE photo_jobs SET not_before = '2000-01-01 00:00:00'")
+    conn.commit()
+    assert jobs.has_pending(conn)
+    assert [job['status'] for job in repository.get(recipe_id)['photo_jobs']] == ['pending']
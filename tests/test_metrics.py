@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+from doggiechef import metrics
+
+WORKER = '''
+from doggiechef import metrics
+metrics.request('GET /api/recipes').finish(200, 0, 100)
+metrics.request('GET /api/recipes').finish(200, 0, 50)
+'''
+
+
+def sample(text, series):
+    return [line.rsplit(' ', 1)[1] for line in text.splitlines() if line.startswith(series + ' ')]
+
+
+def test_a_scrape_adds_up_every_worker_including_exited_ones(tmp_path, monkeypatch):
+    directory = str(tmp_path / 'metrics')
+    for _ in range(2):
+        # Each worker writes its file when it exits
+        subprocess.run([sys.executable, '-c', WORKER], cwd=ROOT, check=True,
+                       env=dict(os.environ, DOGGIECHEF_METRICS_DIR=directory))
+    assert len(os.listdir(directory)) == 2
+
+    monkeypatch.setattr(metrics, 'MULTIPROCESS_DIR', directory)
+    before = metrics.render()
+    metrics.request('GET /api/recipes').finish(200, 0, 25)
+    after = metrics.render()
+
+    requests = 'doggiechef_requests_total{route="GET /api/recipes",status="200"}'
+    response_bytes = 'doggiechef_response_bytes_total{route="GET /api/recipes"}'
+    count = 'doggiechef_request_duration_seconds_count{route="GET /api/recipes"}'
+    own = metrics.REQUESTS.values.get((('route', 'GET /api/recipes'), ('status', 200)), 0)
+    assert sample(after, requests) == [str(4 + own)]
+    assert int(sample(after, requests)[0]) == int(sample(before, requests)[0]) + 1
+    assert int(sample(after, response_bytes)[0]) == int(sample(before, response_bytes)[0]) + 25
+    assert sample(after, count) == sample(after, requests)
+    assert 'worker=' not in after
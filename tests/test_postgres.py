@@ -0,0 +1,275 @@
+"""The PostgreSQL backend, against a throwaway server or the one named by DOGGIECHEF_DATABASE_URL.
+
+    python -m pytest -q tests/test_postgres.py
+
+Without DOGGIECHEF_DATABASE_URL a server is created with initdb in a temp
+directory and started with pg_ctl for the session; the tests that need one
+skip when those binaries are not on PATH, under `pg_config --bindir` or in
+/usr/lib/postgresql/<version>/bin. A given database has its recipe tables
+emptied by every test, so point the variable at a scratch database.
+"""
+import glob
+import io
+import json
+import os
+import pwd
+import shutil
+import socket
+import subprocess
+import tempfile
+
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+from conftest import RECIPE, create  # noqa: E402
+from doggiechef import cache, db, facets, jobs, postgres, search  # noqa: E402
+from doggiechef.bulk import BulkImporter, directory_photos, read_records  # noqa: E402
+from doggiechef.recipes import RecipeRepository, decode_cursor  # noqa: E402
+
+TABLES = 'recipes, recipe_photos, photo_jobs, photo_variants, ingredients, recipe_ingredients, bulk_imports'
+
+
+def postgres_bindir():
+    """Directory holding initdb and pg_ctl, or None"""
+    initdb = shutil.which('initdb')
+    if initdb:
+        return os.path.dirname(initdb)
+    try:
+        bindir = subprocess.run(['pg_config', '--bindir'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        bindir = None
+    candidates = [bindir] if bindir else []
+    candidates += sorted(glob.glob('/usr/lib/postgresql/*/bin'), reverse=True) + ['/usr/local/pgsql/bin']
+    return next((path for path in candidates if os.path.exists(os.path.join(path, 'initdb'))), None)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope='session')
+def postgres_url():
+    """URL of a database for the session: DOGGIECHEF_DATABASE_URL, or a local server started for it"""
+    if os.environ.get('DOGGIECHEF_DATABASE_URL'):
+        yield os.environ['DOGGIECHEF_DATABASE_URL']
+        return
+    bindir = postgres_bindir()
+    if bindir is None:
+        pytest.skip('DOGGIECHEF_DATABASE_URL is not set and initdb/pg_ctl were not found')
+
+    # initdb refuses to run as root, so the server then belongs to nobody
+    user = 'nobody' if os.geteuid() == 0 else None
+    directory = tempfile.mkdtemp(prefix='doggiechef-pg-')
+    if user:
+        shutil.chown(directory, user)
+    data, port = os.path.join(directory, 'data'), free_port()
+
+    def run(*args):
+        subprocess.run([os.path.join(bindir, args[0]), *args[1:]], check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, **as_user)
+
+    as_user = {'user': user, 'group': pwd.getpwnam(user).pw_gid, 'extra_groups': []} if user else {}
+
+    try:
+        run('initdb', '-D', data, '-U', 'postgres', '--auth=trust', '--no-sync')
+        run('pg_ctl', '-D', data, '-w', '-l', os.path.join(directory, 'server.log'),
+            '-o', f"-p {port} -k {directory} -c listen_addresses=127.0.0.1 -c fsync=off", 'start')
+        try:
+            admin = psycopg2.connect(host='127.0.0.1', port=port, user='postgres', dbname='postgres')
+            admin.autocommit = True
+            admin.cursor().execute('CREATE DATABASE doggiechef_test')
+            admin.close()
+            yield f'postgresql://postgres@127.0.0.1:{port}/doggiechef_test'
+        finally:
+            run('pg_ctl', '-D', data, '-m', 'immediate', 'stop')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def pg(postgres_url, monkeypatch):
+    """This thread's pooled connection, with every recipe table emptied"""
+    monkeypatch.setattr(db, 'DATABASE_URL', postgres_url)
+    db.init_db()
+    conn = db.get_connection()
+    conn.execute(f'TRUNCATE {TABLES} RESTART IDENTITY CASCADE')
+    yield conn
+    db.close_connections()
+
+
+def test_placeholders_skip_string_literals():
+    sql = "SELECT * FROM recipes WHERE title = ? AND description != '?' AND country LIKE 'T%' LIMIT ?"
+    assert postgres._placeholders(sql, 'numeric') == (
+        "SELECT * FROM recipes WHERE title = $1 AND description != '?' AND country LIKE 'T%' LIMIT $2", 2)
+    assert postgres._placeholders(sql, 'pyformat') == (
+        "SELECT * FROM recipes WHERE title = %s AND description != '?' AND country LIKE 'T%%' LIMIT %s", 2)
+    # Without parameters psycopg2 does not interpolate, so % stays as it is
+    assert postgres._placeholders("SELECT 'T%'", 'pyformat') == ("SELECT 'T%'", 0)
+
+
+def test_the_first_write_after_schema_creation_changes_the_data_version(pg):
+    # A sequence just created, as on a new database
+    pg.execute('ALTER SEQUENCE data_version_seq RESTART')
+    repository = RecipeRepository(pg)
+    before = cache.data_version(pg)
+    create(repository, 'Tom Yum')
+    after_first = cache.data_version(pg)
+    assert after_first != before
+    create(repository, 'Massaman')
+    assert cache.data_version(pg) not in (before, after_first)
+
+
+def test_reads_do_not_change_the_data_version(pg):
+    repository = RecipeRepository(pg)
+    recipe_id = create(repository, 'Tom Yum')
+    version = cache.data_version(pg)
+    repository.get(recipe_id)
+    repository.list(limit=10)
+    assert cache.data_version(pg) == version
+
+
+def test_list_pages_follow_the_cursor(pg):
+    repository = RecipeRepository(pg)
+    ids = [create(repository, f'Recipe {n}') for n in range(5)]
+
+    seen = []
+    after = None
+    while True:
+        page, cursor = repository.list(limit=2, after=after)
+        body, json_cursor = repository.list_json(limit=2, after=after)
+        assert json.loads(body) == page and json_cursor == cursor
+        seen.extend(recipe['id'] for recipe in page)
+        if cursor is None:
+            break
+        after = decode_cursor(cursor)
+    assert seen == ids[::-1]
+    # Timestamps read back as the same text SQLite stores
+    assert len(page[0]['created_at']) == len('2024-05-01 12:30:00')
+
+
+def test_statements_are_prepared_once_and_evicted_past_the_cache_size(pg, monkeypatch):
+    def prepared_on_server():
+        cursor = pg._raw_execute("SELECT name FROM pg_prepared_statements WHERE name LIKE 'doggiechef_%'")
+        return {row[0] for row in cursor.fetchall()}
+
+    query = 'SELECT id FROM recipes WHERE country = ?'
+    pg.execute(query, ('Thailand',))
+    name, count = pg._prepared[query]
+    pg.execute(query, ('Japan',))
+    assert pg._prepared[query] == (name, count) and count == 1
+    assert name in prepared_on_server()
+
+    monkeypatch.setattr(postgres, 'STATEMENT_CACHE_SIZE', 2)
+    for limit in (1, 2, 3):
+        pg.execute(f'SELECT id FROM recipes LIMIT {limit}')
+    assert len(pg._prepared) == 2
+    assert prepared_on_server() == {name for name, _ in pg._prepared.values()}
+
+
+def test_export_reads_from_a_server_side_cursor(pg):
+    def open_cursors():
+        cursor = pg._raw_execute("SELECT count(*) FROM pg_cursors WHERE name LIKE 'doggiechef_stream_%'")
+        return cursor.fetchone()[0]
+
+    repository = RecipeRepository(pg)
+    ids = [create(repository, f'Recipe {n}') for n in range(5)]
+    chunks = repository.export('ndjson', batch_size=2)
+    first = next(chunks)
+    assert open_cursors() == 1
+    lines = (first + b''.join(chunks)).splitlines()
+    assert [json.loads(line)['id'] for line in lines] == ids
+    assert open_cursors() == 0
+
+
+def test_bulk_import_copies_rows_and_resumes(pg, tmp_path):
+    (tmp_path / 'photos').mkdir()
+    (tmp_path / 'photos' / 'curry.jpg').write_bytes(b'curry')
+    body = ('title,country,protein_type,ingredients,photos\n'
+            + ''.join(f'Curry {n},Thailand,Beef,beef|coconut milk,\n' for n in range(250))
+            + 'No country,,Beef,,\nMassaman,Thailand,Beef,beef,curry.jpg\n')
+    create(RecipeRepository(pg), 'Written before the import')
+    importer = BulkImporter(pg, photo_source=directory_photos(tmp_path / 'photos'),
+                            spool_dir=str(tmp_path / 'incoming'), batch_size=100)
+
+    report = importer.run(read_records(io.BytesIO(body.encode()), 'csv'), 'pg-import')
+    assert (report['processed'], report['created'], len(report['failed'])) == (252, 251, 1)
+    assert len(report['photo_jobs']) == 1
+    rows = pg.execute("SELECT id, title FROM recipes WHERE title LIKE 'Curry %' ORDER BY id").fetchall()
+    assert [row['title'] for row in rows] == [f'Curry {n}' for n in range(250)]
+    assert pg.execute('SELECT COUNT(DISTINCT recipe_id) FROM recipe_ingredients').fetchone()[0] == 252
+    # Ids reserved for COPY come from the same sequence as ordinary inserts
+    assert create(RecipeRepository(pg), 'Written after the import') == 253
+
+    again = importer.run(read_records(io.BytesIO(body.encode()), 'csv'), 'pg-import')
+    assert (again['resumed_after'], again['created']) == (252, 0)
+
+
+def test_claim_skips_jobs_locked_by_another_worker(pg, spool, postgres_url):
+    recipe_id, (first, second) = RecipeRepository(pg).create(RECIPE, [spool('a.jpg'), spool('b.jpg')])
+    pool = postgres.get_pool(postgres_url)
+    other = pool.get()
+    try:
+        other.execute('BEGIN')
+        other.execute('SELECT id FROM photo_jobs WHERE id = ? FOR UPDATE', (first,))
+        pg.execute("SET lock_timeout = '2s'")
+        assert jobs.claim(pg)['id'] == second
+        other.rollback()
+        assert jobs.claim(pg)['id'] == first
+        assert jobs.claim(pg) is None
+    finally:
+        pg.execute('RESET lock_timeout')
+        pool.put(other)
+
+
+def test_photo_jobs_store_photos(pg, storage, spool):
+    repository = RecipeRepository(pg, storage=storage)
+    recipe_id, job_ids = repository.create(RECIPE, [spool('basil.jpg')])
+    worker = jobs.PhotoWorker(storage)
+    try:
+        assert [result['status'] for result in worker.run_jobs(job_ids, timeout=10)] == ['done']
+    finally:
+        worker.stop()
+    assert repository.get(recipe_id)['photos'] == ['memory://basil.jpg']
+    assert repository.delete(recipe_id) and storage.files == {}
+
+
+def test_search_ranks_title_matches_first(pg):
+    repository = RecipeRepository(pg)
+    in_description = create(repository, 'Gaeng Som', description='Sour curry, like tom yum')
+    in_title = create(repository, 'Tom Yum <b>Goong</b>', protein_type='Shrimp')
+    create(repository, 'Massaman Curry', protein_type='Beef')
+
+    results, next_offset = search.search_recipes(pg, 'tom yum')
+    assert [result['id'] for result in results] == [in_title, in_description]
+    assert results[0]['title_highlight'] == '<mark>Tom</mark> <mark>Yum</mark> &lt;b&gt;Goong&lt;/b&gt;'
+    assert 'Sour curry, like <mark>tom</mark> <mark>yum</mark>' in results[1]['snippet']
+    assert next_offset is None
+    results, _ = search.search_recipes(pg, 'tom yum', protein_type='Shrimp')
+    assert [result['id'] for result in results] == [in_title]
+    assert search.search_recipes(pg, 'lasagne') == ([], None)
+
+
+def test_search_matches_misspelled_titles_with_pg_trgm(pg):
+    if not pg.trigram:
+        pytest.skip('pg_trgm is not available on this server')
+    recipe_id = create(RecipeRepository(pg), 'Massaman Curry', protein_type='Beef')
+    results, _ = search.search_recipes(pg, 'massamen')
+    assert [result['id'] for result in results] == [recipe_id]
+
+
+def test_stats_and_filters_come_from_the_facets_view(pg):
+    repository = RecipeRepository(pg)
+    create(repository, 'Tom Yum', protein_type='Shrimp', cooking_time='45')
+    create(repository, 'Pad Kra Pao')
+    massaman = create(repository, 'Massaman', country='Thailand', protein_type='Beef', cooking_time='90')
+    repository.delete(massaman)
+
+    stats = facets.get_stats(pg)
+    assert stats['total_recipes'] == 2
+    assert sorted((row['protein_type'], row['count']) for row in stats['recipes_by_protein']) == [
+        ('Pork', 1), ('Shrimp', 1)]
+    assert facets.get_filters(pg)['protein_types'] == ['Pork', 'Shrimp']
+    assert facets.check(pg) == {}
@@ -0,0 +1,181 @@
+import importlib.util
+import json
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from conftest import RECIPE, ROOT, create
+from doggiechef import jobs
+from doggiechef.recipes import RecipeRepository, decode_cursor, parse_list_params
+
+# The Flask backend, for the 400 responses built from parse_list_params' errors
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+import app as backend  # noqa: E402
+
+
+def serverless_get(name, path):
+    """Status and JSON body of a GET to the Vercel function api/<name>.py, served on a local port"""
+    spec = importlib.util.spec_from_file_location(f'api_{name}', os.path.join(ROOT, 'api', f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), module.handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.server_port}{path}') as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def process_photos(storage, job_ids):
+    worker = jobs.PhotoWorker(storage)
+    try:
+        return worker.run_jobs(job_ids, timeout=10)
+    finally:
+        worker.stop()
+
+
+def test_list_pages_follow_the_cursor(conn):
+    repository = RecipeRepository(conn)
+    ids = [create(repository, f'Recipe {n}') for n in range(5)]
+
+    seen = []
+    after = None
+    while True:
+        page, cursor = repository.list(limit=2, after=after)
+        assert len(page) <= 2
+        seen.extend(recipe['id'] for recipe in page)
+        if cursor is None:
+            break
+        after = decode_cursor(cursor)
+    # Newest first; every recipe exactly once
+    assert seen == ids[::-1]
+
+
+def test_list_json_matches_list(conn):
+    repository = RecipeRepository(conn)
+    create(repository, 'Tom Yum', protein_type='Shrimp')
+    create(repository, 'Massaman', protein_type='Beef')
+
+    for params in ({}, {'limit': 1}, {'protein_type': 'Beef'}, {'fields': ['id', 'title', 'thumbnail']}):
+        recipes, cursor = repository.list(**params)
+        body, json_cursor = repository.list_json(**params)
+        assert json.loads(body) == recipes
+        assert json_cursor == cursor
+
+
+def test_list_filters_and_projects_fields(conn):
+    repository = RecipeRepository(conn)
+    create(repository, 'Tom Yum', protein_type='Shrimp')
+    beef_id = create(repository, 'Massaman', protein_type='Beef')
+
+    recipes, cursor = repository.list(protein_type='Beef', fields=parse_list_params({'fields': 'title'})['fields'])
+    assert recipes == [{'id': beef_id, 'title': 'Massaman'}]
+    assert cursor is None
+
+
+@pytest.mark.parametrize('args, message', [
+    ({'limit': 'abc'}, 'limit must be an integer'),
+    ({'limit': '0'}, 'limit must be between 1 and 100'),
+    ({'limit': '101'}, 'limit must be between 1 and 100'),
+    ({'cursor': 'not-a-cursor'}, 'Invalid cursor'),
+    ({'fields': 'title,secret'}, 'Unknown fields: secret'),
+])
+def test_bad_list_params_are_400s(conn, args, message):
+    with pytest.raises(ValueError, match=message):
+        parse_list_params(args)
+    response = backend.app.test_client().get('/api/recipes', query_string=args)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': message}
+
+
+@pytest.mark.parametrize('name, path, message', [
+    ('search', '/api/search?q=curry&limit=abc', 'limit must be an integer'),
+    ('search', '/api/search?q=curry&offset=1.5', 'offset must be an integer'),
+    ('pantry', '/api/pantry?ingredients=egg&min_matches=some', 'min_matches must be an integer'),
+])
+def test_non_integer_search_and_pantry_params_are_400s_in_both_backends(conn, name, path, message):
+    response = backend.app.test_client().get(path)
+    assert (response.status_code, response.get_json()) == (400, {'error': message})
+    assert serverless_get(name, path) == (400, {'error': message})
+
+
+def test_write_errors_are_logged_and_answered_with_a_generic_500(conn, monkeypatch, capsys):
+    recipe_id = create(RecipeRepository(conn), 'Tom Yum')
+
+    def fail(self, *args, **kwargs):
+        raise RuntimeError('database password is hunter2')
+    monkeypatch.setattr(RecipeRepository, 'create', fail)
+    monkeypatch.setattr(RecipeRepository, 'update', fail)
+    client = backend.app.test_client()
+    for response in (client.post('/api/recipes', json=RECIPE), client.put(f'/api/recipes/{recipe_id}', json=RECIPE)):
+        assert (response.status_code, response.get_json()) == (500, {'error': 'Internal server error'})
+    assert capsys.readouterr().err.count('hunter2') == 2
+
+
+def test_create_validates_required_fields(conn):
+    repository = RecipeRepository(conn)
+    with pytest.raises(ValueError, match='Required fields missing: country, protein_type'):
+        repository.create({'title': 'Nameless'})
+    with pytest.raises(ValueError, match='cooking_time must be a whole number'):
+        repository.create(dict(RECIPE, cooking_time='soon'))
+    assert repository.list() == ([], None)
+
+
+def test_create_queues_photos_and_stores_their_rows(conn, storage, spool):
+    repository = RecipeRepository(conn, storage=storage)
+    recipe_id, job_ids = repository.create(RECIPE, [spool('basil.jpg'), spool('wok.jpg')])
+    assert len(job_ids) == 2
+    assert [job['status'] for job in repository.get(recipe_id)['photo_jobs']] == ['pending', 'pending']
+
+    results = process_photos(storage, job_ids)
+    assert [result['status'] for result in results] == ['done', 'done']
+
+    recipe = repository.get(recipe_id)
+    assert recipe['photos'] == ['memory://basil.jpg', 'memory://wok.jpg']
+    assert recipe['photo_jobs'] == []
+    page, _ = repository.list(fields=['id', 'thumbnail'])
+    assert page == [{'id': recipe_id, 'thumbnail': 'memory://basil.jpg'}]
+
+
+def test_update_replaces_fields_and_appends_photos(conn, storage, spool):
+    repository = RecipeRepository(conn, storage=storage)
+    recipe_id, job_ids = repository.create(RECIPE, [spool('basil.jpg')])
+    process_photos(storage, job_ids)
+
+    job_ids = repository.update(recipe_id, dict(RECIPE, title='Pad Kra Pao Gai', protein_type='Chicken'),
+                                [spool('chicken.jpg')])
+    process_photos(storage, job_ids)
+
+    recipe = repository.get(recipe_id)
+    assert (recipe['title'], recipe['protein_type']) == ('Pad Kra Pao Gai', 'Chicken')
+    assert recipe['photos'] == ['memory://basil.jpg', 'memory://chicken.jpg']
+    rows = conn.execute('SELECT position FROM recipe_photos WHERE recipe_id = ? ORDER BY position',
+                        (recipe_id,)).fetchall()
+    assert [row['position'] for row in rows] == [0, 1]
+    assert repository.update(recipe_id + 1, RECIPE) is None
+
+
+def test_delete_removes_photo_rows_files_and_queued_uploads(conn, storage, spool):
+    repository = RecipeRepository(conn, storage=storage)
+    recipe_id, job_ids = repository.create(RECIPE, [spool('basil.jpg')])
+    process_photos(storage, job_ids)
+    # A second upload still queued when the recipe is deleted
+    queued_path, filename = spool('wok.jpg')
+    repository.update(recipe_id, RECIPE, [(queued_path, filename)])
+
+    assert repository.delete(recipe_id) is True
+    assert repository.get(recipe_id) is None
+    assert storage.files == {}
+    assert not os.path.exists(queued_path)
+    for table in ('recipe_photos', 'photo_jobs'):
+        assert conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] == 0
+    assert repository.delete(recipe_id) is False
@@ -0,0 +1,18 @@
+from doggiechef import search
+from doggiechef.recipes import RecipeRepository
+
+RECIPE = {'country': 'Thailand', 'protein_type': 'Pork'}
+
+
+def test_highlights_escape_recipe_text_around_the_marks(conn):
+    repository = RecipeRepository(conn)
+    recipe_id, _ = repository.create(dict(RECIPE, title='<img src=x onerror=alert(1)> Tom Yum',
+                                          description='Hot & sour <script>alert(1)</script> tom yum soup'))
+
+    (result,), next_offset = search.search_recipes(conn, 'tom')
+    assert result['id'] == recipe_id and next_offset is None
+    assert result['title_highlight'] == '&lt;img src=x onerror=alert(1)&gt; <mark>Tom</mark> Yum'
+    assert result['snippet'] == result['title_highlight']
+
+    (result,), _ = search.search_recipes(conn, 'sour')
+    assert result['snippet'] == 'Hot &amp; <mark>sour</mark> &lt;script&gt;alert(1)&lt;/script&gt; tom yum soup'
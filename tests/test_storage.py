@@ -0,0 +1,82 @@
+import os
+
+from doggiechef import jobs
+from doggiechef.recipes import RecipeRepository
+from doggiechef.storage import ContentAddressedStorage
+
+RECIPE = {'title': 'Massaman', 'country': 'Thailand', 'protein_type': 'Beef'}
+
+
+def stored_files(storage):
+    return sorted(name for name in os.listdir(storage.folder) if not name.startswith('.'))
+
+
+def run(worker, job_ids):
+    return [result['status'] for result in worker.run_jobs(job_ids, timeout=10)]
+
+
+def test_identical_uploads_share_one_file_until_the_last_recipe_goes(conn, tmp_path, spool):
+    storage = ContentAddressedStorage(str(tmp_path / 'photos'))
+    repository = RecipeRepository(conn, storage=storage)
+    worker = jobs.PhotoWorker(storage)
+    try:
+        first, job_ids = repository.create(RECIPE, [spool('curry.jpg', b'same bytes')])
+        assert run(worker, job_ids) == ['done']
+        second, job_ids = repository.create(RECIPE, [spool('CURRY.JPG', b'same bytes')])
+        assert run(worker, job_ids) == ['done']
+    finally:
+        worker.stop()
+
+    url = repository.get(first)['photos'][0]
+    assert repository.get(second)['photos'] == [url]
+    assert url.endswith('.jpg') and len(stored_files(storage)) == 1
+
+    repository.delete(first)
+    assert storage.exists(url)
+    repository.delete(second)
+    assert not storage.exists(url)
+    assert stored_files(storage) == []
+
+
+def test_a_job_restores_a_shared_file_deleted_after_it_was_saved(conn, tmp_path, spool):
+    storage = ContentAddressedStorage(str(tmp_path / 'photos'))
+    repository = RecipeRepository(conn, storage=storage)
+    worker = jobs.PhotoWorker(storage)
+    try:
+        first, job_ids = repository.create(RECIPE, [spool('curry.jpg', b'same bytes')])
+        run(worker, job_ids)
+    finally:
+        worker.stop()
+    second, (job_id,) = repository.create(RECIPE, [spool('curry.jpg', b'same bytes')])
+
+    # The second upload is saved while the first recipe still holds the file, so nothing is written...
+    job = jobs.claim_ids(conn, [job_id])[0]
+    photo = worker.process(job)
+    assert os.path.exists(job['source_path'])
+    # ...then the first recipe goes, and with it the last reference the database knows about
+    repository.delete(first)
+    assert not storage.exists(photo['url'])
+
+    assert jobs.complete(conn, job, photo, storage)
+    assert repository.get(second)['photos'] == [photo['url']]
+    assert storage.exists(photo['url'])
+
+
+def test_a_cancelled_job_keeps_a_file_another_recipe_uses(conn, tmp_path, spool):
+    storage = ContentAddressedStorage(str(tmp_path / 'photos'))
+    repository = RecipeRepository(conn, storage=storage)
+    worker = jobs.PhotoWorker(storage)
+    try:
+        kept, job_ids = repository.create(RECIPE, [spool('curry.jpg', b'same bytes')])
+        run(worker, job_ids)
+    finally:
+        worker.stop()
+    deleted, (job_id,) = repository.create(RECIPE, [spool('curry.jpg', b'same bytes')])
+
+    job = jobs.claim_ids(conn, [job_id])[0]
+    photo = worker.process(job)
+    repository.delete(deleted)
+
+    assert not jobs.complete(conn, job, photo, storage)
+    assert storage.exists(photo['url'])
+    assert repository.get(kept)['photos'] == [photo['url']]